@@ -1,18 +1,23 @@
 import os
+import sys
 from langchain.tools import tool
-from pymongo import MongoClient
-from dotenv import load_dotenv
 
-load_dotenv()
+# The sales_agent modules import each other by flat name (see backend/main.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "sales_agent"))
 
-MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017/")
+import stock
+import reservations
+from database import inventory_col
+from product_index import find_product
 
-try:
-    client = MongoClient(MONGO_URL)
-    db = client["aura_db"]
-    products_collection = db["products"]
-except Exception as e:
-    print(f"❌ Inventory Agent Database Error: {e}")
+
+def _available(product_id):
+    """Units on sale: the inventory total plus any hot-SKU sub-counters."""
+    inventory = inventory_col.find_one({"productId": product_id}, stock.TOTALS_PROJECTION)
+    total = stock.total_qty(inventory)
+    if inventory and inventory.get("sharded"):
+        total += sum(shard["qty"] for shard in reservations.shard_stock([product_id]).get(product_id, []))
+    return total
 
 
 @tool
@@ -26,19 +31,18 @@ def check_inventory(product_name: str):
     - product_name (str): The name or partial name of the item (e.g., "Emerald Dress").
     """
     try:
-        query = {"name": {"$regex": product_name, "$options": "i"}}
-        product = products_collection.find_one(query)
+        product = find_product(product_name)
 
         if not product:
             return f"I checked the inventory, but I couldn't find any product matching '{product_name}'."
 
-        stock = product.get("stock", 0)
+        units = _available(product["productId"])
         name = product["name"]
         price = product["price"]
 
-        if stock > 0:
-            status = f" In Stock: We have {stock} units of '{name}' available."
-            if stock < 3:
+        if units > 0:
+            status = f" In Stock: We have {units} units of '{name}' available."
+            if units < 3:
                 status += " ( Low Stock! selling fast)"
             return f"{status} Price: ${price}."
         else:
@@ -1,10 +1,40 @@
+import os
+import threading
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from pydantic import BaseModel
 from sales_agent import sales_agent_chat
+from cache import get_session, save_session, local_sessions
+import reservations
+import idempotency
+import write_behind
+
+
+def _background_startup():
+    # Index creation waits on MongoDB, so it runs off the boot path.
+    reservations.ensure_indexes()
+    idempotency.ensure_indexes()
+    # Puts stock from unpaid, expired order holds back on sale.
+    reservations.start_sweeper()
+
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    threading.Thread(target=_background_startup, name="app-startup", daemon=True).start()
+    yield
+    # Writes the queued feedback / payment audit records before exiting.
+    write_behind.drain()
 
-SESSION_STORE = {}
+
+app = FastAPI(lifespan=lifespan)
+
+# This standalone API keeps sessions in the bounded, expiring LRU store
+# in this process (session_store.py via cache.local_sessions), whatever
+# SESSION_BACKEND says. APP_SESSION_BACKEND=redis shares them through
+# Redis instead, like the backend does.
+SESSION_BACKEND = os.getenv("APP_SESSION_BACKEND", "local").lower()
+SESSION_STORE = local_sessions
 
 class ChatRequest(BaseModel):
     session_id: str
@@ -17,17 +47,21 @@ class ChatResponse(BaseModel):
 
 @app.post("/chat", response_model=ChatResponse)
 def chat(req: ChatRequest):
-    if req.session_id not in SESSION_STORE:
-        SESSION_STORE[req.session_id] = {
-            "last_intent": None
-        }
+    context = get_session(req.session_id, SESSION_BACKEND)
+    if not context:
+        context.update({"last_intent": None})
 
-    context = SESSION_STORE[req.session_id]
     reply, updated_context = sales_agent_chat(req.message, context)
 
-    SESSION_STORE[req.session_id] = updated_context
+    save_session(req.session_id, updated_context, SESSION_BACKEND)
 
     return ChatResponse(
         reply=reply,
         context=updated_context
     )
+
+
+@app.get("/metrics/sessions")
+def session_metrics():
+    """Size and eviction counters of the local session store."""
+    return SESSION_STORE.stats()
@@ -0,0 +1,87 @@
+"""
+CART QUOTE BENCHMARK
+--------------------
+Prices --carts carts of --lines line items each against the in-memory
+stand-ins (coupon and loyalty points on every cart).
+
+  per-line : calculate_final_price once per line item (product and
+             loyalty lookups each time)
+  cart     : loyalty_agent.quote_cart once per cart (one query per
+             collection per cart)
+  requote  : loyalty_agent.quote_carts over all carts at once (one
+             query per collection in total), e.g. re-quoting open
+             carts after a promotion change
+
+"queries" counts Mongo round trips.
+
+Usage:
+    python bench_cart_quote.py
+    python bench_cart_quote.py --carts 2000 --lines 8 --mongo-ms 1
+"""
+
+import argparse
+import builtins
+import os
+import random
+import sys
+import time
+
+# The stand-ins live with the tests
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests"))
+
+import standins
+
+
+def run(mode, args):
+    env = standins.install(mongo_latency=args.mongo_ms / 1000)
+    products = standins.seed_catalog(env, n_products=args.products)
+    env.collection("promotions").insert_one({"promoId": "SAVE10", "name": "Festive Ten", "discount": 10})
+    from loyalty_agent import calculate_final_price, quote_cart, quote_carts
+
+    rng = random.Random(args.seed)
+    carts = [{"customer_id": "CUST_GUEST", "coupon_code": "SAVE10", "use_points": True,
+              "items": [{"product_name": p["name"], "quantity": rng.randint(1, 3)}
+                        for p in rng.sample(products, args.lines)]}
+             for _ in range(args.carts)]
+    quote_cart(carts[0]["items"][:1], "CUST_GUEST", "SAVE10")  # loads the product and promotion indexes
+    ops_before = env.mongo_ops()
+
+    t0 = time.perf_counter()
+    if mode == "per-line":
+        prices = {p["name"]: p["price"] for p in products}
+        for cart in carts:
+            for item in cart["items"]:
+                calculate_final_price(item["product_name"], prices[item["product_name"]] * item["quantity"],
+                                      cart["customer_id"], cart["coupon_code"], cart["use_points"])
+    elif mode == "cart":
+        for cart in carts:
+            quote_cart(cart["items"], cart["customer_id"], cart["coupon_code"], cart["use_points"])
+    else:
+        quote_carts(carts)
+    elapsed = time.perf_counter() - t0
+    return args.carts / elapsed, env.mongo_ops() - ops_before, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--carts", type=int, default=500)
+    parser.add_argument("--lines", type=int, default=5)
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--mongo-ms", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    real_print, builtins.print = builtins.print, lambda *a, **k: None
+    try:
+        rows = [(mode, run(mode, args)) for mode in ("per-line", "cart", "requote")]
+    finally:
+        builtins.print = real_print
+
+    print(f"\n{args.carts} carts x {args.lines} lines, {args.mongo_ms:g} ms per round trip\n")
+    print(f"{'mode':<9} {'carts/s':>10} {'queries':>8} {'seconds':>8}")
+    for mode, (rate, queries, elapsed) in rows:
+        print(f"{mode:<9} {rate:10.0f} {queries:8d} {elapsed:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+INTENT DETECTION BENCHMARK
+--------------------------
+Accuracy and per-message latency on held-out labeled messages for:
+
+  local  : intent_classifier only (always answers)
+  hybrid : detect_intent() - local when confident, else the LLM
+  llm    : the LLM for every message
+
+The classifier is trained on the training split only. Without
+--ollama-url the LLM is llm_stub_server.py, whose latency is simulated
+and whose answers come from keyword rules, so its accuracy column says
+nothing about a real model; point --ollama-url at Ollama for that.
+
+Usage:
+    python bench_intent.py
+    python bench_intent.py --ollama-url http://localhost:11434/api/generate
+"""
+
+import argparse
+import statistics
+import time
+
+import intent_detector
+import llm_client
+import llm_stub_server
+import train_intent_classifier as training
+from intent_classifier import IntentClassifier
+
+
+def run(detect, examples):
+    latencies, correct = [], 0
+    for text, intent in examples:
+        t0 = time.perf_counter()
+        label = detect(text)
+        latencies.append(time.perf_counter() - t0)
+        correct += label == intent
+    latencies.sort()
+    return correct / len(examples), statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("data", nargs="*", default=[training.SEED_DATA])
+    parser.add_argument("--holdout", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--ollama-url", help="benchmark a real Ollama instead of the stub")
+    parser.add_argument("--port", type=int, default=11502)
+    parser.add_argument("--token-latency", type=float, default=0.02, help="stub seconds per token")
+    parser.add_argument("--prompt-latency", type=float, default=0.0002, help="stub seconds per prompt char")
+    args = parser.parse_args()
+
+    if args.ollama_url:
+        llm_client.OLLAMA_URL = args.ollama_url
+    else:
+        llm_stub_server.serve(port=args.port, load_latency=0, prompt_latency=args.prompt_latency,
+                              token_latency=args.token_latency)
+        llm_client.OLLAMA_URL = f"http://127.0.0.1:{args.port}/api/generate"
+
+    train, test = training.split(training.load_examples(args.data), args.holdout, args.seed)
+    model = IntentClassifier.train([t for t, _ in train], [i for _, i in train], intent_detector.INTENTS)
+    intent_detector.get_model = lambda: model
+
+    llm_only = lambda text: intent_detector.llm(intent_detector._prompt(text), use_cache=False)
+    llm_only(test[0][0])  # warm the connection pool / model
+
+    local_hits = sum(1 for text, _ in test if intent_detector.classify_local(text))
+    rows = [
+        ("local", run(lambda text: model.classify(text)[0], test)),
+        ("hybrid", run(intent_detector.detect_intent, test)),
+        ("llm", run(llm_only, test)),
+    ]
+
+    print(f"\n{len(test)} held-out messages ({len(train)} used for training); "
+          f"confidence threshold {intent_detector.INTENT_CONFIDENCE:.2f}, "
+          f"answered locally in hybrid mode: {local_hits / len(test):.0%}\n")
+    print(f"{'path':<7} {'accuracy':>9} {'p50':>10} {'p99':>10}")
+    for name, (accuracy, p50, p99) in rows:
+        print(f"{name:<7} {accuracy:9.1%} {p50 * 1000:8.3f}ms {p99 * 1000:8.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
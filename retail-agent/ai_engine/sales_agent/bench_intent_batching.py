@@ -0,0 +1,94 @@
+"""
+INTENT MICRO-BATCHING BENCHMARK
+-------------------------------
+Sends held-out messages through detect_intent_async() at a fixed arrival
+rate, with the local classifier and the response cache switched off so
+every message needs the LLM. Runs once with one LLM request per message
+and once with micro-batching, against llm_stub_server.py limited to
+--parallel concurrent generations (Ollama's OLLAMA_NUM_PARALLEL).
+
+"agree" is the share of labels that match the one-request-per-message
+run, i.e. whether batching changed any answer.
+
+Usage:
+    python bench_intent_batching.py
+    python bench_intent_batching.py --rate 400 --window-ms 10 --max-batch 32
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import cache
+import intent_detector
+import llm_client
+import llm_stub_server
+import train_intent_classifier as training
+
+
+async def run(messages, rate):
+    latencies = [0.0] * len(messages)
+
+    async def one(i, message):
+        await asyncio.sleep(i / rate)
+        t0 = time.perf_counter()
+        label = await intent_detector.detect_intent_async(message)
+        latencies[i] = time.perf_counter() - t0
+        return label
+
+    t0 = time.perf_counter()
+    labels = await asyncio.gather(*(one(i, m) for i, m in enumerate(messages)))
+    elapsed = time.perf_counter() - t0
+    await llm_client.close_async_client()
+    latencies.sort()
+    return labels, len(messages) / elapsed, statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=400)
+    parser.add_argument("--rate", type=float, default=200, help="arrivals per second")
+    parser.add_argument("--window-ms", type=float, default=intent_detector.INTENT_BATCH_WINDOW_MS)
+    parser.add_argument("--max-batch", type=int, default=intent_detector.INTENT_BATCH_MAX)
+    parser.add_argument("--inflight", type=int, default=intent_detector.INTENT_BATCH_INFLIGHT)
+    parser.add_argument("--parallel", type=int, default=2, help="stub concurrent generations")
+    parser.add_argument("--port", type=int, default=11503)
+    parser.add_argument("--prompt-latency", type=float, default=0.00005)
+    parser.add_argument("--token-latency", type=float, default=0.005)
+    args = parser.parse_args()
+
+    llm_stub_server.serve(port=args.port, load_latency=0, prompt_latency=args.prompt_latency,
+                          token_latency=args.token_latency, parallel=args.parallel)
+    llm_client.OLLAMA_URL = f"http://127.0.0.1:{args.port}/api/generate"
+    intent_detector.get_model = lambda: None  # every message goes to the LLM
+    cache.LLM_CACHE_ENABLED = False
+
+    examples = training.load_examples([training.SEED_DATA])
+    messages = [examples[i % len(examples)][0] for i in range(args.messages)]
+
+    intent_detector.INTENT_BATCH_MAX = 1
+    single = asyncio.run(run(messages, args.rate))
+
+    intent_detector.INTENT_BATCH_MAX = args.max_batch
+    intent_detector.INTENT_BATCH_WINDOW_MS = args.window_ms
+    intent_detector.INTENT_BATCH_INFLIGHT = args.inflight
+    batched = asyncio.run(run(messages, args.rate))
+
+    print(f"\n{args.messages} messages at {args.rate:.0f}/s; stub: {args.parallel} parallel, "
+          f"token {args.token_latency * 1000:.1f} ms; window {args.window_ms:g} ms, max batch {args.max_batch}, "
+          f"{args.inflight} in flight\n")
+    print(f"{'mode':<9} {'msg/s':>7} {'p50 ms':>8} {'p99 ms':>8} {'agree':>7}")
+    for name, (labels, rps, p50, p99) in (("single", single), ("batched", batched)):
+        agree = sum(a == b for a, b in zip(labels, single[0])) / len(labels)
+        print(f"{name:<9} {rps:7.1f} {p50 * 1000:8.1f} {p99 * 1000:8.1f} {agree:7.1%}")
+
+    stats = intent_detector.batching_stats()
+    for name in ("batch_size", "queue_delay_ms"):
+        stats[name].pop("buckets")
+    print("\nbatching:", json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
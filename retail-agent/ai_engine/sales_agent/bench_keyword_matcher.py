@@ -0,0 +1,114 @@
+"""
+KEYWORD MATCHER BENCHMARK
+-------------------------
+Routes synthetic chat messages against a large keyword vocabulary
+(default 10k keywords: synonyms and brand names over 200 concepts).
+
+  substring : the old approach, `any(kw in text for kw in keywords)`
+              per concept (no word boundaries)
+  regex     : one compiled alternation with lookaround word boundaries
+  matcher   : keyword_matcher.KeywordMatcher (one Aho-Corasick pass)
+
+Before timing, the matcher's concepts are checked against a
+per-keyword regex reference on a sample of messages.
+
+Usage:
+    python bench_keyword_matcher.py
+    python bench_keyword_matcher.py --keywords 50000 --messages 2000
+"""
+
+import argparse
+import random
+import re
+import time
+
+from keyword_matcher import KeywordMatcher, PLURAL_SUFFIXES
+
+SYLLABLES = ["ka", "lo", "mi", "ra", "ten", "zu", "vo", "pex", "dri", "an", "sol", "qi", "mar", "fe", "ton", "bri"]
+FILLER = ("do you have any in stock near me i want to buy a new one for my brother "
+          "what is the price of the with free delivery please show options under budget").split()
+
+
+def make_vocabulary(n_keywords, n_concepts, rng):
+    table, seen = {}, set()
+    while len(seen) < n_keywords:
+        words = ["".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+                 for _ in range(rng.choice((1, 1, 1, 2, 3)))]
+        keyword = " ".join(words)
+        if keyword not in seen:
+            seen.add(keyword)
+            table.setdefault(f"concept_{rng.randrange(n_concepts)}", []).append(keyword)
+    return table
+
+
+def make_messages(table, n, rng):
+    keywords = [kw for kws in table.values() for kw in kws]
+    messages = []
+    for _ in range(n):
+        words = rng.sample(FILLER, rng.randint(6, 14))
+        for _ in range(rng.choice((0, 1, 1, 2))):
+            words.insert(rng.randrange(len(words) + 1), rng.choice(keywords) + rng.choice(("", "", "s")))
+        messages.append(" ".join(words))
+    return messages
+
+
+def timed(fn, messages):
+    t0 = time.perf_counter()
+    for text in messages:
+        fn(text)
+    return (time.perf_counter() - t0) / len(messages) * 1e6  # µs per message
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keywords", type=int, default=10_000)
+    parser.add_argument("--concepts", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    table = make_vocabulary(args.keywords, args.concepts, rng)
+    messages = make_messages(table, args.messages, rng)
+    suffix = "(?:" + "|".join(PLURAL_SUFFIXES) + ")?"
+
+    t0 = time.perf_counter()
+    matcher = KeywordMatcher(table).build()
+    build_ms = (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    by_keyword = {kw: concept for concept, kws in table.items() for kw in kws}
+    alternation = re.compile(
+        r"(?<!\w)(" + "|".join(re.escape(kw) for kw in sorted(by_keyword, key=len, reverse=True)) + ")" + suffix + r"(?!\w)"
+    )
+    regex_ms = (time.perf_counter() - t0) * 1000
+
+    # correctness: every concept the reference finds, and nothing else
+    reference = [(concept, re.compile(r"(?<!\w)" + re.escape(kw) + suffix + r"(?!\w)"))
+                 for concept, kws in table.items() for kw in kws]
+    for text in messages[:50]:
+        expected = {concept for concept, pattern in reference if pattern.search(text)}
+        assert set(matcher.concepts(text)) == expected, text
+
+    def substring(text):
+        return [c for c, kws in table.items() if any(kw in text for kw in kws)]
+
+    def regex(text):
+        return {by_keyword[m.group(1)] for m in alternation.finditer(text)}
+
+    rows = [
+        ("substring", timed(substring, messages)),
+        ("regex", timed(regex, messages)),
+        ("matcher", timed(matcher.concepts, messages)),
+    ]
+    hit_rate = sum(1 for text in messages if matcher.concepts(text)) / len(messages)
+
+    print(f"\n{len(matcher)} keywords over {len(table)} concepts, {len(messages)} messages "
+          f"({hit_rate:.0%} with a match); build: matcher {build_ms:.0f} ms, regex {regex_ms:.0f} ms\n")
+    print(f"{'method':<10} {'µs/message':>11}")
+    for name, us in rows:
+        print(f"{name:<10} {us:11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+LLM CLIENT BENCHMARK
+--------------------
+Runs against llm_stub_server.py (started in-process), so no model or GPU
+is needed.
+
+  old       : requests.post per call, system prompt pasted into the
+              prompt, no keep_alive (the previous llm())
+  pooled    : llm_client.llm() (pooled session, `system` field, keep_alive)
+  streaming : llm_client.llm_stream(), time to first token
+  cached    : llm_client.llm() with the response cache, over prompts
+              that repeat with different case and punctuation
+
+Usage:
+    python bench_llm.py
+    python bench_llm.py --requests 200 --threads 16 --token-latency 0.005
+"""
+
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import cache
+import llm_client
+import llm_stub_server
+
+
+def old_llm(prompt: str) -> str:
+    response = requests.post(
+        llm_client.OLLAMA_URL,
+        json={"model": "llama3", "prompt": llm_client.SYSTEM_PROMPT + "\n\n" + prompt, "stream": False},
+    )
+    return response.json()["response"].strip()
+
+
+def first_token(prompt: str) -> float:
+    t0 = time.perf_counter()
+    for _ in llm_client.llm_stream(prompt):
+        return time.perf_counter() - t0
+
+
+def measure(fn, prompts, threads):
+    latencies = []
+
+    def one(prompt):
+        t0 = time.perf_counter()
+        fn(prompt)
+        latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(one, prompts))
+    elapsed = time.perf_counter() - t0
+    latencies.sort()
+    return len(prompts) / elapsed, statistics.median(latencies) * 1000, latencies[int(len(latencies) * 0.99) - 1] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--load-latency", type=float, default=0.5)
+    parser.add_argument("--prompt-latency", type=float, default=0.0002)
+    parser.add_argument("--token-latency", type=float, default=0.002)
+    args = parser.parse_args()
+
+    llm_stub_server.serve(port=args.port, load_latency=args.load_latency,
+                          prompt_latency=args.prompt_latency, token_latency=args.token_latency)
+    llm_client.OLLAMA_URL = f"http://127.0.0.1:{args.port}/api/generate"
+
+    prompts = [f"Tell me about product number {i}" for i in range(args.requests)]
+    variants = ["show me phones", "Show me phones!", "  SHOW me phones? ", "show me shoes", "Show me shoes."]
+    repeated = [variants[i % len(variants)] for i in range(args.requests)]
+    rows = [
+        ("old", measure(old_llm, prompts, args.threads)),
+        ("pooled", measure(lambda p: llm_client.llm(p, use_cache=False), prompts, args.threads)),
+        ("stream TTFT", measure(first_token, prompts, args.threads)),
+        ("cached", measure(llm_client.llm, repeated, args.threads)),
+    ]
+
+    print(f"\n{args.requests} requests, {args.threads} threads; stub: prompt {args.prompt_latency * 1000:.2f} ms/char, "
+          f"token {args.token_latency * 1000:.1f} ms\n")
+    print(f"{'client':<12} {'req/s':>8} {'p50 ms':>9} {'p99 ms':>9}")
+    for name, (rps, p50, p99) in rows:
+        print(f"{name:<12} {rps:8.1f} {p50:9.1f} {p99:9.1f}")
+    print(f"\nresponse cache: {cache.llm_cache_stats()}")
+
+
+if __name__ == "__main__":
+    main()
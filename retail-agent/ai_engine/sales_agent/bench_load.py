@@ -0,0 +1,121 @@
+"""
+CHAT LOAD TEST
+--------------
+Requests/second of the chat pipeline with N concurrent shopper sessions,
+sync vs async, against local stand-ins for MongoDB and Redis (see
+../tests/standins.py) that add a fixed network latency per operation.
+
+  sync  : sales_agent_chat + pymongo/redis-py style calls, each request
+          run on a bounded threadpool (Starlette's default is 40 threads)
+  async : sales_agent_chat_async + async drivers, all on one event loop
+
+Every session walks the full funnel: discovery -> selection -> store
+availability -> order -> loyalty -> payment (6 requests).
+
+Usage:
+    python bench_load.py                              # 100 and 1000 sessions
+    python bench_load.py --sessions 100 --mongo-latency 0.005
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# The stand-ins live with the tests
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests"))
+
+import standins
+
+CONVERSATION = ["show me phones", "1", "nearby store", "yes", "use my points", "upi"]
+
+
+def chat_sync(session_id: str, message: str) -> str:
+    from cache import get_session, save_session
+    from sales_agent import sales_agent_chat
+
+    session = get_session(session_id)
+    reply, session = sales_agent_chat(message, session)
+    save_session(session_id, session)
+    return reply
+
+
+async def chat_async(session_id: str, message: str) -> str:
+    from cache import get_session_async, save_session_async
+    from sales_agent import sales_agent_chat_async
+
+    session = await get_session_async(session_id)
+    reply, session = await sales_agent_chat_async(message, session)
+    await save_session_async(session_id, session)
+    return reply
+
+
+async def run(mode: str, sessions: int, pool: ThreadPoolExecutor) -> dict:
+    loop = asyncio.get_running_loop()
+    latencies = []
+    completed = 0
+
+    async def shopper(i: int):
+        nonlocal completed
+        sid = f"{mode}-{sessions}-{i}"
+        for message in CONVERSATION:
+            t0 = time.perf_counter()
+            if mode == "sync":
+                reply = await loop.run_in_executor(pool, chat_sync, sid, message)
+            else:
+                reply = await chat_async(sid, message)
+            latencies.append(time.perf_counter() - t0)
+        if "PAYMENT SUCCESS" in reply:
+            completed += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(shopper(i) for i in range(sessions)))
+    elapsed = time.perf_counter() - t0
+
+    latencies.sort()
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "completed": completed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--threads", type=int, default=40, help="threadpool size for the sync path")
+    parser.add_argument("--mongo-latency", type=float, default=0.002, help="seconds per Mongo op")
+    parser.add_argument("--redis-latency", type=float, default=0.0005, help="seconds per Redis op")
+    args = parser.parse_args()
+
+    env = standins.install(mongo_latency=args.mongo_latency, redis_latency=args.redis_latency)
+    standins.seed_catalog(env, stock=100_000)  # every shopper buys the same phone
+
+    import sales_agent
+    sales_agent.load_agents()
+    import builtins
+    real_print, builtins.print = builtins.print, lambda *a, **k: None  # agents log every call
+
+    pool = ThreadPoolExecutor(max_workers=args.threads)
+    try:
+        asyncio.run(run("sync", 1, pool))  # warm caches and indexes
+        results = []
+        for n in args.sessions:
+            for mode in ("sync", "async"):
+                results.append((n, mode, asyncio.run(run(mode, n, pool))))
+    finally:
+        builtins.print = real_print
+        pool.shutdown()
+
+    print(f"\nStand-in latency: mongo {args.mongo_latency * 1000:.1f} ms/op, "
+          f"redis {args.redis_latency * 1000:.1f} ms/op, sync threadpool {args.threads}\n")
+    print(f"{'sessions':>8}  {'mode':<5} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9}  completed")
+    for n, mode, r in results:
+        print(f"{n:>8}  {mode:<5} {r['rps']:9.0f} {r['p50_ms']:9.1f} {r['p99_ms']:9.1f}  {r['completed']}/{n}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+PRODUCT INDEX BENCHMARK
+-----------------------
+Name -> productId resolution latency of the in-process ProductNameIndex
+versus a case-insensitive regex scan over every name (what MongoDB does
+for an unanchored {"$regex", "$options": "i"} query, minus the network).
+
+Runs on a synthetic catalog; no database needed.
+
+Usage:
+    python bench_product_index.py                       # 1k, 100k, 1M
+    python bench_product_index.py --sizes 1000 100000
+"""
+
+import argparse
+import random
+import re
+import statistics
+import time
+
+from product_index import ProductNameIndex
+
+BRANDS = ["Aura", "Nova", "Zen", "Orbit", "Pulse", "Vertex", "Lumen", "Atlas",
+          "Echo", "Flux", "Halo", "Ion", "Kite", "Mira", "Onyx", "Quartz"]
+ADJECTIVES = ["Classic", "Slim", "Pro", "Ultra", "Lite", "Sport", "Urban", "Max",
+              "Air", "Prime", "Eco", "Retro", "Smart", "Active", "Studio", "Edge"]
+NOUNS = ["Smartphone", "Laptop", "Running Shoes", "T-Shirt", "Backpack", "Watch",
+         "Wallet", "Belt", "Headphones", "Jacket", "Lamp", "Notebook", "Sneakers",
+         "Hoodie", "Tablet", "Speaker"]
+
+
+def make_catalog(n: int, rng: random.Random):
+    return [
+        {
+            "productId": f"P{i:07d}",
+            "name": f"{rng.choice(BRANDS)} {rng.choice(ADJECTIVES)} "
+                    f"{rng.choice(NOUNS)} {rng.choice('ABCDEFGHJKLMNPRSTXZ')}{rng.randint(1, 999)}",
+        }
+        for i in range(n)
+    ]
+
+
+def make_queries(catalog, rng: random.Random, count: int):
+    """Mix of what shoppers type: full names, a model number, a fragment."""
+    queries = []
+    for _ in range(count):
+        name = rng.choice(catalog)["name"]
+        words = name.split()
+        kind = rng.random()
+        if kind < 0.4:
+            queries.append(name)
+        elif kind < 0.7:
+            queries.append(" ".join(words[-2:]))
+        elif kind < 0.9:
+            queries.append(words[-2][1:6].lower())  # "phone" inside "Smartphone"
+        else:
+            queries.append("nonexistent gizmo")
+    return queries
+
+
+def time_calls(fn, queries):
+    samples = []
+    for q in queries:
+        t0 = time.perf_counter()
+        fn(q)
+        samples.append((time.perf_counter() - t0) * 1e6)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def bench(n: int, rng: random.Random):
+    catalog = make_catalog(n, rng)
+
+    t0 = time.perf_counter()
+    index = ProductNameIndex()
+    index.add_many(catalog)
+    build_s = time.perf_counter() - t0
+
+    names = [(p["productId"], p["name"]) for p in catalog]
+
+    def regex_scan(q):
+        pattern = re.compile(re.escape(q), re.IGNORECASE)
+        return [pid for pid, name in names if pattern.search(name)][:1]
+
+    index_queries = make_queries(catalog, rng, 2000)
+    scan_queries = index_queries[:max(5, min(200, 200_000_000 // (n * 100)))]
+
+    idx_med, idx_p99 = time_calls(lambda q: index.resolve(q, limit=1), index_queries)
+    scan_med, scan_p99 = time_calls(regex_scan, scan_queries)
+
+    print(f"{n:>9,}  build {build_s:6.2f}s   "
+          f"index p50 {idx_med:9.1f}us p99 {idx_p99:9.1f}us   "
+          f"regex scan p50 {scan_med:11.1f}us p99 {scan_p99:11.1f}us   "
+          f"speedup x{scan_med / idx_med:,.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print("\nproducts   build         index resolve                  regex scan")
+    for n in args.sizes:
+        bench(n, rng)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+REPRICING SIMULATOR BENCHMARK
+-----------------------------
+Simulates candidate promotions over a synthetic catalog of --skus SKUs
+(prices 49-99,999 over --categories categories), with --points loyalty
+points per purchase capped at MAX_POINT_COVERAGE.
+
+  scalar : loyalty_agent._price_quote once per SKU, on a --sample of
+           SKUs and extrapolated (the math calculate_final_price runs,
+           without its lookups)
+  vector : repricing_simulator.simulate over the whole catalog
+
+Each scenario's sampled SKUs must get the same final price both ways.
+
+Usage:
+    python bench_repricing.py
+    python bench_repricing.py --skus 5000000 --points 2000
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from loyalty_agent import _price_quote
+from repricing_simulator import Catalog, simulate
+
+SCENARIOS = {
+    "15% off CAT-00 + points": [
+        {"promoId": "ELEC15", "name": "Electronics 15", "discount": 15, "applicableCategories": ["CAT-00"]},
+    ],
+    "best of three": [
+        {"promoId": "ELEC15", "name": "Electronics 15", "discount": 15, "applicableCategories": ["CAT-00"]},
+        {"promoId": "HOME10", "name": "Home 10", "discount": 10, "applicableCategories": ["CAT-01", "CAT-02"]},
+        {"promoId": "ALL5", "name": "Sitewide 5", "discount": 5},
+    ],
+}
+
+
+def synthetic_catalog(n, n_categories, seed):
+    rng = np.random.default_rng(seed)
+    return Catalog(
+        product_ids=np.char.add("SKU-", np.arange(n).astype(str)),
+        prices=np.round(np.exp(rng.uniform(np.log(49), np.log(99_999), n)), 0),
+        category_codes=rng.integers(0, n_categories, n, dtype=np.int32),
+        categories=tuple(f"CAT-{c:02d}" for c in range(n_categories)),
+    )
+
+
+def scalar_prices(catalog, result, sample, points):
+    """Per-SKU final prices from the single-product pricing rules."""
+    finals = []
+    for i in sample:
+        promo = result.promotions[result.winner[i]] if result.winner[i] >= 0 else None
+        code = promo.promo_id if promo else None
+        quote = _price_quote(float(catalog.prices[i]), code,
+                             (promo.name, promo.discount) if promo else None, points)
+        finals.append(quote.final_price)
+    return np.array(finals)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--skus", type=int, default=1_000_000)
+    parser.add_argument("--categories", type=int, default=20)
+    parser.add_argument("--points", type=float, default=500)
+    parser.add_argument("--sample", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    catalog = synthetic_catalog(args.skus, args.categories, args.seed)
+    print(f"\nsynthetic catalog: {len(catalog)} SKUs in {time.perf_counter() - t0:.2f}s, "
+          f"{args.points:g} points per purchase\n")
+    sample = np.random.default_rng(args.seed).choice(len(catalog), min(args.sample, len(catalog)), replace=False)
+
+    rows = []
+    for name, promotions in SCENARIOS.items():
+        t0 = time.perf_counter()
+        result = simulate(catalog, promotions, points=args.points, expand_categories=False)
+        summary = result.summary()
+        vector_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        expected = scalar_prices(catalog, result, sample, args.points)
+        scalar_s = (time.perf_counter() - t0) * len(catalog) / len(sample)
+        assert np.allclose(expected, result.final_prices[sample]), name
+        rows.append((name, scalar_s, vector_s, summary))
+
+    print(f"{'scenario':<26} {'scalar s':>9} {'vector s':>9} {'speedup':>8} {'p50 saved %':>12} {'revenue -%':>11}")
+    for name, scalar_s, vector_s, s in rows:
+        lost = 100 * (1 - s["final_total"] / s["base_total"])
+        print(f"{name:<26} {scalar_s:9.2f} {vector_s:9.3f} {scalar_s / vector_s:7.0f}x "
+              f"{s['savings_pct']['p50']:12.2f} {lost:11.2f}")
+    print("\n(scalar extrapolated from", len(sample), "SKUs; vector includes summary())\n")
+    print(simulate(catalog, SCENARIOS["best of three"], points=args.points, expand_categories=False).render())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+STOCK RESERVATION BENCHMARK
+---------------------------
+A flash sale: --buyers threads each try to reserve one unit of the same
+SKU at the same location, which has fewer units than there are buyers.
+Runs against the in-memory stand-ins with `--lock-ms` of write time per
+document, to emulate contention on one hot inventory document.
+
+  naive   : read the document, check the quantity, then decrement
+            (the check-then-act race the reservation engine replaces)
+  atomic  : reservations.reserve() -> conditional decrement per document
+  sharded : the same after reservations.split_stock() into --shards
+            sub-counters
+
+"sold" counts the buyers told yes; "oversold" is sold minus the units
+that existed; "left" is the quantity remaining (negative = oversold).
+
+Usage:
+    python bench_reservations.py
+    python bench_reservations.py --buyers 500 --stock 300 --shards 16
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+import uuid
+
+# The stand-ins live with the tests
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests"))
+
+import reservations
+import standins
+import stock
+from database import inventory_col
+
+PRODUCT, LOCATION = "PROD-00000", "ONLINE"
+
+
+def naive_reserve(qty):
+    inventory = inventory_col.find_one({"productId": PRODUCT})
+    entry = next(loc for loc in inventory["stockByLocation"] if loc["locationId"] == LOCATION)
+    if entry["qty"] < qty:
+        return False
+    return stock.adjust_stock(PRODUCT, LOCATION, -qty)
+
+
+def atomic_reserve(qty):
+    return reservations.reserve(PRODUCT, qty, f"ORD-{uuid.uuid4().hex[:8].upper()}", LOCATION) is not None
+
+
+def remaining(env):
+    doc = env.collection("inventory").find_one({"productId": PRODUCT})
+    entry = next(loc for loc in doc["stockByLocation"] if loc["locationId"] == LOCATION)
+    return entry["qty"] + sum(s["qty"] for s in env.collection("stock_shards").find({"productId": PRODUCT}))
+
+
+def run(mode, args):
+    env = standins.install(mongo_latency=args.mongo_ms / 1000, write_lock_latency=args.lock_ms / 1000)
+    env.collection("inventory").insert_one({"productId": PRODUCT, "stockByLocation": [
+        {"locationId": LOCATION, "region": "ONLINE", "qty": args.stock},
+    ]})
+    env.collection("inventory").update_many({}, [stock.TOTALS_STAGE])
+    reservations._shard_map.clear()
+    if mode == "sharded":
+        reservations.split_stock(PRODUCT, LOCATION, args.shards)
+    reserve = naive_reserve if mode == "naive" else atomic_reserve
+
+    latencies, sold = [], []
+    start = threading.Barrier(args.buyers + 1)
+
+    def buyer():
+        start.wait()
+        t0 = time.perf_counter()
+        ok = reserve(1)
+        latencies.append(time.perf_counter() - t0)
+        sold.append(ok)
+
+    threads = [threading.Thread(target=buyer) for _ in range(args.buyers)]
+    for t in threads:
+        t.start()
+    start.wait()
+    t0 = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    latencies.sort()
+    n_sold = sum(sold)
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": statistics.median(latencies),
+        "p99": latencies[int(len(latencies) * 0.99) - 1],
+        "sold": n_sold,
+        "oversold": max(0, n_sold - args.stock),
+        "left": remaining(env),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--buyers", type=int, default=200)
+    parser.add_argument("--stock", type=int, default=100)
+    parser.add_argument("--shards", type=int, default=8)
+    parser.add_argument("--lock-ms", type=float, default=1.0)
+    parser.add_argument("--mongo-ms", type=float, default=0.5)
+    args = parser.parse_args()
+
+    rows = [(mode, run(mode, args)) for mode in ("naive", "atomic", "sharded")]
+
+    print(f"\n{args.buyers} buyers for {args.stock} units of one SKU; "
+          f"{args.lock_ms:g} ms write lock, {args.mongo_ms:g} ms round trip, {args.shards} shards\n")
+    print(f"{'mode':<8} {'res/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'sold':>6} {'oversold':>9} {'left':>6}")
+    for mode, r in rows:
+        print(f"{mode:<8} {r['rps']:8.0f} {r['p50'] * 1000:8.1f} {r['p99'] * 1000:8.1f} "
+              f"{r['sold']:6d} {r['oversold']:9d} {r['left']:6d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+BULK RETURNS BENCHMARK
+----------------------
+End-of-day return batch against the in-memory stand-ins: --orders paid
+orders of --items line items each, spread over --products products and
+two locations, all returned.
+
+  per-item : the old RETURN path per order: one update_one per line
+             item to restock, plus one for the order
+  bulk     : post_purchase_agent.process_returns (grouped, unordered
+             bulk_write for the orders and for the restocks)
+
+Both modes must leave identical stock; "writes" counts Mongo round
+trips (each bulk_write chunk is one).
+
+Usage:
+    python bench_returns.py
+    python bench_returns.py --orders 20000 --items 3 --mongo-ms 2
+"""
+
+import argparse
+import builtins
+import datetime
+import os
+import random
+import sys
+import time
+
+# The stand-ins live with the tests
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests"))
+
+import standins
+import stock
+from database import inventory_col, orders_col
+from post_purchase_agent import process_returns
+
+LOCATIONS = ("STORE-MALL", "ONLINE")
+
+
+def make_orders(n, items, products, rng):
+    orders = []
+    for i in range(n):
+        pids = rng.sample(range(products), items)
+        orders.append({
+            "orderId": f"ORD-{i:08d}",
+            "customerId": "CUST_GUEST",
+            "items": [{"productId": f"PROD-{p:05d}", "name": f"Product {p}", "qty": rng.randint(1, 3), "price": 100}
+                      for p in pids],
+            "status": "PAID",
+            "fulfillment": {"type": "PICKUP", "locationId": rng.choice(LOCATIONS)},
+            "orderDate": datetime.datetime.now(),
+        })
+    return orders
+
+
+def per_item(orders):
+    for order in orders:
+        orders_col.update_one({"orderId": order["orderId"]}, {"$set": {
+            "status": "RETURNED", "returnReason": "end of day", "returnDate": datetime.datetime.now()
+        }})
+        location_id = order["fulfillment"]["locationId"]
+        for item in order["items"]:
+            inventory_col.update_one(stock.location_filter(item["productId"], location_id),
+                                     stock.adjust_update(location_id, item["qty"]))
+
+
+def bulk(orders):
+    report = process_returns([{"orderId": o["orderId"]} for o in orders], reason="end of day")
+    assert not report.errors, report.errors[:5]
+
+
+def run(mode, args):
+    env = standins.install(mongo_latency=args.mongo_ms / 1000)
+    standins.seed_catalog(env, n_products=args.products)
+    orders = make_orders(args.orders, args.items, args.products, random.Random(args.seed))
+    env.collection("orders").insert_many([dict(o) for o in orders])
+    ops_before = env.mongo_ops()
+
+    t0 = time.perf_counter()
+    (per_item if mode == "per-item" else bulk)(orders)
+    elapsed = time.perf_counter() - t0
+
+    snapshot = {d["productId"]: (d["totalQty"], tuple(loc["qty"] for loc in d["stockByLocation"]))
+                for d in env.collection("inventory").find({}, {"_id": 0})}
+    return args.orders / elapsed, env.mongo_ops() - ops_before, elapsed, snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--items", type=int, default=3)
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--mongo-ms", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    real_print, builtins.print = builtins.print, lambda *a, **k: None
+    try:
+        rows = [(mode, run(mode, args)) for mode in ("per-item", "bulk")]
+    finally:
+        builtins.print = real_print
+    assert rows[0][1][3] == rows[1][1][3], "modes left different stock"
+
+    print(f"\n{args.orders} orders x {args.items} items over {args.products} products, "
+          f"{args.mongo_ms:g} ms per round trip (stock identical in both modes)\n")
+    print(f"{'mode':<9} {'orders/s':>10} {'writes':>8} {'seconds':>8}")
+    for mode, (rate, writes, elapsed, _) in rows:
+        print(f"{mode:<9} {rate:10.0f} {writes:8d} {elapsed:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+SESSION STORAGE BENCHMARK
+-------------------------
+Bytes per turn and session load/save latency for the whole-blob format
+(one JSON string rewritten with SETEX every turn, as before) vs the
+field-level hash format in cache.py (delta HSET/HDEL + EXPIRE, product
+references instead of documents).
+
+Runs the full chat funnel against the local stand-ins (../tests/standins.py), so
+Redis traffic is counted exactly and each Redis / Mongo call costs the
+configured latency.
+
+Usage:
+    python bench_session.py
+    python bench_session.py --sessions 500 --redis-latency 0.001
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+# The stand-ins live with the tests
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests"))
+
+import standins
+
+CONVERSATION = ["show me phones", "1", "nearby store", "yes", "use my points", "upi", "track my order"]
+
+
+# --- the previous format, kept here for comparison ---
+
+def get_session_blob(redis_client, session_id):
+    data = redis_client.get(f"session:{session_id}")
+    return json.loads(data) if data else {}
+
+
+def save_session_blob(redis_client, session_id, session):
+    redis_client.setex(f"session:{session_id}", 86400, json.dumps(session))
+
+
+def run(mode, env, sessions):
+    import cache
+    from sales_agent import sales_agent_chat
+
+    redis_client = env.redis
+    loads, saves = [], []
+    written = read = 0
+    for i in range(sessions):
+        sid = f"{mode}-{i}"
+        for message in CONVERSATION:
+            r0, w0 = redis_client.bytes_read, redis_client.bytes_written
+
+            t0 = time.perf_counter()
+            if mode == "blob":
+                session = get_session_blob(redis_client, sid)
+            else:
+                session = cache.get_session(sid)
+            loads.append(time.perf_counter() - t0)
+
+            _, session = sales_agent_chat(message, session)
+
+            t0 = time.perf_counter()
+            if mode == "blob":
+                save_session_blob(redis_client, sid, session)
+            else:
+                cache.save_session(sid, session)
+            saves.append(time.perf_counter() - t0)
+
+            read += redis_client.bytes_read - r0
+            written += redis_client.bytes_written - w0
+
+    turns = sessions * len(CONVERSATION)
+    return {
+        "written": written / turns,
+        "read": read / turns,
+        "load_ms": statistics.median(loads) * 1000,
+        "save_ms": statistics.median(saves) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--mongo-latency", type=float, default=0.002, help="seconds per Mongo op")
+    parser.add_argument("--redis-latency", type=float, default=0.0005, help="seconds per Redis op")
+    args = parser.parse_args()
+
+    env = standins.install(mongo_latency=args.mongo_latency, redis_latency=args.redis_latency)
+    standins.seed_catalog(env)
+
+    import builtins
+    real_print, builtins.print = builtins.print, lambda *a, **k: None  # agents log every call
+    try:
+        run("hash", env, 1)  # warm caches and indexes
+        results = [(mode, run(mode, env, args.sessions)) for mode in ("blob", "hash")]
+    finally:
+        builtins.print = real_print
+
+    print(f"\n{args.sessions} sessions x {len(CONVERSATION)} turns; "
+          f"redis {args.redis_latency * 1000:.1f} ms/op, mongo {args.mongo_latency * 1000:.1f} ms/op\n")
+    print(f"{'format':<6} {'written B/turn':>15} {'read B/turn':>12} {'load p50 ms':>12} {'save p50 ms':>12}")
+    for mode, r in results:
+        print(f"{mode:<6} {r['written']:15.0f} {r['read']:12.0f} {r['load_ms']:12.2f} {r['save_ms']:12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,18 @@
 import os
+import re
 import json
+import time
+import hashlib
+import threading
 import redis
+import redis.asyncio as aioredis
+from redis.asyncio.retry import Retry as AsyncRetry
+from redis.backoff import NoBackoff
+from redis.retry import Retry
 from dotenv import load_dotenv
+from ttl_cache import TTLCache
+from session_store import LocalSessionStore
+from database import products_col, aproducts_col
 
 load_dotenv()
 
@@ -12,67 +23,557 @@ REDIS_PORT = int(os.getenv("REDIS_PORT", 15000))
 REDIS_PASSWORD = os.getenv("REDIS_PASSWORD")
 REDIS_USERNAME = os.getenv("REDIS_USERNAME", "default")
 
-redis_client = None
-
-try:
-    # ⚡ THIS IS THE CONNECTION LINE (Updated for Cloud)
-    redis_client = redis.Redis(
-        host=REDIS_HOST,
-        port=REDIS_PORT,
-        username=REDIS_USERNAME,
-        password=REDIS_PASSWORD,
-        decode_responses=True, # Keeps text as text (not bytes)
-        socket_timeout=5       # Don't wait forever if internet is slow
-    )
-    
-    redis_client.ping() # Test the connection immediately
-    print("[Cache] ✅ Connected to Redis Cloud!")
-
-except Exception as e:
-    print(f"[Cache] ⚠️ Redis Connection Failed: {e}")
-    print("[Cache] Memory features will be disabled.")
-    redis_client = None
+# After a failed connection we stop trying for this long, so a dead
+# Redis costs one timeout per window instead of one per request.
+REDIS_RETRY_SECONDS = float(os.getenv("REDIS_RETRY_SECONDS", 30))
+
+_redis_client = None
+_async_redis_client = None
+_redis_down_until = 0.0
+_redis_lock = threading.Lock()
+
+
+def get_redis():
+    """
+    Returns the shared Redis client, or None while Redis is marked down.
+    Creating the client does no network I/O; the first command connects.
+    """
+    global _redis_client
+    if time.monotonic() < _redis_down_until:
+        return None
+    if _redis_client is None:
+        with _redis_lock:
+            if _redis_client is None:
+                # ⚡ THIS IS THE CONNECTION LINE (Updated for Cloud)
+                _redis_client = redis.Redis(
+                    host=REDIS_HOST,
+                    port=REDIS_PORT,
+                    username=REDIS_USERNAME,
+                    password=REDIS_PASSWORD,
+                    decode_responses=True,    # Keeps text as text (not bytes)
+                    socket_timeout=5,         # Don't wait forever if internet is slow
+                    socket_connect_timeout=2,
+                    retry=Retry(NoBackoff(), 1)  # fail fast; _mark_down handles outages
+                )
+    return _redis_client
+
+
+def get_async_redis():
+    """redis.asyncio twin of get_redis() for the async chat pipeline."""
+    global _async_redis_client
+    if time.monotonic() < _redis_down_until:
+        return None
+    if _async_redis_client is None:
+        _async_redis_client = aioredis.Redis(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            username=REDIS_USERNAME,
+            password=REDIS_PASSWORD,
+            decode_responses=True,
+            socket_timeout=5,
+            socket_connect_timeout=2,
+            retry=AsyncRetry(NoBackoff(), 1)
+        )
+    return _async_redis_client
+
+
+def _mark_down(e):
+    global _redis_down_until
+    _redis_down_until = time.monotonic() + REDIS_RETRY_SECONDS
+    print(f"[Cache] ⚠️ Redis unavailable ({e}). Retrying in {REDIS_RETRY_SECONDS:.0f}s.")
+
+
+def ping() -> bool:
+    """Readiness check: True if Redis answers PING."""
+    global _redis_down_until
+    _redis_down_until = 0.0  # an explicit probe always tries the network
+    try:
+        get_redis().ping()
+        return True
+    except Exception as e:
+        _mark_down(e)
+        return False
 
 # --- SESSION FUNCTIONS ---
+#
+# A session is a Redis hash, session:{id}, holding one JSON field per
+# top-level key. Product documents (recommendations, selected_product)
+# are stored as productId references and hydrated on load. A save sends
+# only the fields that changed since the load (HSET / HDEL) plus an
+# EXPIRE to refresh the TTL, pipelined into one round trip.
+# Sessions written by older builds as a single JSON string are still
+# read; their next save converts them.
+
+SESSION_TTL_SECONDS = 86400
+
+# "redis" (default) or "local". With "local", or while Redis is down,
+# sessions live in a bounded in-process store (session_store.py).
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "redis").lower()
+local_sessions = LocalSessionStore(
+    max_sessions=int(os.getenv("LOCAL_SESSION_MAX", 10000)),
+    idle_ttl=float(os.getenv("LOCAL_SESSION_IDLE_SECONDS", 3600)),
+    max_bytes=int(os.getenv("LOCAL_SESSION_MAX_BYTES", 64 * 1024 * 1024)),
+)
+
+
+class Session(dict):
+    """Session state that remembers the encoded fields it was loaded with."""
+
+    def __init__(self, data=None, stored=None, legacy=False):
+        super().__init__(data or {})
+        self.stored = dict(stored or {})  # field -> value as encoded in Redis
+        self.legacy = legacy
+
+
+def _product_ref(product):
+    if isinstance(product, dict) and product.get("productId"):
+        return product["productId"]
+    return product  # no id to point at: keep the document itself
+
+
+def _encode_session(session):
+    fields = {}
+    for key, value in session.items():
+        if key == "recommendations":
+            value = [_product_ref(p) for p in value or []]
+        elif key == "selected_product":
+            value = _product_ref(value)
+        fields[key] = json.dumps(value, default=str)
+    return fields
+
+
+def _session_refs(data):
+    refs = [p for p in data.get("recommendations") or [] if isinstance(p, str)]
+    if isinstance(data.get("selected_product"), str):
+        refs.append(data["selected_product"])
+    return list(dict.fromkeys(refs))
+
+
+def _hydrate(data, docs):
+    if data.get("recommendations"):
+        data["recommendations"] = [
+            p for p in (docs.get(p) if isinstance(p, str) else p for p in data["recommendations"]) if p
+        ]
+    if isinstance(data.get("selected_product"), str):
+        data["selected_product"] = docs.get(data["selected_product"])
+    return data
+
+
+def _session_delta(session):
+    """(encoded fields, fields to HSET, fields to HDEL, rewrite whole key?)"""
+    encoded = _encode_session(session)
+    if not isinstance(session, Session) or session.legacy:
+        return encoded, encoded, [], True
+    changed = {k: v for k, v in encoded.items() if session.stored.get(k) != v}
+    removed = [k for k in session.stored if k not in encoded]
+    return encoded, changed, removed, False
 
-def get_session(session_id):
-    """Loads the user's conversation state."""
-    if not redis_client: return {}
+
+def _queue_save(pipe, key, changed, removed, rewrite):
+    if rewrite:
+        pipe.delete(key)
+    if changed:
+        pipe.hset(key, mapping=changed)
+    if removed:
+        pipe.hdel(key, *removed)
+    pipe.expire(key, SESSION_TTL_SECONDS)
+
+
+def _saved(session, encoded):
+    if isinstance(session, Session):
+        session.stored, session.legacy = encoded, False
+
+
+# Product documents for hydrating session references.
+_product_docs = TTLCache(
+    max_entries=int(os.getenv("SESSION_PRODUCT_CACHE_SIZE", 2048)),
+    ttl=float(os.getenv("PRODUCT_L1_TTL_SECONDS", 30)),
+)
+
+
+def _products_by_id(ids):
+    docs = {pid: _product_docs.get(pid) for pid in ids}
+    missing = [pid for pid, doc in docs.items() if doc is None]
+    if missing:
+        for doc in products_col.find({"productId": {"$in": missing}}, {"_id": 0}):
+            docs[doc["productId"]] = doc
+            _product_docs.set(doc["productId"], doc)
+    return docs
+
+
+async def _products_by_id_async(ids):
+    docs = {pid: _product_docs.get(pid) for pid in ids}
+    missing = [pid for pid, doc in docs.items() if doc is None]
+    if missing:
+        for doc in await aproducts_col.find({"productId": {"$in": missing}}, {"_id": 0}).to_list(None):
+            docs[doc["productId"]] = doc
+            _product_docs.set(doc["productId"], doc)
+    return docs
+
+
+def _redis_for_sessions(get_client, backend=None):
+    """The Redis client sessions use, or None for the local store."""
+    return get_client() if (backend or SESSION_BACKEND) == "redis" else None
+
+
+def get_session(session_id, backend=None):
+    """Loads the user's conversation state (`backend` overrides SESSION_BACKEND)."""
+    redis_client = _redis_for_sessions(get_redis, backend)
+    key = f"session:{session_id}"
     try:
-        data = redis_client.get(f"session:{session_id}")
-        if data and isinstance(data, str):
-            return json.loads(data)
-        return {}
+        stored, data, legacy = None, None, False
+        if redis_client:
+            try:
+                stored = redis_client.hgetall(key)
+            except redis.ResponseError:  # written by an older build
+                stored, legacy = {}, True
+                data = json.loads(redis_client.get(key) or "{}")
+            except redis.ConnectionError as e:
+                _mark_down(e)
+        if stored is None:
+            stored = local_sessions.get(session_id) or {}
+        if data is None:
+            data = {k: json.loads(v) for k, v in stored.items()}
+        refs = _session_refs(data)
+        if refs:
+            _hydrate(data, _products_by_id(refs))
+        return Session(data, stored, legacy)
     except:
         return {}
 
-def save_session(session_id, session_data):
-    """Saves the user's state (Expires in 24 hours)."""
-    if not redis_client: return
+def save_session(session_id, session_data, backend=None):
+    """Saves the fields that changed this turn (expires in 24 hours)."""
+    redis_client = _redis_for_sessions(get_redis, backend)
     try:
-        redis_client.setex(f"session:{session_id}", 86400, json.dumps(session_data))
+        encoded, changed, removed, rewrite = _session_delta(session_data)
+        if redis_client:
+            try:
+                with redis_client.pipeline() as pipe:
+                    _queue_save(pipe, f"session:{session_id}", changed, removed, rewrite)
+                    pipe.execute()
+                return _saved(session_data, encoded)
+            except redis.ConnectionError as e:
+                _mark_down(e)
+        local_sessions.put(session_id, encoded)
+        _saved(session_data, encoded)
     except Exception as e:
         print(f"[Cache Error] Could not save session: {e}")
 
 # --- PRODUCT CACHING FUNCTIONS ---
+#
+# Two tiers: a small in-process LRU (L1) in front of the Redis
+# product_map:* keys (L2). Lookups that found no product are cached as
+# well, with a shorter TTL, so a repeated query for a missing product
+# stops here instead of going back to the database.
+
+PRODUCT_TTL_SECONDS = 3600
+PRODUCT_NEGATIVE_TTL_SECONDS = int(os.getenv("PRODUCT_NEGATIVE_TTL_SECONDS", 60))
+
+# get_cached_product() returns this for a cached "no such product".
+NOT_FOUND = {"notFound": True}
+
+_product_l1 = TTLCache(
+    max_entries=int(os.getenv("PRODUCT_L1_SIZE", 1024)),
+    ttl=float(os.getenv("PRODUCT_L1_TTL_SECONDS", 30)),
+)
+_product_stats = {"l1_hits": 0, "l2_hits": 0, "negative_hits": 0, "misses": 0}
+_stats_lock = threading.Lock()
+
+
+def _product_key(product_name):
+    return f"product_map:{product_name.lower().strip()}"
+
+
+def _count(*names, stats=_product_stats):
+    with _stats_lock:
+        for name in names:
+            stats[name] += 1
+
+
+def _l1_get(key):
+    value = _product_l1.get(key, count=False)
+    if value is not None:
+        _count("l1_hits", *(["negative_hits"] if value is NOT_FOUND else []))
+    return value
+
+
+def _l1_set(key, value):
+    ttl = min(_product_l1.ttl, PRODUCT_NEGATIVE_TTL_SECONDS) if value is NOT_FOUND else None
+    _product_l1.set(key, value, ttl=ttl)
+
+
+def _from_l2(key, data):
+    """Turns a Redis reply into a cache result and fills L1 with it."""
+    value = json.loads(data) if data and isinstance(data, str) else None
+    if value is None:
+        _count("misses")
+        return None
+    if value == NOT_FOUND:
+        value = NOT_FOUND
+        _count("l2_hits", "negative_hits")
+    else:
+        _count("l2_hits")
+    _l1_set(key, value)
+    return value
+
 
 def get_cached_product(product_name):
-    """Retrieves product details from cache."""
-    if not redis_client: return None
-    try:
-        key = f"product_map:{product_name.lower().strip()}"
-        data = redis_client.get(key)
-        if data and isinstance(data, str):
-            return json.loads(data)
+    """
+    Retrieves product details from cache: a dict, NOT_FOUND for a cached
+    miss, or None if nothing is cached.
+    """
+    key = _product_key(product_name)
+    value = _l1_get(key)
+    if value is not None:
+        return value
+    redis_client = get_redis()
+    if not redis_client:
+        _count("misses")
         return None
+    try:
+        return _from_l2(key, redis_client.get(key))
+    except redis.ConnectionError as e:
+        _mark_down(e)
     except:
-        return None
+        pass
+    _count("misses")
+    return None
 
 def cache_product(product_name, product_data):
     """Saves product details to cache for 1 hour."""
+    key = _product_key(product_name)
+    _l1_set(key, product_data)
+    redis_client = get_redis()
+    if not redis_client: return
+    try:
+        redis_client.setex(key, PRODUCT_TTL_SECONDS, json.dumps(product_data))
+    except redis.ConnectionError as e:
+        _mark_down(e)
+    except Exception as e:
+        print(f"[Cache Error] Could not cache product: {e}")
+
+def cache_product_missing(product_name):
+    """
+    Remembers that no product matches this name (short TTL). Only call it
+    after a lookup against a fresh product index (product_index.is_fresh).
+    """
+    key = _product_key(product_name)
+    _l1_set(key, NOT_FOUND)
+    redis_client = get_redis()
+    if not redis_client: return
+    try:
+        redis_client.setex(key, PRODUCT_NEGATIVE_TTL_SECONDS, json.dumps(NOT_FOUND))
+    except redis.ConnectionError as e:
+        _mark_down(e)
+    except Exception as e:
+        print(f"[Cache Error] Could not cache product: {e}")
+
+def product_cache_stats():
+    with _stats_lock:
+        stats = dict(_product_stats)
+    l1 = _product_l1.stats()
+    stats["l1"] = {k: l1[k] for k in ("entries", "max_entries", "ttl_seconds", "evictions", "expirations")}
+    stats["negative_ttl_seconds"] = PRODUCT_NEGATIVE_TTL_SECONDS
+    return stats
+
+# --- LLM RESPONSE CACHING ---
+#
+# Completions are memoized on (model, system prompt, normalized prompt).
+# Normalizing (case, punctuation, whitespace) makes "show me phones" and
+# "Show me phones!" one entry. An in-process LRU always sits in front;
+# with LLM_CACHE_REDIS=true the entries are also shared through Redis
+# (llm:* keys), so every worker benefits from one generation.
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "true").lower() in ("1", "true", "yes")
+LLM_CACHE_REDIS = os.getenv("LLM_CACHE_REDIS", "false").lower() in ("1", "true", "yes")
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", 3600))
+LLM_CACHE_MAX_CHARS = int(os.getenv("LLM_CACHE_MAX_CHARS", 4096))  # longer replies are not cached
+
+_llm_l1 = TTLCache(
+    max_entries=int(os.getenv("LLM_CACHE_SIZE", 2048)),
+    ttl=LLM_CACHE_TTL_SECONDS,
+)
+_llm_stats = {"l1_hits": 0, "l2_hits": 0, "misses": 0, "stores": 0, "too_large": 0}
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+
+def llm_cache_key(model, system, prompt):
+    text = " ".join(_PUNCTUATION.sub(" ", prompt.casefold()).split())
+    digest = hashlib.sha256("\0".join((model, system.strip(), text)).encode()).hexdigest()
+    return f"llm:{digest}"
+
+
+def _llm_redis(client):
+    return client if LLM_CACHE_REDIS else None
+
+
+def _llm_hit(key, value, tier):
+    _count(tier, stats=_llm_stats)
+    if tier == "l2_hits":
+        _llm_l1.set(key, value)
+    return value
+
+
+def _llm_cacheable(response):
+    if not response:
+        return False
+    if len(response) > LLM_CACHE_MAX_CHARS:
+        _count("too_large", stats=_llm_stats)
+        return False
+    _count("stores", stats=_llm_stats)
+    return True
+
+
+def get_cached_llm(key):
+    """A cached completion for llm_cache_key(...), or None."""
+    value = _llm_l1.get(key, count=False)
+    if value is not None:
+        return _llm_hit(key, value, "l1_hits")
+    redis_client = _llm_redis(get_redis())
+    if redis_client:
+        try:
+            value = redis_client.get(key)
+            if value is not None:
+                return _llm_hit(key, value, "l2_hits")
+        except redis.ConnectionError as e:
+            _mark_down(e)
+        except:
+            pass
+    _count("misses", stats=_llm_stats)
+    return None
+
+def cache_llm(key, response):
+    if not _llm_cacheable(response): return
+    _llm_l1.set(key, response)
+    redis_client = _llm_redis(get_redis())
+    if not redis_client: return
+    try:
+        redis_client.setex(key, LLM_CACHE_TTL_SECONDS, response)
+    except redis.ConnectionError as e:
+        _mark_down(e)
+    except Exception as e:
+        print(f"[Cache Error] Could not cache LLM response: {e}")
+
+def llm_cache_stats():
+    with _stats_lock:
+        stats = dict(_llm_stats)
+    lookups = stats["l1_hits"] + stats["l2_hits"] + stats["misses"]
+    stats["hit_rate"] = round((lookups - stats["misses"]) / lookups, 3) if lookups else 0.0
+    l1 = _llm_l1.stats()
+    stats["l1"] = {k: l1[k] for k in ("entries", "max_entries", "ttl_seconds", "evictions", "expirations")}
+    stats["enabled"], stats["redis"] = LLM_CACHE_ENABLED, LLM_CACHE_REDIS
+    return stats
+
+# --- ASYNC VARIANTS (redis.asyncio) ---
+
+async def get_session_async(session_id, backend=None):
+    redis_client = _redis_for_sessions(get_async_redis, backend)
+    key = f"session:{session_id}"
+    try:
+        stored, data, legacy = None, None, False
+        if redis_client:
+            try:
+                stored = await redis_client.hgetall(key)
+            except redis.ResponseError:  # written by an older build
+                stored, legacy = {}, True
+                data = json.loads(await redis_client.get(key) or "{}")
+            except redis.ConnectionError as e:
+                _mark_down(e)
+        if stored is None:
+            stored = local_sessions.get(session_id) or {}
+        if data is None:
+            data = {k: json.loads(v) for k, v in stored.items()}
+        refs = _session_refs(data)
+        if refs:
+            _hydrate(data, await _products_by_id_async(refs))
+        return Session(data, stored, legacy)
+    except:
+        return {}
+
+async def save_session_async(session_id, session_data, backend=None):
+    redis_client = _redis_for_sessions(get_async_redis, backend)
+    try:
+        encoded, changed, removed, rewrite = _session_delta(session_data)
+        if redis_client:
+            try:
+                async with redis_client.pipeline() as pipe:
+                    _queue_save(pipe, f"session:{session_id}", changed, removed, rewrite)
+                    await pipe.execute()
+                return _saved(session_data, encoded)
+            except redis.ConnectionError as e:
+                _mark_down(e)
+        local_sessions.put(session_id, encoded)
+        _saved(session_data, encoded)
+    except Exception as e:
+        print(f"[Cache Error] Could not save session: {e}")
+
+async def get_cached_product_async(product_name):
+    key = _product_key(product_name)
+    value = _l1_get(key)
+    if value is not None:
+        return value
+    redis_client = get_async_redis()
+    if not redis_client:
+        _count("misses")
+        return None
+    try:
+        return _from_l2(key, await redis_client.get(key))
+    except redis.ConnectionError as e:
+        _mark_down(e)
+    except:
+        pass
+    _count("misses")
+    return None
+
+async def cache_product_async(product_name, product_data):
+    key = _product_key(product_name)
+    _l1_set(key, product_data)
+    redis_client = get_async_redis()
+    if not redis_client: return
+    try:
+        await redis_client.setex(key, PRODUCT_TTL_SECONDS, json.dumps(product_data))
+    except redis.ConnectionError as e:
+        _mark_down(e)
+    except Exception as e:
+        print(f"[Cache Error] Could not cache product: {e}")
+
+async def cache_product_missing_async(product_name):
+    key = _product_key(product_name)
+    _l1_set(key, NOT_FOUND)
+    redis_client = get_async_redis()
+    if not redis_client: return
+    try:
+        await redis_client.setex(key, PRODUCT_NEGATIVE_TTL_SECONDS, json.dumps(NOT_FOUND))
+    except redis.ConnectionError as e:
+        _mark_down(e)
+    except Exception as e:
+        print(f"[Cache Error] Could not cache product: {e}")
+
+async def get_cached_llm_async(key):
+    value = _llm_l1.get(key, count=False)
+    if value is not None:
+        return _llm_hit(key, value, "l1_hits")
+    redis_client = _llm_redis(get_async_redis())
+    if redis_client:
+        try:
+            value = await redis_client.get(key)
+            if value is not None:
+                return _llm_hit(key, value, "l2_hits")
+        except redis.ConnectionError as e:
+            _mark_down(e)
+        except:
+            pass
+    _count("misses", stats=_llm_stats)
+    return None
+
+async def cache_llm_async(key, response):
+    if not _llm_cacheable(response): return
+    _llm_l1.set(key, response)
+    redis_client = _llm_redis(get_async_redis())
     if not redis_client: return
     try:
-        key = f"product_map:{product_name.lower().strip()}"
-        redis_client.setex(key, 3600, json.dumps(product_data))
+        await redis_client.setex(key, LLM_CACHE_TTL_SECONDS, response)
+    except redis.ConnectionError as e:
+        _mark_down(e)
     except Exception as e:
-        print(f"[Cache Error] Could not cache product: {e}")
\ No newline at end of file
+        print(f"[Cache Error] Could not cache LLM response: {e}")
@@ -0,0 +1,184 @@
+import os
+import time
+import asyncio
+import threading
+from typing import Dict, FrozenSet, Iterable, List
+
+from database import categories_col
+from product_index import normalize_name
+
+# -------------------------------------------------------------------
+# Materialized category hierarchy.
+#
+# The whole `categories` collection is loaded into memory and every
+# category name is pre-expanded to itself plus all of its descendants,
+# so resolving "Electronics" -> [categoryIds] needs no DB round trip.
+#
+# Category documents link upwards with `parentId` (a parent's
+# categoryId); `parentCategoryId` is accepted as an alias.
+# -------------------------------------------------------------------
+
+TTL_SECONDS = float(os.getenv("CATEGORY_TREE_TTL_SECONDS", 300))
+WATCH_CHANGES = os.getenv("CATEGORY_TREE_WATCH", "false").lower() in ("1", "true", "yes")
+
+# Used only for parent names that have no document of their own and no
+# linked children in the collection (older datasets stored leaves only).
+LEGACY_PARENT_MAP = {
+    "Apparel": ["T-Shirts"],
+    "Sportswear": ["Footwear"],
+    "Electronics": ["Smartphones", "Laptops"],
+}
+
+
+class CategoryTree:
+    """
+    Immutable snapshot: normalized name -> categoryIds (self + descendants),
+    and the same keyed by categoryId.
+    """
+
+    def __init__(self, docs: List[dict]):
+        by_name: Dict[str, str] = {}
+        children: Dict[str, List[str]] = {}
+
+        for doc in docs:
+            cat_id = doc.get("categoryId")
+            if not cat_id:
+                continue
+            by_name.setdefault(normalize_name(doc.get("name", "")), cat_id)
+            parent = doc.get("parentId") or doc.get("parentCategoryId")
+            if parent:
+                children.setdefault(parent, []).append(cat_id)
+
+        by_id = {cat_id: self._descendants(cat_id, children) for cat_id in {*by_name.values(), *children}}
+        expanded: Dict[str, List[str]] = {name: by_id[cat_id] for name, cat_id in by_name.items()}
+
+        for parent, child_names in LEGACY_PARENT_MAP.items():
+            key = normalize_name(parent)
+            if key in expanded:
+                continue
+            ids = []
+            for child in child_names:
+                ids.extend(expanded.get(normalize_name(child), []))
+            if ids:
+                expanded[key] = list(dict.fromkeys(ids))
+
+        self.expanded = expanded
+        self.by_id = by_id
+        self.size = len(by_name)
+        self.loaded_at = time.time()
+
+    @staticmethod
+    def _descendants(root: str, children: Dict[str, List[str]]) -> List[str]:
+        out, stack, seen = [], [root], set()
+        while stack:
+            cat_id = stack.pop()
+            if cat_id in seen:  # tolerate cycles in bad data
+                continue
+            seen.add(cat_id)
+            out.append(cat_id)
+            stack.extend(reversed(children.get(cat_id, [])))
+        return out
+
+    def resolve(self, category_name: str) -> List[str]:
+        return list(self.expanded.get(normalize_name(category_name), []))
+
+    def descendants(self, category: str) -> List[str]:
+        """categoryId or name -> categoryIds of it and its descendants ([] if unknown)."""
+        return list(self.by_id.get(category) or self.resolve(category))
+
+
+# -------------------------------------------------------------------
+# Shared snapshot (swapped atomically on reload)
+# -------------------------------------------------------------------
+
+_tree = None
+_stale = True
+_load_lock = threading.Lock()
+_watcher = None
+
+
+def reload() -> CategoryTree:
+    global _tree, _stale
+    docs = list(categories_col.find(
+        {}, {"_id": 0, "categoryId": 1, "name": 1, "parentId": 1, "parentCategoryId": 1}
+    ))
+    tree = CategoryTree(docs)
+    _tree, _stale = tree, False
+    print(f"[Category Tree] Loaded {tree.size} categories")
+    if WATCH_CHANGES:
+        _start_watcher()
+    return tree
+
+
+def invalidate():
+    """Marks the tree stale; the next lookup reloads it."""
+    global _stale
+    _stale = True
+
+
+def get_tree() -> CategoryTree:
+    tree = _tree
+    if tree is not None and not _stale and time.time() - tree.loaded_at < TTL_SECONDS:
+        return tree
+    # One thread reloads; the others keep using the previous snapshot.
+    if not _load_lock.acquire(blocking=tree is None):
+        return tree
+    try:
+        current = _tree
+        if current is None or _stale or time.time() - current.loaded_at >= TTL_SECONDS:
+            return reload()
+        return current
+    except Exception as e:
+        print(f"[Category Tree] ⚠️ Reload failed: {e}")
+        if tree is None:
+            raise
+        return tree
+    finally:
+        _load_lock.release()
+
+
+def resolve_category_ids(category_name: str) -> List[str]:
+    """Category name (parent or leaf) -> categoryIds of it and its descendants."""
+    if not category_name:
+        return []
+    return get_tree().resolve(category_name)
+
+
+def expand_categories(categories: Iterable[str], tree: CategoryTree = None) -> FrozenSet[str]:
+    """
+    categoryIds / names -> the categoryIds they cover, descendants
+    included, so a rule scoped to a parent matches products stored under
+    its leaves. Unknown values are kept as given.
+    """
+    categories = list(categories or ())
+    if not categories:
+        return frozenset()
+    tree = tree or get_tree()
+    return frozenset(cat_id for category in categories for cat_id in (tree.descendants(category) or [category]))
+
+
+async def resolve_category_ids_async(category_name: str) -> List[str]:
+    if not category_name:
+        return []
+    tree = _tree
+    if tree is None or _stale or time.time() - tree.loaded_at >= TTL_SECONDS:
+        tree = await asyncio.to_thread(get_tree)
+    return tree.resolve(category_name)
+
+
+def _start_watcher():
+    """Reload on change via a change stream (replica sets / Atlas only)."""
+    global _watcher
+    if _watcher is not None:
+        return
+
+    def watch():
+        try:
+            with categories_col.watch() as stream:
+                for _ in stream:
+                    invalidate()
+        except Exception as e:
+            print(f"[Category Tree] Change stream unavailable, using TTL only: {e}")
+
+    _watcher = threading.Thread(target=watch, name="category-tree-watch", daemon=True)
+    _watcher.start()
@@ -0,0 +1,328 @@
+import os
+import threading
+from typing import Optional
+
+import certifi
+from dotenv import load_dotenv
+from pymongo import AsyncMongoClient, MongoClient, monitoring
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.collection import Collection
+from pymongo.database import Database
+
+# -------------------------------------------------------------------
+# Shared MongoDB access for every agent.
+#
+# One MongoClient (one pool, one set of monitor threads) per process,
+# created on first use rather than at import time.
+# -------------------------------------------------------------------
+
+load_dotenv()
+
+MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017/")
+DB_NAME = os.getenv("MONGO_DB_NAME", "EY")
+
+MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 50))
+MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 5000))
+SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 10000))
+WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2000))
+
+
+def _tls_enabled() -> bool:
+    """MONGO_TLS=true/false wins; otherwise Atlas (mongodb+srv) URLs use TLS."""
+    flag = os.getenv("MONGO_TLS")
+    if flag is not None:
+        return flag.strip().lower() in ("1", "true", "yes")
+    return MONGO_URL.startswith("mongodb+srv://")
+
+
+# -------------------------------------------------------------------
+# Pool utilization (fed by pymongo's CMAP events)
+# -------------------------------------------------------------------
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Counts connections and checkouts so the pool can be sized from data."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open = 0
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.created = 0
+        self.closed = 0
+
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_check_out_started(self, event): pass
+    def connection_ready(self, event): pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+            self.created += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open -= 1
+            self.closed += 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checked_out += 1
+            self.checkouts += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "max_pool_size": MAX_POOL_SIZE,
+                "open": self.open,
+                "in_use": self.checked_out,
+                "peak_in_use": self.peak_checked_out,
+                "utilization": round(self.checked_out / MAX_POOL_SIZE, 3) if MAX_POOL_SIZE else 0.0,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "connections_created": self.created,
+                "connections_closed": self.closed,
+            }
+
+
+# One listener per client: the sync and async clients have separate pools.
+_pool_stats = PoolStats()
+_async_pool_stats = PoolStats()
+_client: Optional[MongoClient] = None
+_async_client: Optional[AsyncMongoClient] = None
+_client_lock = threading.Lock()
+
+
+# -------------------------------------------------------------------
+# Client / DB / Collection access
+# -------------------------------------------------------------------
+
+def _client_options(listener: PoolStats) -> dict:
+    options = {
+        "maxPoolSize": MAX_POOL_SIZE,
+        "minPoolSize": MIN_POOL_SIZE,
+        "serverSelectionTimeoutMS": SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": SOCKET_TIMEOUT_MS,
+        "waitQueueTimeoutMS": WAIT_QUEUE_TIMEOUT_MS,
+        "event_listeners": [listener],
+        "appname": "omnichannel-sales-agent",
+    }
+    if _tls_enabled():
+        options["tls"] = True
+        options["tlsCAFile"] = certifi.where()
+    return options
+
+
+def get_client() -> MongoClient:
+    """Returns the process-wide client, creating it on first call."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MongoClient(MONGO_URL, **_client_options(_pool_stats))
+                print(f"[Database] MongoDB pool ready (db={DB_NAME}, maxPoolSize={MAX_POOL_SIZE})")
+    return _client
+
+
+def get_async_client() -> AsyncMongoClient:
+    """
+    Process-wide asyncio client for the async chat pipeline. It has its
+    own pool (same settings) and binds to the event loop on first use.
+    """
+    global _async_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                _async_client = AsyncMongoClient(MONGO_URL, **_client_options(_async_pool_stats))
+                print(f"[Database] Async MongoDB pool ready (db={DB_NAME}, maxPoolSize={MAX_POOL_SIZE})")
+    return _async_client
+
+
+def get_db() -> Database:
+    return get_client()[DB_NAME]
+
+
+def get_collection(name: str) -> Collection:
+    return get_db()[name]
+
+
+def get_async_collection(name: str) -> AsyncCollection:
+    return get_async_client()[DB_NAME][name]
+
+
+def ping() -> bool:
+    """Readiness check: True if the primary answers PING."""
+    try:
+        get_client().admin.command("ping")
+        return True
+    except Exception as e:
+        print(f"[Database] ⚠️ MongoDB not ready: {e}")
+        return False
+
+
+def pool_stats() -> dict:
+    """Current utilization of this process's sync and async pools."""
+    return {"sync": _pool_stats.snapshot(), "async": _async_pool_stats.snapshot()}
+
+
+def close_client():
+    """Closes the shared sync client (e.g. on worker shutdown)."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+async def close_async_client():
+    global _async_client
+    client, _async_client = _async_client, None
+    if client is not None:
+        await client.close()
+
+
+# -------------------------------------------------------------------
+# Multi-document transactions
+#
+# Replica sets and sharded clusters (Atlas included) run transactions;
+# a standalone mongod does not. There the callback runs without a
+# session, so its writes are not atomic (a warning is logged once).
+# MONGO_TRANSACTIONS=true/false skips the detection.
+# -------------------------------------------------------------------
+
+_transactions: Optional[bool] = None
+
+
+def start_session():
+    return get_client().start_session()
+
+
+def start_async_session():
+    return get_async_client().start_session()
+
+
+def _supports_transactions(hello: dict) -> bool:
+    global _transactions
+    _transactions = "setName" in hello or hello.get("msg") == "isdbgrid"
+    if not _transactions:
+        print("[Database] ⚠️ Standalone MongoDB: multi-document writes will not be atomic")
+    return _transactions
+
+
+def _transactions_flag() -> Optional[bool]:
+    flag = os.getenv("MONGO_TRANSACTIONS")
+    return None if flag is None else flag.strip().lower() in ("1", "true", "yes")
+
+
+def transactions_supported() -> bool:
+    global _transactions
+    if _transactions is None:
+        _transactions = _transactions_flag()
+    if _transactions is None:
+        return _supports_transactions(get_client().admin.command("hello"))
+    return _transactions
+
+
+async def transactions_supported_async() -> bool:
+    global _transactions
+    if _transactions is None:
+        _transactions = _transactions_flag()
+    if _transactions is None:
+        return _supports_transactions(await get_async_client().admin.command("hello"))
+    return _transactions
+
+
+def run_in_transaction(callback):
+    """
+    Runs callback(session) in one transaction and returns its result.
+    pymongo retries the callback on transient errors, so it must only
+    write through `session`. Gets session=None without transactions.
+    """
+    if not transactions_supported():
+        return callback(None)
+    with start_session() as session:
+        return session.with_transaction(callback)
+
+
+async def run_in_transaction_async(callback):
+    """Async twin of run_in_transaction (callback is a coroutine function)."""
+    if not await transactions_supported_async():
+        return await callback(None)
+    async with start_async_session() as session:
+        return await session.with_transaction(callback)
+
+
+class LazyCollection:
+    """
+    Module-level collection handle that binds to the shared client on
+    first attribute access, so importing an agent never opens a socket.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def get(self) -> Collection:
+        return get_collection(self.name)
+
+    def __getattr__(self, attr):
+        return getattr(get_collection(self.name), attr)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({DB_NAME}.{self.name})"
+
+
+class AsyncLazyCollection(LazyCollection):
+    """Same as LazyCollection, bound to the asyncio client."""
+
+    def get(self) -> AsyncCollection:
+        return get_async_collection(self.name)
+
+    def __getattr__(self, attr):
+        return getattr(get_async_collection(self.name), attr)
+
+
+# -------------------------------------------------------------------
+# Collection handles used by the agents
+# -------------------------------------------------------------------
+
+products_col = LazyCollection("products")
+categories_col = LazyCollection("categories")
+inventory_col = LazyCollection("inventory")
+orders_col = LazyCollection("orders")
+stores_col = LazyCollection("stores")
+payments_col = LazyCollection("payments")
+pos_col = LazyCollection("pos_transactions")
+promotions_col = LazyCollection("promotions")
+loyalty_col = LazyCollection("loyalty_accounts")
+feedback_col = LazyCollection("feedback")
+reservations_col = LazyCollection("reservations")
+stock_shards_col = LazyCollection("stock_shards")
+idempotency_col = LazyCollection("idempotency_keys")
+
+# asyncio handles (async chat pipeline)
+aproducts_col = AsyncLazyCollection("products")
+ainventory_col = AsyncLazyCollection("inventory")
+aorders_col = AsyncLazyCollection("orders")
+apayments_col = AsyncLazyCollection("payments")
+apromotions_col = AsyncLazyCollection("promotions")
+aloyalty_col = AsyncLazyCollection("loyalty_accounts")
+afeedback_col = AsyncLazyCollection("feedback")
+areservations_col = AsyncLazyCollection("reservations")
+astock_shards_col = AsyncLazyCollection("stock_shards")
+aidempotency_col = AsyncLazyCollection("idempotency_keys")
@@ -1,28 +1,10 @@
-import os
 import uuid
 import datetime
 from langchain.tools import tool
-from pymongo import MongoClient
-from dotenv import load_dotenv
-
-# -------------------------------------------------------------------
-# ENV + DB CONNECTION
-# -------------------------------------------------------------------
-
-load_dotenv()
-
-MONGO_URL = os.getenv("MONGO_URL")
-
-client = MongoClient(MONGO_URL)
-db = client["EY"]
-
-products_col = db["products"]
-inventory_col = db["inventory"]
-orders_col = db["orders"]
-stores_col = db["stores"]
-
-print("[Fulfillment Agent] Connected to MongoDB")
-print("[Fulfillment Agent] Using DB: EY")
+from database import orders_col, aorders_col
+from product_index import find_product, find_product_async
+import reservations
+from results import OrderResult
 
 # -------------------------------------------------------------------
 # HELPERS
@@ -31,6 +13,58 @@ print("[Fulfillment Agent] Using DB: EY")
 def generate_order_id():
     return f"ORD-{uuid.uuid4().hex[:8].upper()}"
 
+def _location_hint(fulfillment_type, location_query):
+    """Which stock location to reserve from first."""
+    if fulfillment_type.upper() in ("DELIVERY", "SHIP", "ONLINE"):
+        return "ONLINE"
+    return location_query
+
+def _new_order(order_id, product, quantity, fulfillment_type, location_query, hold):
+    """Order document for one product line (shared by sync/async paths)."""
+    return {
+        "orderId": order_id,
+        "customerId": "CUST_GUEST",
+        "items": [{
+            "productId": product["productId"],
+            "name": product["name"],
+            "qty": quantity,
+            "price": product["price"]
+        }],
+        "totalAmount": product["price"] * quantity,
+        "status": "CONFIRMED",
+        "fulfillment": {
+            "type": fulfillment_type.upper(),
+            "location": location_query,
+            "locationId": hold["locationId"]  # where the units were reserved
+        },
+        "holdExpiresAt": hold["expiresAt"],
+        "orderDate": datetime.datetime.now()
+    }
+
+
+def _valid_quantity(quantity) -> bool:
+    return isinstance(quantity, int) and not isinstance(quantity, bool) and quantity >= 1
+
+
+def _order_result(order):
+    item = order["items"][0]
+    fulfillment = order["fulfillment"]
+    return OrderResult(
+        order_id=order["orderId"],
+        product_id=item["productId"],
+        product_name=item["name"],
+        quantity=item["qty"],
+        total=order["totalAmount"],
+        fulfillment_type=fulfillment["type"],
+        location=fulfillment["location"],
+        location_id=fulfillment["locationId"],
+        hold_expires_at=order["holdExpiresAt"]
+    )
+
+PRODUCT_NOT_FOUND = "❌ Order Failed: Product not found."
+INVALID_QUANTITY = "❌ Order Failed: Quantity must be a whole number of at least 1."
+OUT_OF_STOCK = "❌ Order Failed: Not enough stock to reserve."
+
 # -------------------------------------------------------------------
 # LANGCHAIN TOOL
 # -------------------------------------------------------------------
@@ -46,40 +80,60 @@ def place_order(
     Places an order, reserves inventory, and creates an order record.
     """
 
-    product = products_col.find_one(
-        {"name": {"$regex": product_name, "$options": "i"}}
-    )
+    if not _valid_quantity(quantity):
+        return OrderResult(error=INVALID_QUANTITY)
+
+    product = find_product(product_name)
 
     if not product:
-        return "❌ Order Failed: Product not found."
+        return OrderResult(error=PRODUCT_NOT_FOUND)
 
     order_id = generate_order_id()
-    total_price = product["price"] * quantity
+    hold = reservations.reserve(product["productId"], quantity, order_id,
+                                _location_hint(fulfillment_type, location_query))
+    if not hold:
+        return OrderResult(error=OUT_OF_STOCK)
 
-    orders_col.insert_one({
-        "orderId": order_id,
-        "customerId": "CUST_GUEST",
-        "items": [{
-            "productId": product["productId"],
-            "name": product["name"],
-            "qty": quantity,
-            "price": product["price"]
-        }],
-        "totalAmount": total_price,
-        "status": "CONFIRMED",
-        "fulfillment": {
-            "type": fulfillment_type.upper(),
-            "location": location_query
-        },
-        "orderDate": datetime.datetime.now()
-    })
+    order = _new_order(order_id, product, quantity, fulfillment_type, location_query, hold)
+    try:
+        orders_col.insert_one(order)
+    except Exception:
+        reservations.release(order_id)
+        raise
 
-    return (
-        f"📦 ORDER CONFIRMED\n"
-        f"Order ID: {order_id}\n"
-        f"Total: ₹{total_price}\n"
-        f"Next step: Payment"
-    )
+    return _order_result(order)
+
+
+async def place_order_async(
+    product_name: str,
+    quantity: int,
+    fulfillment_type: str,
+    location_query: str = "Mall"
+):
+    """Async twin of place_order for the async chat pipeline."""
+
+    if not _valid_quantity(quantity):
+        return OrderResult(error=INVALID_QUANTITY)
+
+    product = await find_product_async(product_name)
+
+    if not product:
+        return OrderResult(error=PRODUCT_NOT_FOUND)
+
+    order_id = generate_order_id()
+    hold = await reservations.reserve_async(product["productId"], quantity, order_id,
+                                            _location_hint(fulfillment_type, location_query))
+    if not hold:
+        return OrderResult(error=OUT_OF_STOCK)
+
+    order = _new_order(order_id, product, quantity, fulfillment_type, location_query, hold)
+    try:
+        await aorders_col.insert_one(order)
+    except Exception:
+        await reservations.release_async(order_id)
+        raise
+
+    return _order_result(order)
 
 
 # -------------------------------------------------------------------
@@ -0,0 +1,270 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import datetime
+import threading
+from contextlib import contextmanager
+from typing import NamedTuple, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from database import idempotency_col, aidempotency_col
+
+# -------------------------------------------------------------------
+# Idempotency keys.
+#
+# An operation that must not run twice (a payment) first claims its key:
+#
+#   idempotency_keys: {_id: key, scope, fingerprint, status, result,
+#                      createdAt, leaseUntil, expiresAt}
+#
+# The insert is the claim: the unique _id lets exactly one caller in.
+# That caller does the work and stores the result (complete), or drops
+# the claim if it failed before doing anything (abandon). Duplicates
+# wait up to WAIT_SECONDS for the stored result and replay it. A claim
+# whose owner died is taken over once its lease runs out; the owner
+# keeps renewing the lease while it works (leased), so a slow gateway
+# call is not mistaken for a dead owner.
+#
+# The key is bound to the request it was claimed for (`fingerprint`, a
+# hash of the payload): reusing it for a different request is refused
+# (Claim.conflict) instead of replaying an unrelated result.
+#
+# Keys are kept in MongoDB rather than Redis because the stored result
+# must outlive a Redis flush as long as the payment record it describes.
+#
+# Indexes: idempotency_keys {expiresAt} with expireAfterSeconds: 0, so
+# MongoDB deletes a key once it expires (ensure_indexes, on app startup).
+# -------------------------------------------------------------------
+
+LEASE_SECONDS = float(os.getenv("IDEMPOTENCY_LEASE_SECONDS", 60))
+WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", 5))
+POLL_SECONDS = 0.05
+TTL_HOURS = int(os.getenv("IDEMPOTENCY_TTL_HOURS", 24))
+
+IN_PROGRESS, DONE = "IN_PROGRESS", "DONE"
+
+
+class Claim(NamedTuple):
+    owned: bool                    # this caller must do the work
+    result: Optional[dict] = None  # stored result of a finished duplicate
+    conflict: bool = False         # the key was claimed for a different payload
+
+
+_stats = {"claimed": 0, "replayed": 0, "waited": 0, "taken_over": 0, "in_progress": 0, "abandoned": 0,
+          "conflicts": 0, "renewals": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name, n=1):
+    with _stats_lock:
+        _stats[name] += n
+
+
+def idempotency_stats() -> dict:
+    with _stats_lock:
+        return dict(_stats)
+
+# -------------------------------------------------------------------
+# HELPERS (shared by the sync and async paths)
+# -------------------------------------------------------------------
+
+def fingerprint(payload: dict) -> str:
+    """Stable hash of a request payload (key order does not matter)."""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _key_doc(key, scope, fp) -> dict:
+    now = datetime.datetime.now()
+    return {
+        "_id": key,
+        "scope": scope,
+        "fingerprint": fp,
+        "status": IN_PROGRESS,
+        "result": None,
+        "createdAt": now,
+        "leaseUntil": now + datetime.timedelta(seconds=LEASE_SECONDS),
+        "expiresAt": now + datetime.timedelta(hours=TTL_HOURS),
+    }
+
+
+def _takeover() -> tuple:
+    """(filter extra, update) that re-claims an IN_PROGRESS key past its lease."""
+    now = datetime.datetime.now()
+    return (
+        {"status": IN_PROGRESS, "leaseUntil": {"$lt": now}},
+        {"$set": {"leaseUntil": now + datetime.timedelta(seconds=LEASE_SECONDS)}},
+    )
+
+
+def _conflicts(doc, fp) -> bool:
+    """True if `doc` was claimed for another payload (keys without one match anything)."""
+    return bool(doc and fp and doc.get("fingerprint") and doc["fingerprint"] != fp)
+
+
+def _renew() -> dict:
+    return {"$set": {"leaseUntil": datetime.datetime.now() + datetime.timedelta(seconds=LEASE_SECONDS)}}
+
+
+def _done_update(result) -> dict:
+    return {"$set": {"status": DONE, "result": result, "completedAt": datetime.datetime.now()}}
+
+
+def _settled(doc, waited) -> Optional[Claim]:
+    if doc is None:  # abandoned by its owner: the caller claims again
+        return None
+    if doc["status"] == DONE:
+        _count("waited" if waited else "replayed")
+        return Claim(False, doc["result"])
+    return None
+
+# -------------------------------------------------------------------
+# SYNC
+# -------------------------------------------------------------------
+
+def claim(key: str, scope: str, fp: Optional[str] = None) -> Claim:
+    """
+    Claims `key` for the request with fingerprint `fp`. Returns
+    Claim(owned=True) if this caller must do the work, Claim(False,
+    result) with the stored result of a finished duplicate, Claim(False)
+    if a duplicate is still running after WAIT_SECONDS, or
+    Claim(False, conflict=True) if the key belongs to another request.
+    """
+    deadline = time.monotonic() + WAIT_SECONDS
+    waited = False
+    while True:
+        try:
+            idempotency_col.insert_one(_key_doc(key, scope, fp))
+            _count("claimed")
+            return Claim(True)
+        except DuplicateKeyError:
+            pass
+
+        if _conflicts(idempotency_col.find_one({"_id": key}, {"fingerprint": 1}), fp):
+            _count("conflicts")
+            return Claim(False, conflict=True)
+
+        flt, update = _takeover()
+        if idempotency_col.find_one_and_update({"_id": key, **flt}, update,
+                                               return_document=ReturnDocument.AFTER):
+            _count("taken_over")
+            return Claim(True)
+
+        while True:
+            doc = idempotency_col.find_one({"_id": key})
+            settled = _settled(doc, waited)
+            if settled or doc is None:
+                break
+            if time.monotonic() >= deadline:
+                _count("in_progress")
+                return Claim(False)
+            waited = True
+            time.sleep(POLL_SECONDS)
+        if settled:
+            return settled
+
+
+def complete(key: str, result: dict):
+    """Stores the result that duplicates of `key` will get."""
+    idempotency_col.update_one({"_id": key}, _done_update(result))
+
+
+def abandon(key: str):
+    """Drops an unfinished claim so a retry does the work again."""
+    idempotency_col.delete_one({"_id": key, "status": IN_PROGRESS})
+    _count("abandoned")
+
+
+def renew(key: str):
+    """Pushes an unfinished claim's lease LEASE_SECONDS into the future."""
+    idempotency_col.update_one({"_id": key, "status": IN_PROGRESS}, _renew())
+    _count("renewals")
+
+
+@contextmanager
+def leased(key: str):
+    """
+    Renews `key`'s lease every LEASE_SECONDS / 3 while the block runs.
+    A background thread does it, so a blocking gateway call in either
+    the sync or the async path cannot starve it.
+    """
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(LEASE_SECONDS / 3):
+            try:
+                renew(key)
+            except Exception as e:
+                print(f"[Idempotency] ⚠️ Could not renew the lease of {key}: {e}")
+
+    thread = threading.Thread(target=loop, name="idempotency-lease", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+
+
+def ensure_indexes():
+    """Creates the expiresAt TTL index. Failures are logged, not raised."""
+    try:
+        idempotency_col.create_index("expiresAt", expireAfterSeconds=0)
+    except Exception as e:
+        print(f"[Idempotency] ⚠️ Could not create the expiresAt TTL index: {e}")
+
+# -------------------------------------------------------------------
+# ASYNC (same logic)
+# -------------------------------------------------------------------
+
+async def claim_async(key: str, scope: str, fp: Optional[str] = None) -> Claim:
+    deadline = time.monotonic() + WAIT_SECONDS
+    waited = False
+    while True:
+        try:
+            await aidempotency_col.insert_one(_key_doc(key, scope, fp))
+            _count("claimed")
+            return Claim(True)
+        except DuplicateKeyError:
+            pass
+
+        if _conflicts(await aidempotency_col.find_one({"_id": key}, {"fingerprint": 1}), fp):
+            _count("conflicts")
+            return Claim(False, conflict=True)
+
+        flt, update = _takeover()
+        if await aidempotency_col.find_one_and_update({"_id": key, **flt}, update,
+                                                      return_document=ReturnDocument.AFTER):
+            _count("taken_over")
+            return Claim(True)
+
+        while True:
+            doc = await aidempotency_col.find_one({"_id": key})
+            settled = _settled(doc, waited)
+            if settled or doc is None:
+                break
+            if time.monotonic() >= deadline:
+                _count("in_progress")
+                return Claim(False)
+            waited = True
+            await asyncio.sleep(POLL_SECONDS)
+        if settled:
+            return settled
+
+
+async def complete_async(key: str, result: dict):
+    await aidempotency_col.update_one({"_id": key}, _done_update(result))
+
+
+async def abandon_async(key: str):
+    await aidempotency_col.delete_one({"_id": key, "status": IN_PROGRESS})
+    _count("abandoned")
+
+
+async def ensure_indexes_async():
+    try:
+        await aidempotency_col.create_index("expiresAt", expireAfterSeconds=0)
+    except Exception as e:
+        print(f"[Idempotency] ⚠️ Could not create the expiresAt TTL index: {e}")
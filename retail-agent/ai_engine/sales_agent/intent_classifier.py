@@ -0,0 +1,134 @@
+import os
+import re
+import zlib
+import threading
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# -------------------------------------------------------------------
+# Local intent classifier.
+#
+# Features are hashed (crc32, stable across processes) word unigrams,
+# word bigrams and character trigrams, L2-normalized. The model is a
+# multinomial logistic regression: one weight row per hashed feature,
+# one column per intent. Scoring a message is a gather-and-sum over its
+# ~30 feature rows, so there is no matrix multiply and no vocabulary.
+#
+# Train / evaluate with train_intent_classifier.py; the result is saved
+# as an .npz file (weights, bias, labels) that loads with one np.load.
+# -------------------------------------------------------------------
+
+N_FEATURES = 2 ** 16
+MODEL_PATH = os.getenv(
+    "INTENT_MODEL_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_model.npz"),
+)
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def features(text: str, n_features: int = N_FEATURES) -> Tuple[np.ndarray, float]:
+    """(hashed feature indices, L2 weight per feature) for one message."""
+    words = _WORD.findall(text.lower())
+    grams = [f"w:{w}" for w in words]
+    grams += [f"b:{a} {b}" for a, b in zip(words, words[1:])]
+    for w in words:
+        padded = f"<{w}>"
+        grams += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    mask = n_features - 1
+    idx = np.fromiter({zlib.crc32(g.encode()) & mask for g in grams}, dtype=np.int64)
+    return idx, (1.0 / np.sqrt(len(idx)) if len(idx) else 0.0)
+
+
+class IntentClassifier:
+    def __init__(self, weights: np.ndarray, bias: np.ndarray, labels: Sequence[str]):
+        self.weights = weights            # (n_features, n_labels) float32
+        self.bias = bias                  # (n_labels,)
+        self.labels = list(labels)
+        self.n_features = weights.shape[0]
+
+    # ---------------- inference ----------------
+
+    def predict_proba(self, text: str) -> np.ndarray:
+        idx, value = features(text, self.n_features)
+        scores = self.weights[idx].sum(axis=0) * value + self.bias
+        scores = np.exp(scores - scores.max())
+        return scores / scores.sum()
+
+    def classify(self, text: str) -> Tuple[str, float]:
+        """(best intent, its probability)."""
+        proba = self.predict_proba(text)
+        best = int(proba.argmax())
+        return self.labels[best], float(proba[best])
+
+    # ---------------- training ----------------
+
+    @classmethod
+    def train(cls, texts: Sequence[str], labels: Sequence[str], label_names: Optional[List[str]] = None,
+              epochs: int = 300, learning_rate: float = 10.0, l2: float = 1e-4,
+              n_features: int = N_FEATURES) -> "IntentClassifier":
+        """Full-batch gradient descent on the softmax loss (small datasets)."""
+        label_names = list(label_names or sorted(set(labels)))
+        y = np.array([label_names.index(label) for label in labels])
+        n, k = len(texts), len(label_names)
+
+        # sparse design matrix as (row, column, value) triples
+        rows, cols, vals = [], [], []
+        for i, text in enumerate(texts):
+            idx, value = features(text, n_features)
+            rows.append(np.full(len(idx), i))
+            cols.append(idx)
+            vals.append(np.full(len(idx), value, dtype=np.float32))
+        rows, cols, vals = np.concatenate(rows), np.concatenate(cols), np.concatenate(vals)
+
+        weights = np.zeros((n_features, k), dtype=np.float32)
+        bias = np.zeros(k, dtype=np.float32)
+        target = np.eye(k, dtype=np.float32)[y]
+        used = np.unique(cols)  # only these rows ever get a gradient
+
+        for _ in range(epochs):
+            scores = np.zeros((n, k), dtype=np.float32)
+            np.add.at(scores, rows, weights[cols] * vals[:, None])
+            scores += bias
+            scores -= scores.max(axis=1, keepdims=True)
+            proba = np.exp(scores)
+            proba /= proba.sum(axis=1, keepdims=True)
+
+            grad = (proba - target) / n
+            grad_w = np.zeros((n_features, k), dtype=np.float32)
+            np.add.at(grad_w, cols, grad[rows] * vals[:, None])
+            weights[used] -= learning_rate * (grad_w[used] + l2 * weights[used])
+            bias -= learning_rate * grad.sum(axis=0)
+
+        return cls(weights, bias, label_names)
+
+    # ---------------- persistence ----------------
+
+    def save(self, path: str = MODEL_PATH):
+        np.savez_compressed(path, weights=self.weights, bias=self.bias, labels=np.array(self.labels))
+
+    @classmethod
+    def load(cls, path: str = MODEL_PATH) -> "IntentClassifier":
+        with np.load(path) as data:
+            return cls(data["weights"], data["bias"], [str(label) for label in data["labels"]])
+
+
+_model = None
+_model_loaded = False
+_model_lock = threading.Lock()
+
+
+def get_model() -> Optional[IntentClassifier]:
+    """The shared model, loaded on first use (None if no model file)."""
+    global _model, _model_loaded
+    if not _model_loaded:
+        with _model_lock:
+            if not _model_loaded:
+                try:
+                    _model = IntentClassifier.load(MODEL_PATH)
+                    print(f"[Intent Classifier] Loaded {MODEL_PATH}")
+                except (OSError, KeyError, ValueError) as e:
+                    print(f"[Intent Classifier] ⚠️ No usable model, using the LLM only: {e}")
+                _model_loaded = True
+    return _model
@@ -1,4 +1,13 @@
-from llm_client import llm
+import os
+import re
+import asyncio
+import weakref
+from typing import List, Optional
+
+import cache
+from llm_client import llm, llm_async, response_cache_key
+from intent_classifier import get_model
+from micro_batcher import MicroBatcher
 
 INTENTS = [
     "PRODUCT_DISCOVERY",
@@ -8,8 +17,21 @@ INTENTS = [
     "POST_PURCHASE"
 ]
 
-def detect_intent(message: str) -> str:
-    prompt = f"""
+# The local classifier answers when it is at least this sure; anything
+# less confident goes to the LLM.
+INTENT_CONFIDENCE = float(os.getenv("INTENT_CONFIDENCE", 0.7))
+
+# Concurrent async classifications that reach the LLM are sent together
+# as one prompt: a batch goes out after INTENT_BATCH_WINDOW_MS or once
+# INTENT_BATCH_MAX messages are waiting, with at most
+# INTENT_BATCH_INFLIGHT batches at the model at once (match the model
+# server's parallelism). INTENT_BATCH_MAX=1 disables batching.
+INTENT_BATCH_WINDOW_MS = float(os.getenv("INTENT_BATCH_WINDOW_MS", 5))
+INTENT_BATCH_MAX = int(os.getenv("INTENT_BATCH_MAX", 16))
+INTENT_BATCH_INFLIGHT = int(os.getenv("INTENT_BATCH_INFLIGHT", 2))
+
+def _prompt(message: str) -> str:
+    return f"""
 Classify the customer's intent into ONE of the following:
 {", ".join(INTENTS)}
 
@@ -18,5 +40,110 @@ Customer message:
 
 Return ONLY the intent name.
 """
-    intent = llm(prompt)
-    return intent if intent in INTENTS else "PRODUCT_DISCOVERY"
+
+def _batch_prompt(messages: List[str]) -> str:
+    numbered = "\n".join(f'{i}. "{m}"' for i, m in enumerate(messages, 1))
+    return f"""
+Classify each customer message's intent into ONE of the following:
+{", ".join(INTENTS)}
+
+Customer messages:
+{numbered}
+
+Return ONLY one line per message, in order, formatted as <number>: <intent name>.
+"""
+
+_BATCH_LINE = re.compile(r"^\s*(\d+)\s*[:.)-]\s*\**([A-Z_]+)", re.MULTILINE)
+_INTENT_NAME = re.compile(r"(?<![A-Z])(" + "|".join(INTENTS) + r")(?![A-Z])")
+
+def _to_intent(reply: Optional[str]) -> Optional[str]:
+    """The intent an LLM reply names ("buy now.", "Intent: BUY_NOW"), or None."""
+    if not reply:
+        return None
+    match = _INTENT_NAME.search(re.sub(r"[\s-]+", "_", reply.strip().upper()))
+    return match.group(1) if match else None
+
+def _parse_batch(response: str, n: int) -> List[Optional[str]]:
+    """Labels by message number; None where the model skipped or garbled one."""
+    labels: List[Optional[str]] = [None] * n
+    for number, intent in _BATCH_LINE.findall(response):
+        i = int(number) - 1
+        if 0 <= i < n and intent in INTENTS and labels[i] is None:
+            labels[i] = intent
+    return labels
+
+async def _classify_batch(messages: List[str]) -> List[Optional[str]]:
+    if len(messages) == 1:
+        return [_to_intent(await llm_async(_prompt(messages[0]), use_cache=False))]
+    labels = _parse_batch(await llm_async(_batch_prompt(messages), use_cache=False), len(messages))
+    for i, label in enumerate(labels):
+        if label is None:  # ask again on its own
+            labels[i] = _to_intent(await llm_async(_prompt(messages[i]), use_cache=False))
+    return labels
+
+# A MicroBatcher's pending futures and flush timer belong to one event
+# loop, so each loop gets its own, created on first use.
+_batchers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, MicroBatcher]" = weakref.WeakKeyDictionary()
+_last_batcher: Optional[MicroBatcher] = None
+
+def _batcher() -> MicroBatcher:
+    global _last_batcher
+    loop = asyncio.get_running_loop()
+    batcher = _batchers.get(loop)
+    if batcher is None:
+        batcher = _batchers[loop] = MicroBatcher(
+            _classify_batch, window=INTENT_BATCH_WINDOW_MS / 1000,
+            max_size=INTENT_BATCH_MAX, max_inflight=INTENT_BATCH_INFLIGHT,
+        )
+        _last_batcher = batcher
+    return batcher
+
+def batching_stats() -> dict:
+    """Batch-size and queueing-delay histograms of the async LLM path (latest event loop)."""
+    batcher = _last_batcher or MicroBatcher(_classify_batch, window=INTENT_BATCH_WINDOW_MS / 1000,
+                                            max_size=INTENT_BATCH_MAX, max_inflight=INTENT_BATCH_INFLIGHT)
+    return batcher.stats()
+
+# The LLM paths share llm()'s response-cache entries for _prompt(message),
+# but store the intent only once it is known to be valid: a reply that
+# names no intent is neither cached nor returned.
+
+def _llm_intent(message: str) -> Optional[str]:
+    key = response_cache_key(_prompt(message))
+    if key:
+        cached = _to_intent(cache.get_cached_llm(key))
+        if cached:
+            return cached
+    intent = _to_intent(llm(_prompt(message), use_cache=False))
+    if key and intent:
+        cache.cache_llm(key, intent)
+    return intent
+
+async def _llm_intent_async(message: str) -> Optional[str]:
+    key = response_cache_key(_prompt(message))
+    if key:
+        cached = _to_intent(await cache.get_cached_llm_async(key))
+        if cached:
+            return cached
+    if INTENT_BATCH_MAX > 1:
+        intent = await _batcher().submit(message)
+    else:
+        intent = _to_intent(await llm_async(_prompt(message), use_cache=False))
+    if key and intent:
+        await cache.cache_llm_async(key, intent)
+    return intent
+
+def classify_local(message: str) -> Optional[str]:
+    """Intent from the local classifier, or None if it is not confident."""
+    model = get_model()
+    if model is None:
+        return None
+    intent, confidence = model.classify(message)
+    return intent if confidence >= INTENT_CONFIDENCE and intent in INTENTS else None
+
+def detect_intent(message: str) -> str:
+    return classify_local(message) or _llm_intent(message) or "PRODUCT_DISCOVERY"
+
+
+async def detect_intent_async(message: str) -> str:
+    return classify_local(message) or await _llm_intent_async(message) or "PRODUCT_DISCOVERY"
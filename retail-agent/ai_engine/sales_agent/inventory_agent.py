@@ -1,28 +1,65 @@
-import os
-import certifi
-from pymongo import MongoClient
-from dotenv import load_dotenv
-from cache import get_cached_product, cache_product  # <--- NEW IMPORT
-
-load_dotenv()
-
-MONGO_URL = os.getenv("MONGO_URL")
-DB_NAME = os.getenv("MONGO_DB_NAME", "EY")
+import asyncio
+from typing import List, Union
+from cache import get_cached_product, cache_product, cache_product_missing, NOT_FOUND
+from cache import get_cached_product_async, cache_product_async, cache_product_missing_async
+from database import inventory_col, ainventory_col, products_col, aproducts_col
+from product_index import find_product, find_product_async
+import product_index
+import reservations
+import stock
 
 # -------------------------------------------------------------------
-# MongoDB Connection
+# HELPERS
 # -------------------------------------------------------------------
 
-client = MongoClient(
-    MONGO_URL,
-    serverSelectionTimeoutMS=5000,
-    tls=True,
-    tlsCAFile=certifi.where()
-)
+def _availability_result(inventory, real_name, price, shard_stock=()) -> dict:
+    """
+    Builds the agent's response from an inventory document (or None)
+    plus the units split off into sub-counters (reservations.shard_stock).
+    """
+    if not inventory:
+        return {
+            "availability": {
+                "status": "out_of_stock",
+                "total_qty": 0,
+                "name": real_name,
+                "price": price,
+                "locations": {},
+                "regions": {}
+            },
+            "store": "Omnichannel"
+        }
+
+    # Totals are maintained on write (stock.py): no summing here.
+    total_qty = stock.total_qty(inventory)
 
-db = client[DB_NAME]
-products_col = db["products"]
-inventory_col = db["inventory"]
+    # PARSE LOCATIONS (absent when only the totals were projected)
+    location_breakdown = {
+        entry.get("locationId", "UNKNOWN"): int(entry.get("qty", 0))
+        for entry in inventory.get("stockByLocation", [])
+    }
+    regions = dict(inventory.get("regionQty", {}))
+
+    # Hot SKUs: units split off into sub-counters are still for sale
+    for shard in shard_stock:
+        qty = int(shard.get("qty", 0))
+        total_qty += qty
+        if location_breakdown:
+            location_breakdown[shard["locationId"]] = location_breakdown.get(shard["locationId"], 0) + qty
+        region = shard.get("region", stock.DEFAULT_REGION)
+        regions[region] = regions.get(region, 0) + qty
+
+    return {
+        "availability": {
+            "status": "in_stock" if total_qty > 0 else "out_of_stock",
+            "total_qty": total_qty,
+            "name": real_name,
+            "price": price,
+            "locations": location_breakdown,
+            "regions": regions
+        },
+        "store": "Omnichannel"
+    }
 
 # -------------------------------------------------------------------
 # CORE LOGIC
@@ -42,7 +79,11 @@ def inventory_agent_run(payload: dict) -> dict:
         # ⚡ STEP 1: CHECK REDIS CACHE
         # We try to get the ID and Price directly from memory to skip 1 DB call
         cached_data = get_cached_product(product_name)
-        
+
+        if cached_data is NOT_FOUND:
+            print(f"[Inventory] 🚀 Cached miss for '{product_name}'")
+            return {"availability": {"status": "not_found"}, "store": "N/A"}
+
         if cached_data:
             print(f"[Inventory] 🚀 Cache Hit for '{product_name}'")
             product_id = cached_data["productId"]
@@ -52,11 +93,11 @@ def inventory_agent_run(payload: dict) -> dict:
         else:
             # 🐢 STEP 1.5: DB LOOKUP (Only if not in cache)
             print(f"[Inventory] 🐢 Cache Miss. Querying DB for '{product_name}'")
-            product = products_col.find_one(
-                {"name": {"$regex": product_name, "$options": "i"}}
-            )
+            product = find_product(product_name)
 
             if not product:
+                if product_index.is_fresh():  # a failed index refresh is not a miss
+                    cache_product_missing(product_name)
                 return {"availability": {"status": "not_found"}, "store": "N/A"}
 
             product_id = product.get("productId")
@@ -72,46 +113,166 @@ def inventory_agent_run(payload: dict) -> dict:
 
         # STEP 2: FIND INVENTORY (Always check DB for stock as it changes fast)
         inventory = inventory_col.find_one({"productId": product_id})
+        shards = reservations.shard_stock(reservations.sharded_ids([inventory]))
 
-        if not inventory:
-            return {
-                "availability": {
-                    "status": "out_of_stock",
-                    "total_qty": 0,
-                    "name": real_name,
-                    "price": price,
-                    "locations": {}
-                },
-                "store": "Omnichannel"
-            }
-
-        # STEP 3: PARSE LOCATIONS
-        stock_data = inventory.get("stockByLocation", [])
-        total_qty = 0
-        location_breakdown = {}
-
-        for entry in stock_data:
-            qty = int(entry.get("qty", 0))
-            loc = entry.get("locationId", "UNKNOWN")
-            total_qty += qty
-            location_breakdown[loc] = qty
+        return _availability_result(inventory, real_name, price, shards.get(product_id, ()))
 
-        return {
-            "availability": {
-                "status": "in_stock" if total_qty > 0 else "out_of_stock",
-                "total_qty": total_qty,
-                "name": real_name,
+    except Exception as e:
+        print("[Inventory Agent ERROR]:", e)
+        return {"availability": {"status": "error", "reason": str(e)}, "store": "Error"}
+
+async def inventory_agent_run_async(payload: dict) -> dict:
+    """Async twin of inventory_agent_run (redis.asyncio + async Mongo driver)."""
+    product_name = payload.get("product_name")
+
+    if not product_name:
+        return {"availability": {"status": "error", "reason": "No product provided"}, "store": "N/A"}
+
+    try:
+        cached_data = await get_cached_product_async(product_name)
+
+        if cached_data is NOT_FOUND:
+            return {"availability": {"status": "not_found"}, "store": "N/A"}
+
+        if cached_data:
+            product_id = cached_data["productId"]
+            price = cached_data["price"]
+            real_name = cached_data["name"]
+        else:
+            product = await find_product_async(product_name)
+            if not product:
+                if product_index.is_fresh():
+                    await cache_product_missing_async(product_name)
+                return {"availability": {"status": "not_found"}, "store": "N/A"}
+
+            product_id = product.get("productId")
+            price = product.get("price")
+            real_name = product.get("name")
+
+            await cache_product_async(product_name, {
+                "productId": product_id,
                 "price": price,
-                "locations": location_breakdown
-            },
-            "store": "Omnichannel"
-        }
+                "name": real_name
+            })
+
+        inventory = await ainventory_col.find_one({"productId": product_id})
+        shards = await reservations.shard_stock_async(reservations.sharded_ids([inventory]))
+
+        return _availability_result(inventory, real_name, price, shards.get(product_id, ()))
 
     except Exception as e:
         print("[Inventory Agent ERROR]:", e)
         return {"availability": {"status": "error", "reason": str(e)}, "store": "Error"}
 
+# -------------------------------------------------------------------
+# BATCH LOOKUP
+#
+# Availability for a whole list (e.g. every recommendation shown) in at
+# most two queries: one `$in` on products for items we don't already
+# know the name/price of, and one `$in` on inventory (plus one on
+# stock_shards if any of them is a split hot SKU).
+# -------------------------------------------------------------------
+
+_PRODUCT_FIELDS = {"_id": 0, "productId": 1, "name": 1, "price": 1}
+
+
+def _plan_batch(products: List[Union[str, dict]]):
+    """
+    Resolves every item to a productId from memory (product index).
+    Items may be product names, productIds, or product documents.
+    Returns (productId or None per item, {productId: known product doc}).
+    """
+    ids, known = [], {}
+    for item in products:
+        if isinstance(item, dict):
+            pid = item.get("productId")
+            if pid and "name" in item and "price" in item:
+                known[pid] = item
+            if not pid and item.get("name"):
+                pid = next(iter(product_index.product_index.resolve(item["name"], limit=1)), None)
+        elif item in product_index.product_index:
+            pid = item
+        else:
+            pid = next(iter(product_index.product_index.resolve(item or "", limit=1)), None)
+        ids.append(pid)
+    return ids, known
+
+
+def _batch_results(ids, known, inventory_docs, shards) -> List[dict]:
+    by_id = {doc["productId"]: doc for doc in inventory_docs}
+    results = []
+    for pid in ids:
+        product = known.get(pid)
+        if not product:
+            results.append({"availability": {"status": "not_found"}, "store": "N/A"})
+            continue
+        results.append(_availability_result(by_id.get(pid), product.get("name"), product.get("price"),
+                                            shards.get(pid, ())))
+    return results
+
+
+def inventory_agent_run_many(products: List[Union[str, dict]], locations: bool = True) -> List[dict]:
+    """
+    Batch inventory_agent_run: one result per item, in the same order and
+    shape as the single-product call. With locations=False only the
+    precomputed totals are read and "locations" comes back empty.
+    """
+    if not products:
+        return []
+
+    try:
+        product_index.ensure_fresh()
+        ids, known = _plan_batch(products)
+        wanted = list(dict.fromkeys(pid for pid in ids if pid))
+
+        missing = [pid for pid in wanted if pid not in known]
+        if missing:
+            for doc in products_col.find({"productId": {"$in": missing}}, _PRODUCT_FIELDS):
+                known[doc["productId"]] = doc
+
+        projection = None if locations else stock.TOTALS_PROJECTION
+        inventory = list(inventory_col.find({"productId": {"$in": wanted}}, projection)) if wanted else []
+        shards = reservations.shard_stock(reservations.sharded_ids(inventory))
+        print(f"[Inventory] Batch lookup for {len(products)} products")
+        return _batch_results(ids, known, inventory, shards)
+
+    except Exception as e:
+        print("[Inventory Agent ERROR]:", e)
+        return [{"availability": {"status": "error", "reason": str(e)}, "store": "Error"}
+                for _ in products]
+
+
+async def inventory_agent_run_many_async(products: List[Union[str, dict]], locations: bool = True) -> List[dict]:
+    """Async twin of inventory_agent_run_many."""
+    if not products:
+        return []
+
+    try:
+        if product_index.needs_refresh():
+            await asyncio.to_thread(product_index.ensure_fresh)
+        ids, known = _plan_batch(products)
+        wanted = list(dict.fromkeys(pid for pid in ids if pid))
+
+        missing = [pid for pid in wanted if pid not in known]
+        if missing:
+            docs = await aproducts_col.find({"productId": {"$in": missing}}, _PRODUCT_FIELDS).to_list(None)
+            for doc in docs:
+                known[doc["productId"]] = doc
+
+        inventory = []
+        if wanted:
+            projection = None if locations else stock.TOTALS_PROJECTION
+            inventory = await ainventory_col.find({"productId": {"$in": wanted}}, projection).to_list(None)
+        shards = await reservations.shard_stock_async(reservations.sharded_ids(inventory))
+        return _batch_results(ids, known, inventory, shards)
+
+    except Exception as e:
+        print("[Inventory Agent ERROR]:", e)
+        return [{"availability": {"status": "error", "reason": str(e)}, "store": "Error"}
+                for _ in products]
+
 if __name__ == "__main__":
     print("\n[TEST] Inventory Agent\n")
     # Run twice to test cache: First time = Cache Miss, Second time = Cache Hit
-    print(inventory_agent_run({"product_name": "Smartphone A1"}))
\ No newline at end of file
+    print(inventory_agent_run({"product_name": "Smartphone A1"}))
+    print(inventory_agent_run_many(["Smartphone A1", "Laptop X"]))
\ No newline at end of file
@@ -0,0 +1,129 @@
+from collections import deque
+from typing import Dict, Hashable, Iterable, List, Mapping, NamedTuple, Optional, Set
+
+# -------------------------------------------------------------------
+# Multi-keyword matcher (Aho-Corasick).
+#
+# Every keyword of every concept is compiled once into one automaton;
+# a message is then scanned a single time, whatever the number of
+# keywords. Matches must sit on word boundaries ("pos" does not match
+# "possible", "mac" does not match "stomach"), optionally followed by a
+# plural suffix ("phone" matches "phones"). Matching is case-insensitive.
+# -------------------------------------------------------------------
+
+PLURAL_SUFFIXES = ("s", "es")
+
+
+class Match(NamedTuple):
+    concept: Hashable
+    keyword: str
+    start: int
+    end: int  # exclusive, including any suffix
+
+
+def _is_word(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+class KeywordMatcher:
+    def __init__(self, table: Optional[Mapping[Hashable, Iterable[str]]] = None,
+                 suffixes: Iterable[str] = PLURAL_SUFFIXES):
+        self.suffixes = tuple(sorted(suffixes, key=len, reverse=True))
+        self._keywords: Dict[str, Set[Hashable]] = {}  # keyword -> concepts
+        self._built = False
+        for concept, keywords in (table or {}).items():
+            self.add_all(concept, keywords)
+
+    def __len__(self):
+        return len(self._keywords)
+
+    def add(self, concept: Hashable, keyword: str):
+        keyword = keyword.lower().strip()
+        if keyword:
+            self._keywords.setdefault(keyword, set()).add(concept)
+            self._built = False
+
+    def add_all(self, concept: Hashable, keywords: Iterable[str]):
+        for keyword in keywords:
+            self.add(concept, keyword)
+
+    # ---------------- compilation ----------------
+
+    def build(self) -> "KeywordMatcher":
+        """Compiles the automaton (called on first use after changes)."""
+        goto: List[Dict[str, int]] = [{}]
+        out: List[List[str]] = [[]]  # keywords ending at each state (own + via fail links)
+        for keyword in self._keywords:
+            state = 0
+            for ch in keyword:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    out.append([])
+                state = nxt
+            out[state].append(keyword)
+
+        fail = [0] * len(goto)  # depth-1 states fail to the root
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                out[nxt] = out[nxt] + out[fail[nxt]]
+
+        self._goto, self._fail, self._out = goto, fail, out
+        self._built = True
+        return self
+
+    # ---------------- matching ----------------
+
+    def _boundary_end(self, text: str, end: int) -> Optional[int]:
+        """End of the word if the keyword ends a word at `end` (maybe plural)."""
+        if end == len(text) or not _is_word(text[end]):
+            return end
+        for suffix in self.suffixes:
+            stop = end + len(suffix)
+            if text.startswith(suffix, end) and (stop == len(text) or not _is_word(text[stop])):
+                return stop
+        return None
+
+    def find(self, text: str) -> List[Match]:
+        """Every keyword occurrence on word boundaries, in text order."""
+        if not self._built:
+            self.build()
+        goto, fail, out = self._goto, self._fail, self._out
+        text = text.lower()
+        matches = []
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if not out[state]:
+                continue
+            for keyword in out[state]:
+                start = i + 1 - len(keyword)
+                if start and _is_word(text[start - 1]):
+                    continue
+                end = self._boundary_end(text, i + 1)
+                if end is None:
+                    continue
+                for concept in self._keywords[keyword]:
+                    matches.append(Match(concept, keyword, start, end))
+        matches.sort(key=lambda m: (m.start, -m.end))
+        return matches
+
+    def concepts(self, text: str) -> Dict[Hashable, List[str]]:
+        """Matched concept -> its matched keywords, in order of first appearance."""
+        found: Dict[Hashable, List[str]] = {}
+        for match in self.find(text):
+            keywords = found.setdefault(match.concept, [])
+            if match.keyword not in keywords:
+                keywords.append(match.keyword)
+        return found
@@ -1,4 +1,15 @@
+import os
+import json
+import asyncio
+import threading
+from typing import AsyncIterator, Iterator, Optional
+
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import cache
 
 SYSTEM_PROMPT = """
 You are a friendly, professional retail sales associate for a fashion brand.
@@ -6,13 +17,214 @@ You help customers discover products and guide them to purchase.
 Speak naturally and confidently.
 """
 
-def llm(prompt: str) -> str:
-    response = requests.post(
-        "http://localhost:11434/api/generate",
-        json={
-            "model": "llama3",
-            "prompt": SYSTEM_PROMPT + "\n\n" + prompt,
-            "stream": False
-        }
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434/api/generate")
+LLM_MODEL = os.getenv("LLM_MODEL", "llama3")
+
+# Keeps the model loaded between requests. Together with sending the
+# system prompt in Ollama's `system` field (an identical prefix on every
+# request), this lets the runner reuse its cached prompt state instead of
+# re-processing the system prompt each time.
+LLM_KEEP_ALIVE = os.getenv("LLM_KEEP_ALIVE", "30m")
+
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", 5))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", 120))
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", 2))
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", 10))
+
+# Retry policy shared by the sync and async clients: connect errors and
+# these statuses are retried LLM_RETRIES times, sleeping
+# LLM_BACKOFF_FACTOR * 2**n between attempts (0.5s, 1s, 2s ...) unless
+# the server sends Retry-After. Generation has no side effects, so
+# retrying a POST is safe.
+LLM_BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = (429, 502, 503, 504)
+
+
+def _payload(prompt: str, stream: bool, context: Optional[list] = None) -> dict:
+    payload = {
+        "model": LLM_MODEL,
+        "system": SYSTEM_PROMPT,
+        "prompt": prompt,
+        "stream": stream,
+        "keep_alive": LLM_KEEP_ALIVE,
+    }
+    if context:
+        payload["context"] = context  # continue a previous exchange
+    return payload
+
+
+def response_cache_key(prompt: str) -> Optional[str]:
+    """The response-cache key llm() uses for this prompt (None if caching is off)."""
+    if not cache.LLM_CACHE_ENABLED:
+        return None
+    return cache.llm_cache_key(LLM_MODEL, SYSTEM_PROMPT, prompt)
+
+
+def _cache_key(prompt: str, use_cache: bool) -> Optional[str]:
+    return response_cache_key(prompt) if use_cache else None
+
+
+# -------------------------------------------------------------------
+# SYNC CLIENT (pooled requests.Session)
+# -------------------------------------------------------------------
+
+_http = None
+_http_lock = threading.Lock()
+
+
+def _session() -> requests.Session:
+    global _http
+    if _http is None:
+        with _http_lock:
+            if _http is None:
+                retry = Retry(
+                    total=LLM_RETRIES,
+                    backoff_factor=LLM_BACKOFF_FACTOR,
+                    status_forcelist=RETRY_STATUSES,
+                    allowed_methods=frozenset({"POST"}),
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=LLM_POOL_SIZE, max_retries=retry)
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _http = session
+    return _http
+
+
+def generate(prompt: str, context: Optional[list] = None) -> dict:
+    """One non-streaming completion: Ollama's full response object."""
+    response = _session().post(
+        OLLAMA_URL,
+        json=_payload(prompt, stream=False, context=context),
+        timeout=(LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT),
     )
-    return response.json()["response"].strip()
+    response.raise_for_status()
+    return response.json()
+
+
+def llm(prompt: str, use_cache: bool = True) -> str:
+    """
+    One completion as text. Responses are memoized (cache.py, LLM
+    RESPONSE CACHING); pass use_cache=False for prompts whose answer must
+    be fresh or must not be stored.
+    """
+    key = _cache_key(prompt, use_cache)
+    if key:
+        cached = cache.get_cached_llm(key)
+        if cached is not None:
+            return cached
+    response = generate(prompt)["response"].strip()
+    if key:
+        cache.cache_llm(key, response)
+    return response
+
+
+def llm_stream(prompt: str, context: Optional[list] = None) -> Iterator[str]:
+    """Yields response text as the model produces it."""
+    with _session().post(
+        OLLAMA_URL,
+        json=_payload(prompt, stream=True, context=context),
+        timeout=(LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT),
+        stream=True,
+    ) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get("response"):
+                yield chunk["response"]
+            if chunk.get("done"):
+                break
+
+
+# -------------------------------------------------------------------
+# ASYNC CLIENT (shared httpx.AsyncClient)
+# -------------------------------------------------------------------
+
+_async_http = None
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    try:
+        return max(0.0, float(response.headers["Retry-After"]))
+    except (KeyError, ValueError):
+        return None
+
+
+class StatusRetryTransport(httpx.AsyncBaseTransport):
+    """
+    Retries RETRY_STATUSES with backoff, like the sync client's urllib3
+    Retry (httpx's own `retries` only covers connect errors). The status
+    is checked before the body is read, so streaming requests retry too.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, retries: int = LLM_RETRIES,
+                 backoff_factor: float = LLM_BACKOFF_FACTOR):
+        self.transport = transport
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        for attempt in range(self.retries + 1):
+            response = await self.transport.handle_async_request(request)
+            if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                return response
+            delay = _retry_after(response)
+            await response.aclose()
+            await asyncio.sleep(self.backoff_factor * 2 ** attempt if delay is None else delay)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def _async_client() -> httpx.AsyncClient:
+    global _async_http
+    if _async_http is None:
+        _async_http = httpx.AsyncClient(
+            timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            # limits go on the transport: a client given its own transport ignores them
+            transport=StatusRetryTransport(httpx.AsyncHTTPTransport(
+                retries=LLM_RETRIES,  # connect failures
+                limits=httpx.Limits(max_connections=LLM_POOL_SIZE, max_keepalive_connections=LLM_POOL_SIZE),
+            )),
+        )
+    return _async_http
+
+
+async def llm_async(prompt: str, use_cache: bool = True) -> str:
+    """Non-blocking llm() for the async chat pipeline (shared connection pool)."""
+    key = _cache_key(prompt, use_cache)
+    if key:
+        cached = await cache.get_cached_llm_async(key)
+        if cached is not None:
+            return cached
+    response = await _async_client().post(OLLAMA_URL, json=_payload(prompt, stream=False))
+    response.raise_for_status()
+    text = response.json()["response"].strip()
+    if key:
+        await cache.cache_llm_async(key, text)
+    return text
+
+
+async def llm_stream_async(prompt: str, context: Optional[list] = None) -> AsyncIterator[str]:
+    async with _async_client().stream(
+        "POST", OLLAMA_URL, json=_payload(prompt, stream=True, context=context)
+    ) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get("response"):
+                yield chunk["response"]
+            if chunk.get("done"):
+                break
+
+
+async def close_async_client():
+    global _async_http
+    if _async_http is not None:
+        await _async_http.aclose()
+        _async_http = None
@@ -0,0 +1,209 @@
+"""
+OLLAMA STUB SERVER
+------------------
+Emulates Ollama's POST /api/generate (streaming NDJSON and non-streaming)
+with configurable latency, so the LLM client and everything above it can
+be load-tested offline.
+
+Latency model per request:
+  --load-latency    once per model, or again after keep_alive expires
+  --prompt-latency  per prompt character not already cached; the system
+                    prompt is cached per model while it stays loaded
+  --token-latency   per generated token (whitespace-separated word)
+  --parallel        generations running at once (like OLLAMA_NUM_PARALLEL);
+                    further requests queue. 0 = unlimited
+
+Intent-classification prompts get a keyword-picked intent (one numbered
+line per message for batched prompts); everything else gets a canned
+sales reply.
+
+Usage:
+    python llm_stub_server.py --port 11434 --token-latency 0.02
+    OLLAMA_URL=http://localhost:11434/api/generate python sales_agent.py
+"""
+
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY = ("Great choice! That one is a customer favourite, and it is available "
+         "in store and online. Would you like me to check stock near you?")
+
+INTENT_RULES = [
+    ("POST_PURCHASE", r"track|return|refund|feedback|order id"),
+    ("BUY_NOW", r"\bbuy\b|checkout|place (the |an )?order|purchase"),
+    ("PRICE_OFFERS", r"price|offer|discount|coupon|deal|points"),
+    ("AVAILABILITY_CHECK", r"stock|available|availability|nearby|store"),
+]
+
+
+def _duration(value: str) -> float:
+    """Ollama keep_alive ("5m", "30s", "1h", seconds, or -1 = forever)."""
+    if isinstance(value, (int, float)):
+        return float("inf") if value < 0 else float(value)
+    match = re.fullmatch(r"(-?\d+(?:\.\d+)?)([smh]?)", str(value).strip())
+    if not match:
+        return 300.0
+    number, unit = float(match.group(1)), match.group(2)
+    if number < 0:
+        return float("inf")
+    return number * {"": 1, "s": 1, "m": 60, "h": 3600}[unit]
+
+
+def _intent_for(message: str) -> str:
+    for intent, pattern in INTENT_RULES:
+        if re.search(pattern, message.lower()):
+            return intent
+    return "PRODUCT_DISCOVERY"
+
+
+def reply_for(prompt: str) -> str:
+    if "Classify the customer's intent" in prompt:
+        return _intent_for(prompt.split("Customer message:", 1)[-1].split("Return ONLY", 1)[0])
+    if "Classify each customer message's intent" in prompt:
+        block = prompt.split("Customer messages:", 1)[-1].split("Return ONLY", 1)[0]
+        messages = re.findall(r"^(\d+)\. (.*)$", block, re.MULTILINE)
+        return "\n".join(f"{n}: {_intent_for(m)}" for n, m in messages)
+    return REPLY
+
+
+class StubState:
+    def __init__(self, load_latency, prompt_latency, token_latency, parallel=0):
+        self.load_latency = load_latency
+        self.prompt_latency = prompt_latency
+        self.token_latency = token_latency
+        self.slots = threading.BoundedSemaphore(parallel) if parallel else None
+        self.lock = threading.Lock()
+        self.loaded_until = {}   # model -> monotonic deadline
+        self.cached_system = {}  # model -> system prompt in the prompt cache
+        self.requests = 0
+
+    def admit(self, model: str, system: str, keep_alive) -> tuple:
+        """Returns (seconds to wait before the first token, prompt chars evaluated)."""
+        now = time.monotonic()
+        with self.lock:
+            self.requests += 1
+            wait = 0.0
+            if self.loaded_until.get(model, 0) <= now:
+                wait += self.load_latency
+                self.cached_system.pop(model, None)
+            cached = self.cached_system.get(model) == system
+            self.cached_system[model] = system
+            self.loaded_until[model] = now + wait + _duration(keep_alive)
+        return wait, 0 if cached else len(system)
+
+
+def make_handler(state: StubState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, so client pooling matters
+        disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, body: bytes, content_type="application/json"):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/":
+                self._send(200, b"Ollama is running", "text/plain")
+            elif self.path == "/api/tags":
+                self._send(200, json.dumps({"models": [{"name": "llama3:latest"}]}).encode())
+            else:
+                self._send(404, b"{}")
+
+        def do_POST(self):
+            if self.path != "/api/generate":
+                return self._send(404, b"{}")
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                req = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                return self._send(400, json.dumps({"error": "invalid JSON"}).encode())
+            if state.slots is None:
+                return self._generate(req)
+            with state.slots:  # queue behind the running generations
+                return self._generate(req)
+
+        def _generate(self, req):
+            model = req.get("model", "llama3")
+            prompt = req.get("prompt", "")
+            started = time.monotonic()
+            wait, system_chars = state.admit(model, req.get("system", ""), req.get("keep_alive", "5m"))
+            prompt_chars = system_chars + len(prompt)
+            time.sleep(wait + prompt_chars * state.prompt_latency)
+
+            if not prompt:  # Ollama: an empty prompt only loads the model
+                tokens = []
+            else:
+                words = reply_for(prompt).split(" ")
+                tokens = [w if i == 0 else " " + w for i, w in enumerate(words)]
+            context = list(req.get("context") or []) + list(range(len(prompt.split()) + len(tokens)))
+
+            def final(text=""):
+                return {
+                    "model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                    "response": text, "done": True, "done_reason": "stop", "context": context,
+                    "total_duration": int((time.monotonic() - started) * 1e9),
+                    "prompt_eval_count": prompt_chars, "eval_count": len(tokens),
+                }
+
+            if not req.get("stream", True):
+                time.sleep(len(tokens) * state.token_latency)
+                return self._send(200, json.dumps(final("".join(tokens))).encode())
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            def chunk(obj):
+                data = json.dumps(obj).encode() + b"\n"
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            for token in tokens:
+                time.sleep(state.token_latency)
+                chunk({"model": model, "response": token, "done": False})
+            chunk(final())
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Handler
+
+
+def serve(host="127.0.0.1", port=11434, load_latency=0.5, prompt_latency=0.0001,
+          token_latency=0.01, parallel=0) -> ThreadingHTTPServer:
+    """Starts the stub in a daemon thread (for tests/benchmarks) and returns it."""
+    state = StubState(load_latency, prompt_latency, token_latency, parallel)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    server.state = state
+    threading.Thread(target=server.serve_forever, name="llm-stub", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--load-latency", type=float, default=0.5, help="seconds to load a cold model")
+    parser.add_argument("--prompt-latency", type=float, default=0.0001, help="seconds per uncached prompt char")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="seconds per generated token")
+    parser.add_argument("--parallel", type=int, default=0, help="concurrent generations (0 = unlimited)")
+    args = parser.parse_args()
+
+    state = StubState(args.load_latency, args.prompt_latency, args.token_latency, args.parallel)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    server.daemon_threads = True
+    print(f"[LLM Stub] Serving /api/generate on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -1,44 +1,65 @@
-import os
-from pymongo import MongoClient
-from dotenv import load_dotenv
+import datetime
 
-load_dotenv()
+import numpy as np
 
-MONGO_URL = os.getenv("MONGO_URL")
+from database import loyalty_col, products_col, aloyalty_col, aproducts_col
+from product_index import find_product, find_product_async
+from promotion_index import applicable_promotion, applicable_promotion_async
+from promotion_index import find_promotion, find_promotion_async
+from product_index import resolve_product_ids, resolve_product_ids_async
+from results import PriceQuote, CartLine, CartQuote
 
 MAX_POINT_COVERAGE = 0.50  # 50%
 
-client = MongoClient(MONGO_URL)
-db = client["EY"]
-
-products_col = db["products"]
-promotions_col = db["promotions"]
-loyalty_col = db["loyalty_accounts"]
-
-print("[Loyalty Agent] Connected to MongoDB")
-print("[Loyalty Agent] Using DB: EY")
-
 
 def get_loyalty_balance(customer_id):
     acc = loyalty_col.find_one({"customerId": customer_id})
     return acc.get("points", 0) if acc else 0
 
 
+def _name_and_discount(promo):
+    return (promo.name, promo.discount) if promo else (None, 0)
+
+
 def find_applicable_promotion(coupon_code, product):
+    """
+    (name, discount%) of the coupon if it is running and covers
+    `product`, else (None, 0). Resolved by promotion_index, in memory.
+    """
     if not coupon_code:
         return None, 0
 
-    promo = promotions_col.find_one({
-        "$or": [
-            {"promoId": coupon_code.upper()},
-            {"name": {"$regex": coupon_code, "$options": "i"}}
-        ]
-    })
+    return _name_and_discount(applicable_promotion(coupon_code, product))
 
-    if not promo:
-        return None, 0
 
-    return promo.get("name"), promo.get("discount", 0)
+def _price_quote(base_price, coupon_code, promotion, balance):
+    """
+    Applies the coupon and loyalty points. `promotion` is
+    (name, discount%) and `balance` is None when points are not being
+    used.
+    """
+    quote = PriceQuote(base_price=base_price, coupon_code=coupon_code, points_balance=balance)
+    current_price = float(base_price)
+
+    # Coupon
+    if coupon_code:
+        quote.coupon_name, discount = promotion
+        if discount:
+            quote.coupon_discount = base_price * discount / 100
+            current_price -= quote.coupon_discount
+
+    # Loyalty
+    if balance is not None:
+        cap = current_price * MAX_POINT_COVERAGE
+        redeem = min(balance, cap)
+
+        if redeem > 0:
+            current_price -= redeem
+            quote.points_redeemed = redeem
+
+    quote.final_price = current_price
+    quote.savings = quote.coupon_discount + quote.points_redeemed
+    return quote
 
 
 def calculate_final_price(
@@ -52,43 +73,224 @@ def calculate_final_price(
     Calculates final payable price using coupons and loyalty points.
     """
 
-    product = products_col.find_one(
-        {"name": {"$regex": product_name, "$options": "i"}}
-    )
+    product = find_product(product_name)
     if not product:
-        return "❌ Product not found."
+        return PriceQuote(base_price=base_price, error="❌ Product not found.")
 
-    current_price = float(base_price)
-    total_savings = 0
-    logs = []
+    promotion = find_applicable_promotion(coupon_code, product) if coupon_code else None
+    balance = get_loyalty_balance(customer_id) if use_points else None
 
-    # Coupon
+    return _price_quote(base_price, coupon_code, promotion, balance)
+
+
+async def calculate_final_price_async(
+    product_name: str,
+    base_price: float,
+    customer_id: str,
+    coupon_code: str | None = None,
+    use_points: bool = False
+):
+    """Async twin of calculate_final_price for the async chat pipeline."""
+
+    product = await find_product_async(product_name)
+    if not product:
+        return PriceQuote(base_price=base_price, error="❌ Product not found.")
+
+    promotion = None
     if coupon_code:
-        promo_name, discount = find_applicable_promotion(coupon_code, product)
-        if discount:
-            d_amt = base_price * discount / 100
-            current_price -= d_amt
-            total_savings += d_amt
-            logs.append(f"🎫 Coupon {promo_name}: -₹{d_amt:.2f}")
-        else:
-            logs.append("⚠️ Invalid coupon")
+        promotion = _name_and_discount(await applicable_promotion_async(coupon_code, product))
 
-    # Loyalty
+    balance = None
     if use_points:
-        balance = get_loyalty_balance(customer_id)
-        cap = current_price * MAX_POINT_COVERAGE
-        redeem = min(balance, cap)
+        acc = await aloyalty_col.find_one({"customerId": customer_id})
+        balance = acc.get("points", 0) if acc else 0
 
-        if redeem > 0:
-            current_price -= redeem
-            total_savings += redeem
-            logs.append(f"💎 Loyalty applied: -₹{redeem:.2f}")
-
-    return (
-        f"💰 PRICE SUMMARY\n"
-        f"Original: ₹{base_price}\n"
-        f"{chr(10).join(logs)}\n"
-        f"------------------\n"
-        f"Final: ₹{current_price:.2f}\n"
-        f"You saved: ₹{total_savings:.2f}"
-    )
+    return _price_quote(base_price, coupon_code, promotion, balance)
+
+
+# -------------------------------------------------------------------
+# Cart quotes.
+#
+# quote_carts() prices any number of carts
+#
+#   {"customer_id": ..., "coupon_code": ..., "use_points": bool,
+#    "items": [{"product_name" | "productId": ..., "quantity": n,
+#               "coupon_code": ...}]}
+#
+# with one query per collection for the whole batch: products by
+# productId ($in, names are resolved by the in-memory product index) and
+# loyalty balances for every customer. Coupons are resolved, and checked
+# against each line's product and today's date, by promotion_index
+# without a query. A line's own coupon_code overrides the cart's.
+#
+# The price math runs on NumPy arrays over every line of every cart at
+# once. MAX_POINT_COVERAGE caps points at that share of the cart's
+# total after coupons (not per line); the points are then spread over
+# the lines in proportion to their price.
+# -------------------------------------------------------------------
+
+_CART_PRODUCT_PROJECTION = {"_id": 0, "productId": 1, "name": 1, "price": 1, "category": 1}
+
+
+def _cart_lookups(carts):
+    """(codes, customer ids) the batch needs, in first-seen order."""
+    codes, customers = {}, {}
+    for cart in carts:
+        for item in cart.get("items", []):
+            code = item.get("coupon_code") or cart.get("coupon_code")
+            if code:
+                codes[code] = None
+        if cart.get("use_points"):
+            customers[cart["customer_id"]] = None
+    return list(codes), list(customers)
+
+
+def _price_lines(unit_prices, quantities, discounts, cart_index, balances):
+    """
+    Vectorized over every line of every cart. `cart_index` is each
+    line's cart, `balances` each cart's points (0 when not used).
+    Returns per-line (base, coupon discount, points, final) arrays.
+    """
+    base = unit_prices * quantities
+    coupon = base * discounts / 100
+    net = base - coupon
+
+    cart_net = np.bincount(cart_index, weights=net, minlength=len(balances))
+    redeem = np.minimum(balances, cart_net * MAX_POINT_COVERAGE).clip(min=0)
+    share = np.divide(redeem, cart_net, out=np.zeros_like(cart_net), where=cart_net > 0)
+    points = net * share[cart_index]
+
+    return base, coupon, points, net - points
+
+
+def _cart_quotes(carts, product_ids, products, promotions, balances):
+    """
+    Builds the CartQuotes once every lookup is done. `promotions` maps
+    each coupon code to its Promotion (None if unknown).
+    """
+    by_id = {p["productId"]: p for p in products}
+    quotes = [CartQuote(customer_id=cart["customer_id"]) for cart in carts]
+    now = datetime.datetime.now()
+    rows = []  # (cart, product, quantity, coupon code, promotion or None)
+
+    for c, (cart, ids) in enumerate(zip(carts, product_ids)):
+        for i, (item, pid) in enumerate(zip(cart.get("items", []), ids)):
+            product = by_id.get(pid)
+            label = item.get("product_name") or item.get("productId")
+            if product is None:
+                quotes[c].errors.append({"line": i, "product": label, "error": "❌ Product not found."})
+                continue
+            qty = int(item.get("quantity", 1))
+            if qty <= 0:
+                quotes[c].errors.append({"line": i, "product": label, "error": "❌ Quantity must be at least 1."})
+                continue
+            code = item.get("coupon_code") or cart.get("coupon_code")
+            promo = promotions.get(code) if code else None
+            if promo is not None and not (promo.is_active(now) and promo.applies_to(product)):
+                promo = None
+            rows.append((c, product, qty, code, promo))
+
+    cart_index = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    unit_prices = np.fromiter((float(r[1].get("price", 0)) for r in rows), dtype=np.float64, count=len(rows))
+    quantities = np.fromiter((r[2] for r in rows), dtype=np.float64, count=len(rows))
+    discounts = np.fromiter((r[4].discount if r[4] else 0 for r in rows), dtype=np.float64, count=len(rows))
+    points_balance = np.array([float(balances.get(cart["customer_id"], 0)) if cart.get("use_points") else 0
+                               for cart in carts], dtype=np.float64)
+
+    base, coupon, points, final = _price_lines(unit_prices, quantities, discounts, cart_index, points_balance)
+
+    for k, (c, product, qty, code, promo) in enumerate(rows):
+        quotes[c].lines.append(CartLine(
+            product_id=product["productId"],
+            name=product.get("name"),
+            quantity=qty,
+            unit_price=float(unit_prices[k]),
+            base_price=float(base[k]),
+            coupon_code=code,
+            coupon_name=promo.name if promo else None,
+            coupon_discount=float(coupon[k]),
+            points_redeemed=float(points[k]),
+            final_price=float(final[k]),
+        ))
+
+    n = len(carts)
+    totals = [np.bincount(cart_index, weights=col, minlength=n) for col in (base, coupon, points, final)]
+    for c, (cart, quote) in enumerate(zip(carts, quotes)):
+        quote.subtotal, quote.coupon_discount, quote.points_redeemed, quote.final_total = (
+            float(t[c]) for t in totals)
+        quote.savings = quote.coupon_discount + quote.points_redeemed
+        if cart.get("use_points"):
+            quote.points_balance = balances.get(cart["customer_id"], 0)
+    return quotes
+
+
+def _first(ids):
+    return ids[0] if ids else None
+
+
+def quote_carts(carts: list) -> list:
+    """Prices a batch of carts (see above). Returns one CartQuote per cart."""
+
+    product_ids = [
+        [item.get("productId") or _first(resolve_product_ids(item.get("product_name", ""), limit=1))
+         for item in cart.get("items", [])]
+        for cart in carts
+    ]
+    wanted = list({pid for ids in product_ids for pid in ids if pid})
+    codes, customers = _cart_lookups(carts)
+
+    products = list(products_col.find({"productId": {"$in": wanted}}, _CART_PRODUCT_PROJECTION)) if wanted else []
+    accounts = list(loyalty_col.find({"customerId": {"$in": customers}})) if customers else []
+
+    promotions = {code: find_promotion(code) for code in codes}
+    balances = {acc["customerId"]: acc.get("points", 0) for acc in accounts}
+    return _cart_quotes(carts, product_ids, products, promotions, balances)
+
+
+def quote_cart(
+    items: list,
+    customer_id: str,
+    coupon_code: str | None = None,
+    use_points: bool = False
+):
+    """
+    Prices a whole cart in one call: per-line and total breakdowns with
+    coupons and loyalty points applied across the cart.
+    """
+    return quote_carts([{"items": items, "customer_id": customer_id,
+                         "coupon_code": coupon_code, "use_points": use_points}])[0]
+
+
+async def quote_carts_async(carts: list) -> list:
+    """Async twin of quote_carts."""
+
+    product_ids = []
+    for cart in carts:
+        ids = []
+        for item in cart.get("items", []):
+            ids.append(item.get("productId") or
+                       _first(await resolve_product_ids_async(item.get("product_name", ""), limit=1)))
+        product_ids.append(ids)
+    wanted = list({pid for ids in product_ids for pid in ids if pid})
+    codes, customers = _cart_lookups(carts)
+
+    products, accounts = [], []
+    if wanted:
+        products = await aproducts_col.find({"productId": {"$in": wanted}}, _CART_PRODUCT_PROJECTION).to_list(None)
+    if customers:
+        accounts = await aloyalty_col.find({"customerId": {"$in": customers}}).to_list(None)
+
+    promotions = {code: await find_promotion_async(code) for code in codes}
+    balances = {acc["customerId"]: acc.get("points", 0) for acc in accounts}
+    return _cart_quotes(carts, product_ids, products, promotions, balances)
+
+
+async def quote_cart_async(
+    items: list,
+    customer_id: str,
+    coupon_code: str | None = None,
+    use_points: bool = False
+):
+    """Async twin of quote_cart."""
+    return (await quote_carts_async([{"items": items, "customer_id": customer_id,
+                                      "coupon_code": coupon_code, "use_points": use_points}]))[0]
@@ -0,0 +1,67 @@
+import bisect
+import threading
+from typing import Sequence
+
+# -------------------------------------------------------------------
+# Fixed-bucket histogram (Prometheus-style cumulative upper bounds).
+# observe() is a bisect plus an increment under a lock, so it is cheap
+# enough for hot paths; snapshot() returns plain dicts for /metrics
+# endpoints and benchmark output.
+# -------------------------------------------------------------------
+
+# milliseconds
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot: above the top bucket
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[slot] += 1
+            self._sum += value
+            self._max = max(self._max, value)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation."""
+        with self._lock:
+            counts, top = list(self._counts), self._max
+        total = sum(counts)
+        if not total:
+            return 0.0
+        rank, seen = q * total, 0
+        for slot, count in enumerate(counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[slot] if slot < len(self.buckets) else top
+        return top
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts, total_sum, top = list(self._counts), self._sum, self._max
+        count = sum(counts)
+        cumulative, seen = {}, 0
+        for bound, n in zip(self.buckets, counts):
+            seen += n
+            cumulative[f"le_{bound:g}"] = seen
+        cumulative["le_inf"] = count
+        return {
+            "count": count,
+            "mean": round(total_sum / count, 3) if count else 0.0,
+            "max": round(top, 3),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": cumulative,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._counts = [0] * (len(self.buckets) + 1)
+            self._sum = self._max = 0.0
@@ -0,0 +1,99 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, List
+
+from metrics import Histogram, LATENCY_BUCKETS_MS
+
+# -------------------------------------------------------------------
+# Micro-batching for the event loop.
+#
+# submit() parks the caller on a future. The pending items are handed to
+# run_batch() together as soon as `max_size` have arrived, or `window`
+# seconds after the first one, whichever comes first. run_batch returns
+# one result per item, in order; an exception fails the whole batch.
+#
+# At most `max_inflight` batches run at once (0 = no limit). While the
+# backend is saturated, new items keep collecting and go out together
+# as soon as a running batch finishes, so batches grow with load instead
+# of piling up behind each other.
+# -------------------------------------------------------------------
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+class MicroBatcher:
+    def __init__(self, run_batch: Callable[[List[Any]], Awaitable[List[Any]]],
+                 window: float = 0.005, max_size: int = 16, max_inflight: int = 0):
+        self.run_batch = run_batch
+        self.window = window
+        self.max_size = max_size
+        self.max_inflight = max_inflight
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_delay_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.batches = 0
+        self.failed_batches = 0
+        self._pending = []   # (item, future, enqueued_at)
+        self._timer = None
+        self._tasks = set()  # running batches (keeps them referenced)
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future, time.monotonic()))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending and not self._saturated():
+            batch, self._pending = self._pending[:self.max_size], self._pending[self.max_size:]
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._batch_done)
+        # anything left waits for a running batch to finish
+
+    def _saturated(self) -> bool:
+        return bool(self.max_inflight) and len(self._tasks) >= self.max_inflight
+
+    def _batch_done(self, task):
+        self._tasks.discard(task)
+        if self._pending:
+            self._flush()
+
+    async def _run(self, batch):
+        started = time.monotonic()
+        self.batches += 1
+        self.batch_sizes.observe(len(batch))
+        for _, _, enqueued_at in batch:
+            self.queue_delay_ms.observe((started - enqueued_at) * 1000)
+        try:
+            results = await self.run_batch([item for item, _, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f"run_batch returned {len(results)} results for {len(batch)} items")
+        except Exception as e:
+            self.failed_batches += 1
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():  # the caller may have been cancelled
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "window_ms": self.window * 1000,
+            "max_size": self.max_size,
+            "max_inflight": self.max_inflight,
+            "inflight": len(self._tasks),
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "pending": len(self._pending),
+            "batch_size": self.batch_sizes.snapshot(),
+            "queue_delay_ms": self.queue_delay_ms.snapshot(),
+        }
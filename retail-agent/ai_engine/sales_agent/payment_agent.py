@@ -1,27 +1,14 @@
-import os
 import uuid
 import datetime
+from dataclasses import asdict
 from langchain.tools import tool
-from pymongo import MongoClient
-from dotenv import load_dotenv
-
-# -------------------------------------------------------------------
-# ENV + DB CONNECTION
-# -------------------------------------------------------------------
-
-load_dotenv()
-
-MONGO_URL = os.getenv("MONGO_URL")
-
-client = MongoClient(MONGO_URL)
-db = client["EY"]
-
-orders_col = db["orders"]
-payments_col = db["payments"]
-pos_col = db["pos_transactions"]
-
-print("[Payment Agent] Connected to MongoDB")
-print("[Payment Agent] Using DB: EY")
+from database import orders_col, payments_col, aorders_col, apayments_col
+from database import run_in_transaction, run_in_transaction_async
+import idempotency
+import reservations
+import write_behind
+from results import PaymentResult, PAYMENT_SUCCESS, PAYMENT_FAILED, PAYMENT_IN_PROGRESS
+from results import ALREADY_PAID, ORDER_NOT_FOUND, HOLD_EXPIRED, IDEMPOTENCY_CONFLICT
 
 # -------------------------------------------------------------------
 # HELPERS
@@ -30,9 +17,18 @@ print("[Payment Agent] Using DB: EY")
 def generate_payment_id():
     return f"PAY-{uuid.uuid4().hex[:8].upper()}"
 
-def simulate_gateway_process(method, amount):
+def default_idempotency_key(order_id):
+    """One charge per order unless the caller brings its own key."""
+    return f"payment:{order_id}"
+
+def _fingerprint(order_id, payment_method):
+    """What a key is bound to; the amount follows from the order."""
+    return idempotency.fingerprint({"orderId": order_id, "method": payment_method.strip().lower()})
+
+def simulate_gateway_process(method, amount, idempotency_key=None):
     """
-    Mock payment gateway logic.
+    Mock payment gateway logic. A real gateway gets the idempotency key
+    too, so a charge retried after a crash is not taken twice.
     """
     method = method.lower()
 
@@ -47,51 +43,222 @@ def simulate_gateway_process(method, amount):
 
     return False, "Unsupported Payment Method"
 
+def _new_payment(order, payment_method, key):
+    """Runs the gateway and returns the payment record to store."""
+    amount = order["totalAmount"]
+    success, msg = simulate_gateway_process(payment_method, amount, key)
+
+    return {
+        "paymentId": generate_payment_id(),
+        "orderId": order["orderId"],
+        "amount": amount,
+        "method": payment_method,
+        "status": PAYMENT_SUCCESS if success else PAYMENT_FAILED,
+        "gatewayMessage": msg,
+        "idempotencyKey": key,
+        "timestamp": datetime.datetime.now()
+    }
+
+class _AlreadyPaid(Exception):
+    """Another payment marked the order PAID first; rolls the transaction back."""
+
+def _paid_update(payment):
+    """(filter, update) that marks the order PAID unless it already is."""
+    return (
+        {"orderId": payment["orderId"], "status": {"$ne": "PAID"}},
+        {"$set": {"status": "PAID", "paymentId": payment["paymentId"]}}
+    )
+
+def _already_paid(order):
+    return PaymentResult(order["orderId"], ALREADY_PAID, payment_id=order.get("paymentId"),
+                         amount=order.get("totalAmount", 0))
+
+def _replay(claim, order_id, payment_method):
+    """Response to a duplicate submission: the stored result, 'in progress', or a key conflict."""
+    if claim.conflict:
+        return PaymentResult(order_id, IDEMPOTENCY_CONFLICT, method=payment_method)
+    if claim.result:
+        return PaymentResult(**claim.result)
+    return PaymentResult(order_id, PAYMENT_IN_PROGRESS, method=payment_method)
+
+def _audit(payment):
+    """
+    Queues the append-only records of a charge attempt: a declined
+    payment, and the POS terminal log for in-store payments. A
+    successful payment record is written with its order instead.
+    """
+    if payment["status"] != PAYMENT_SUCCESS:
+        write_behind.enqueue("payments", payment)
+    if payment["method"].lower() == "pos":
+        write_behind.enqueue("pos_transactions", {
+            "paymentId": payment["paymentId"],
+            "orderId": payment["orderId"],
+            "amount": payment["amount"],
+            "status": payment["status"],
+            "gatewayMessage": payment["gatewayMessage"],
+            "timestamp": payment["timestamp"]
+        })
+
+def _unlock_after_error(order_id, reopen_unpaid):
+    """
+    A charge that raised may have left the order's holds COMMITTED; hand
+    them back for a retry (the sweeper catches whatever this misses).
+    """
+    try:
+        reopen_unpaid(order_id)
+    except Exception as e:
+        print(f"[Payment] ⚠️ Could not reopen holds of {order_id}: {e}")
+
+def _payment_result(payment):
+    return PaymentResult(
+        order_id=payment["orderId"],
+        status=payment["status"],
+        payment_id=payment["paymentId"],
+        amount=payment["amount"],
+        method=payment["method"],
+        message=payment["gatewayMessage"]
+    )
+
 # -------------------------------------------------------------------
-# LANGCHAIN TOOL
+# PAYMENT FLOW
+#
+# The idempotency key is claimed before anything else, so duplicate
+# submissions (client retries, double clicks) wait for the first one
+# and get its stored result instead of charging again. Only a success
+# is stored: after a decline, or a check that stopped before the
+# gateway, the key is released so the buyer can try again. A key is
+# bound to its order and payment method; reusing it for another
+# request is rejected. Its lease is renewed for as long as the charge
+# runs, so a slow gateway does not let a duplicate take over.
+#
+# A successful charge marks the order PAID, inserts the payment record
+# and marks the stock holds SOLD in one transaction, so none of them can
+# exist without the others. If the charge raises, the holds go back to
+# HELD so the stock is not locked to an order that was never paid.
+# Declines and the POS log are audit-only and go through write_behind.
 # -------------------------------------------------------------------
 
+def _charge(order_id, payment_method, key):
+    order = orders_col.find_one({"orderId": order_id})
+    if not order:
+        return PaymentResult(order_id, ORDER_NOT_FOUND)
+
+    if order.get("status") == "PAID":
+        return _already_paid(order)
+
+    # Lock the reserved stock to this order before charging.
+    if not reservations.commit(order_id):
+        return PaymentResult(order_id, HOLD_EXPIRED, method=payment_method)
+
+    payment = _new_payment(order, payment_method, key)
+
+    _audit(payment)
+    if payment["status"] != PAYMENT_SUCCESS:
+        reservations.reopen(order_id)  # keep the hold for a retry
+        return _payment_result(payment)
+
+    def record(session):
+        flt, update = _paid_update(payment)
+        if not orders_col.update_one(flt, update, session=session).matched_count:
+            raise _AlreadyPaid
+        payments_col.insert_one(dict(payment), session=session)
+        reservations.settle(order_id, session=session)
+
+    try:
+        run_in_transaction(record)
+    except _AlreadyPaid:
+        # paid under another key meanwhile; a real integration voids this charge
+        return _already_paid(orders_col.find_one({"orderId": order_id}))
+
+    return _payment_result(payment)
+
+
 @tool
-def process_payment(order_id: str, payment_method: str):
+def process_payment(order_id: str, payment_method: str, idempotency_key: str | None = None):
     """
-    Processes payment for an order and updates order status.
+    Processes payment for an order and updates order status. Repeating
+    the call with the same idempotency key (default: one per order)
+    returns the first successful result instead of charging again.
     """
 
-    order = orders_col.find_one({"orderId": order_id})
+    key = idempotency_key or default_idempotency_key(order_id)
+    claim = idempotency.claim(key, "payment", _fingerprint(order_id, payment_method))
+    if not claim.owned:
+        return _replay(claim, order_id, payment_method)
+
+    try:
+        with idempotency.leased(key):
+            result = _charge(order_id, payment_method, key)
+    except Exception:
+        _unlock_after_error(order_id, reservations.reopen_unpaid)
+        idempotency.abandon(key)
+        raise
+
+    if result.status == PAYMENT_SUCCESS:
+        idempotency.complete(key, asdict(result))
+    else:
+        idempotency.abandon(key)
+    return result
+
+
+async def _charge_async(order_id, payment_method, key):
+    order = await aorders_col.find_one({"orderId": order_id})
     if not order:
-        return f"❌ Payment Failed: Order '{order_id}' not found."
+        return PaymentResult(order_id, ORDER_NOT_FOUND)
 
     if order.get("status") == "PAID":
-        return f"✅ Order already paid. Payment ID: {order.get('paymentId')}"
+        return _already_paid(order)
 
-    amount = order["totalAmount"]
-    success, msg = simulate_gateway_process(payment_method, amount)
+    # Lock the reserved stock to this order before charging.
+    if not await reservations.commit_async(order_id):
+        return PaymentResult(order_id, HOLD_EXPIRED, method=payment_method)
 
-    payment_id = generate_payment_id()
+    payment = _new_payment(order, payment_method, key)
 
-    payments_col.insert_one({
-        "paymentId": payment_id,
-        "orderId": order_id,
-        "amount": amount,
-        "method": payment_method,
-        "status": "SUCCESS" if success else "FAILED",
-        "timestamp": datetime.datetime.now()
-    })
+    _audit(payment)
+    if payment["status"] != PAYMENT_SUCCESS:
+        await reservations.reopen_async(order_id)  # keep the hold for a retry
+        return _payment_result(payment)
 
-    if not success:
-        return f"❌ Payment failed: {msg}"
+    async def record(session):
+        flt, update = _paid_update(payment)
+        if not (await aorders_col.update_one(flt, update, session=session)).matched_count:
+            raise _AlreadyPaid
+        await apayments_col.insert_one(dict(payment), session=session)
+        await reservations.settle_async(order_id, session=session)
 
-    orders_col.update_one(
-        {"orderId": order_id},
-        {"$set": {"status": "PAID", "paymentId": payment_id}}
-    )
+    try:
+        await run_in_transaction_async(record)
+    except _AlreadyPaid:
+        return _already_paid(await aorders_col.find_one({"orderId": order_id}))
 
-    return (
-        f"💳 PAYMENT SUCCESS\n"
-        f"Payment ID: {payment_id}\n"
-        f"Amount: ₹{amount}\n"
-        f"Order closed."
-    )
+    return _payment_result(payment)
+
+
+async def process_payment_async(order_id: str, payment_method: str, idempotency_key: str | None = None):
+    """Async twin of process_payment for the async chat pipeline."""
+
+    key = idempotency_key or default_idempotency_key(order_id)
+    claim = await idempotency.claim_async(key, "payment", _fingerprint(order_id, payment_method))
+    if not claim.owned:
+        return _replay(claim, order_id, payment_method)
+
+    try:
+        with idempotency.leased(key):
+            result = await _charge_async(order_id, payment_method, key)
+    except Exception:
+        try:
+            await reservations.reopen_unpaid_async(order_id)
+        except Exception as e:
+            print(f"[Payment] ⚠️ Could not reopen holds of {order_id}: {e}")
+        await idempotency.abandon_async(key)
+        raise
+
+    if result.status == PAYMENT_SUCCESS:
+        await idempotency.complete_async(key, asdict(result))
+    else:
+        await idempotency.abandon_async(key)
+    return result
 
 
 # -------------------------------------------------------------------
@@ -1,22 +1,308 @@
 import os
+import uuid
 import datetime
-from pymongo import MongoClient
-from dotenv import load_dotenv
+from collections import defaultdict
 
-load_dotenv()
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 
-MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017/")
+from database import orders_col, inventory_col
+from database import aorders_col, ainventory_col
+from stock import restock_update
+from results import PostPurchaseResult, ReturnsReport
+import write_behind
 
-client = MongoClient(MONGO_URL)
-db = client["EY"]
+# -------------------------------------------------------------------
+# Returns.
+#
+# process_returns() takes a batch of return requests
+#
+#   [{"orderId": ..., "items": [{"productId": ..., "qty": n}], "reason": ...}]
+#
+# ("items" omitted = everything not yet returned) and does the work in
+# grouped, unordered bulk writes:
+#
+#   1. one find for all the orders, then validation per order and item
+#   2. one bulk_write marking the orders RETURNED / PARTIALLY_RETURNED.
+#      Each update carries the order's previous returnBatch as a version,
+#      so an order returned concurrently by another batch is skipped
+#      (and reported) instead of being restocked twice
+#   3. one bulk_write adding the units back, one update per (product,
+#      location) however many orders returned it
+#
+# Problems are reported per order / item in ReturnsReport.errors; the
+# rest of the batch goes through. A single chat return runs the same
+# path with a batch of one.
+# -------------------------------------------------------------------
 
-orders_col = db["orders"]
-inventory_col = db["inventory"]
-feedback_col = db["feedback"]
+RETURNABLE = ("PAID", "PARTIALLY_RETURNED")
+RETURN_BULK_CHUNK = int(os.getenv("RETURN_BULK_CHUNK", 1000))  # operations per bulk_write
 
-print("[Post-Purchase Agent] Connected to MongoDB")
-print("[Post-Purchase Agent] Using DB: EY")
 
+def _result(request_type, order_id, order, **fields):
+    """Result for a handled request; `fields` override what the order says."""
+    fields.setdefault("status", order.get("status", "UNKNOWN"))
+    fields.setdefault("fulfillment_type", order.get("fulfillment", {}).get("type"))
+    return PostPurchaseResult(request_type, order_id, **fields)
+
+
+def _new_batch_id():
+    return f"RET-{uuid.uuid4().hex[:10].upper()}"
+
+
+def _remaining(order):
+    """productId -> units bought and not yet returned."""
+    returned = order.get("returnedQty", {})
+    left = defaultdict(int)
+    for item in order.get("items", []):
+        left[item["productId"]] += item["qty"]
+    return {pid: qty - returned.get(pid, 0) for pid, qty in left.items()}
+
+
+def _return_lines(request, order, remaining, errors):
+    """Validated {productId: qty} to return for one request."""
+    order_id = order["orderId"]
+    if request.get("items") is None:
+        return {pid: qty for pid, qty in remaining.items() if qty > 0}
+
+    lines = defaultdict(int)
+    for item in request["items"]:
+        pid = item.get("productId")
+        left = remaining.get(pid, 0) - lines.get(pid, 0)
+        qty = item.get("qty", left)
+        if pid not in remaining:
+            errors.append({"orderId": order_id, "productId": pid, "error": "product not in order"})
+        elif not isinstance(qty, int) or qty <= 0:
+            errors.append({"orderId": order_id, "productId": pid, "error": f"invalid quantity {qty!r}"})
+        elif qty > left:
+            errors.append({"orderId": order_id, "productId": pid, "error": f"only {left} left to return"})
+        else:
+            lines[pid] += qty
+    return dict(lines)
+
+
+def _return_plan(requests, orders, batch_id, reason):
+    """
+    Validates the batch against the fetched orders. Returns the order
+    updates, the lines to restock per order and the errors found.
+    """
+    now = datetime.datetime.now()
+    ops, lines_by_order, errors = [], {}, []
+    for request in requests:
+        order_id = request.get("orderId")
+        order = orders.get(order_id)
+        if order is None:
+            errors.append({"orderId": order_id, "error": "order not found"})
+            continue
+        if order_id in lines_by_order:
+            errors.append({"orderId": order_id, "error": "order appears twice in the batch"})
+            continue
+        if order.get("status") not in RETURNABLE:
+            errors.append({"orderId": order_id, "error": f"order is {order.get('status')}, not returnable"})
+            continue
+
+        remaining = _remaining(order)
+        lines = _return_lines(request, order, remaining, errors)
+        if not lines:
+            if request.get("items") is None:
+                errors.append({"orderId": order_id, "error": "nothing left to return"})
+            continue
+
+        done = all(remaining[pid] == lines.get(pid, 0) for pid in remaining)
+        previous = order.get("returnBatch")
+        ops.append(UpdateOne(
+            {"orderId": order_id, "returnBatch": previous if previous else {"$exists": False}},
+            {
+                "$set": {
+                    "status": "RETURNED" if done else "PARTIALLY_RETURNED",
+                    "returnReason": request.get("reason", reason),
+                    "returnDate": now,
+                    "returnBatch": batch_id,
+                },
+                "$inc": {f"returnedQty.{pid}": qty for pid, qty in lines.items()},
+            },
+        ))
+        lines_by_order[order_id] = lines
+    return ops, lines_by_order, errors
+
+
+def _restock_groups(orders, lines_by_order):
+    """(productId, locationId) -> [(orderId, qty), ...]"""
+    groups = defaultdict(list)
+    for order_id, lines in lines_by_order.items():
+        location_id = orders[order_id].get("fulfillment", {}).get("locationId", "ONLINE")
+        for pid, qty in lines.items():
+            groups[(pid, location_id)].append((order_id, qty))
+    return groups
+
+
+def _restock_ops(groups):
+    return [
+        UpdateOne({"productId": pid}, restock_update(location_id, sum(q for _, q in refs)))
+        for (pid, location_id), refs in groups.items()
+    ]
+
+
+def _chunks(ops):
+    for start in range(0, len(ops), RETURN_BULK_CHUNK):
+        yield start, ops[start:start + RETURN_BULK_CHUNK]
+
+
+def _failed_indexes(error: BulkWriteError, offset: int) -> dict:
+    """Batch-wide op index -> error message, from an unordered bulk_write."""
+    return {offset + e["index"]: e.get("errmsg", "write failed") for e in error.details.get("writeErrors", [])}
+
+
+def _claim_errors(lines_by_order, claimed, errors):
+    """Drops orders whose return update did not apply (changed meanwhile)."""
+    for order_id in [oid for oid in lines_by_order if oid not in claimed]:
+        errors.append({"orderId": order_id, "error": "order changed while the batch ran; retry it"})
+        del lines_by_order[order_id]
+
+
+def _not_restocked(report, refs, pid, reason):
+    for order_id, _ in refs:
+        report.errors.append({"orderId": order_id, "productId": pid,
+                              "error": f"returned but not restocked: {reason}"})
+
+
+def _stocked_groups(report, groups, stocked_products):
+    """Groups whose product has an inventory record; reports the others."""
+    for (pid, _), refs in groups.items():
+        if pid not in stocked_products:
+            _not_restocked(report, refs, pid, "no inventory record for this product")
+    return {key: refs for key, refs in groups.items() if key[0] in stocked_products}
+
+
+def _restock_report(report, groups, failed):
+    for i, ((pid, _), refs) in enumerate(groups.items()):
+        if i in failed:
+            _not_restocked(report, refs, pid, failed[i])
+        else:
+            report.units_restocked += sum(q for _, q in refs)
+
+
+def _return_result(order_id, order, report):
+    errors = report.errors_for(order_id)
+    if errors:
+        return PostPurchaseResult("RETURN", order_id, error=f"❌ Return failed: {errors[0]['error']}")
+    return _result("RETURN", order_id, order, status="RETURNED")
+
+
+def _feedback_doc(order, order_id, details, rating):
+    return {
+        "orderId": order_id,
+        "customerId": order.get("customerId", "GUEST"),
+        "rating": rating,
+        "comment": details,
+        "date": datetime.datetime.now()
+    }
+
+
+# -------------------------------------------------------------------
+# BULK RETURNS (sync)
+# -------------------------------------------------------------------
+
+def _bulk(col, ops) -> tuple:
+    """Unordered bulk_write in chunks. Returns (matched, {op index: error})."""
+    matched, failed = 0, {}
+    for start, chunk in _chunks(ops):
+        try:
+            matched += col.bulk_write(chunk, ordered=False).matched_count
+        except BulkWriteError as e:
+            matched += e.details.get("nMatched", 0)
+            failed.update(_failed_indexes(e, start))
+    return matched, failed
+
+
+def _process_returns(requests, orders, reason=None) -> ReturnsReport:
+    report = ReturnsReport(_new_batch_id())
+    ops, lines_by_order, report.errors = _return_plan(requests, orders, report.batch_id, reason)
+
+    matched, failed = _bulk(orders_col, ops)
+    claimed = set(lines_by_order)
+    if matched < len(ops) or failed:
+        claimed = {o["orderId"] for o in orders_col.find({"returnBatch": report.batch_id}, {"orderId": 1})}
+    _claim_errors(lines_by_order, claimed, report.errors)
+    report.returned = list(lines_by_order)
+
+    groups = _restock_groups(orders, lines_by_order)
+    if groups:
+        pids = list({pid for pid, _ in groups})
+        stocked = {d["productId"] for d in inventory_col.find({"productId": {"$in": pids}}, {"productId": 1})}
+        groups = _stocked_groups(report, groups, stocked)
+        ops = _restock_ops(groups)
+        _, failed = _bulk(inventory_col, ops)
+        report.restock_writes = len(ops)
+        _restock_report(report, groups, failed)
+    return report
+
+
+def process_returns(requests: list, reason: str | None = None) -> ReturnsReport:
+    """
+    Returns many orders at once (warehouse end-of-day batches). See the
+    RETURNS section above for the request format.
+    """
+    order_ids = list({r.get("orderId") for r in requests})
+    orders = {o["orderId"]: o for o in orders_col.find({"orderId": {"$in": order_ids}})}
+    report = _process_returns(requests, orders, reason)
+    print(f"[Returns] {report.batch_id}: {len(report.returned)} orders, "
+          f"{report.units_restocked} units restocked, {len(report.errors)} errors")
+    return report
+
+# -------------------------------------------------------------------
+# BULK RETURNS (async)
+# -------------------------------------------------------------------
+
+async def _bulk_async(col, ops) -> tuple:
+    matched, failed = 0, {}
+    for start, chunk in _chunks(ops):
+        try:
+            matched += (await col.bulk_write(chunk, ordered=False)).matched_count
+        except BulkWriteError as e:
+            matched += e.details.get("nMatched", 0)
+            failed.update(_failed_indexes(e, start))
+    return matched, failed
+
+
+async def _process_returns_async(requests, orders, reason=None) -> ReturnsReport:
+    report = ReturnsReport(_new_batch_id())
+    ops, lines_by_order, report.errors = _return_plan(requests, orders, report.batch_id, reason)
+
+    matched, failed = await _bulk_async(aorders_col, ops)
+    claimed = set(lines_by_order)
+    if matched < len(ops) or failed:
+        cursor = aorders_col.find({"returnBatch": report.batch_id}, {"orderId": 1})
+        claimed = {o["orderId"] for o in await cursor.to_list(None)}
+    _claim_errors(lines_by_order, claimed, report.errors)
+    report.returned = list(lines_by_order)
+
+    groups = _restock_groups(orders, lines_by_order)
+    if groups:
+        pids = list({pid for pid, _ in groups})
+        cursor = ainventory_col.find({"productId": {"$in": pids}}, {"productId": 1})
+        stocked = {d["productId"] for d in await cursor.to_list(None)}
+        groups = _stocked_groups(report, groups, stocked)
+        ops = _restock_ops(groups)
+        _, failed = await _bulk_async(ainventory_col, ops)
+        report.restock_writes = len(ops)
+        _restock_report(report, groups, failed)
+    return report
+
+
+async def process_returns_async(requests: list, reason: str | None = None) -> ReturnsReport:
+    """Async twin of process_returns (backend endpoint)."""
+    order_ids = list({r.get("orderId") for r in requests})
+    cursor = aorders_col.find({"orderId": {"$in": order_ids}})
+    orders = {o["orderId"]: o for o in await cursor.to_list(None)}
+    report = await _process_returns_async(requests, orders, reason)
+    print(f"[Returns] {report.batch_id}: {len(report.returned)} orders, "
+          f"{report.units_restocked} units restocked, {len(report.errors)} errors")
+    return report
+
+# -------------------------------------------------------------------
+# POST-PURCHASE REQUESTS (chat)
+# -------------------------------------------------------------------
 
 def handle_post_purchase(
     request_type: str,
@@ -31,52 +317,53 @@ def handle_post_purchase(
     - FEEDBACK
     """
 
+    request_type = request_type.upper()
     order = orders_col.find_one({"orderId": order_id})
     if not order:
-        return f"❌ Order '{order_id}' not found."
-
-    status = order.get("status", "UNKNOWN")
-    fulfillment = order.get("fulfillment", {})
+        return PostPurchaseResult(request_type, order_id, error=f"❌ Order '{order_id}' not found.")
 
     # ---------------- TRACK ----------------
-    if request_type.upper() == "TRACK":
-        return (
-            f"📦 TRACKING INFO\n"
-            f"Order ID: {order_id}\n"
-            f"Status: {status}\n"
-            f"Fulfillment: {fulfillment.get('type', 'N/A')}"
-        )
+    if request_type == "TRACK":
+        return _result(request_type, order_id, order)
 
     # ---------------- RETURN ----------------
-    if request_type.upper() == "RETURN":
-        orders_col.update_one(
-            {"orderId": order_id},
-            {"$set": {
-                "status": "RETURNED",
-                "returnReason": details,
-                "returnDate": datetime.datetime.now()
-            }}
-        )
-
-        for item in order.get("items", []):
-            inventory_col.update_one(
-                {"productId": item["productId"],
-                 "stockByLocation.locationId": fulfillment.get("locationId", "ONLINE")},
-                {"$inc": {"stockByLocation.$.qty": item["qty"]}}
-            )
-
-        return f"🔄 RETURN PROCESSED for Order {order_id}"
+    if request_type == "RETURN":
+        report = _process_returns([{"orderId": order_id, "reason": details}], {order_id: order})
+        return _return_result(order_id, order, report)
 
     # ---------------- FEEDBACK ----------------
-    if request_type.upper() == "FEEDBACK":
-        feedback_col.insert_one({
-            "orderId": order_id,
-            "customerId": order.get("customerId", "GUEST"),
-            "rating": rating,
-            "comment": details,
-            "date": datetime.datetime.now()
-        })
-
-        return f"⭐ Feedback received ({rating}/5). Thank you!"
-
-    return "❌ Invalid post-purchase request."
+    if request_type == "FEEDBACK":
+        # nothing reads it back in this turn: written in the background
+        write_behind.enqueue("feedback", _feedback_doc(order, order_id, details, rating))
+
+        return _result(request_type, order_id, order, rating=rating)
+
+    return PostPurchaseResult(request_type, order_id, error="❌ Invalid post-purchase request.")
+
+
+async def handle_post_purchase_async(
+    request_type: str,
+    order_id: str,
+    details: str | None = None,
+    rating: int = 5
+):
+    """Async twin of handle_post_purchase for the async chat pipeline."""
+
+    request_type = request_type.upper()
+    order = await aorders_col.find_one({"orderId": order_id})
+    if not order:
+        return PostPurchaseResult(request_type, order_id, error=f"❌ Order '{order_id}' not found.")
+
+    if request_type == "TRACK":
+        return _result(request_type, order_id, order)
+
+    if request_type == "RETURN":
+        report = await _process_returns_async([{"orderId": order_id, "reason": details}], {order_id: order})
+        return _return_result(order_id, order, report)
+
+    if request_type == "FEEDBACK":
+        write_behind.enqueue("feedback", _feedback_doc(order, order_id, details, rating))
+
+        return _result(request_type, order_id, order, rating=rating)
+
+    return PostPurchaseResult(request_type, order_id, error="❌ Invalid post-purchase request.")
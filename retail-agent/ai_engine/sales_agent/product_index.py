@@ -0,0 +1,308 @@
+import os
+import re
+import time
+import asyncio
+import heapq
+import datetime
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+from bson import ObjectId
+from database import products_col, aproducts_col
+
+# -------------------------------------------------------------------
+# In-process product name index.
+#
+# Replaces {"name": {"$regex": q, "$options": "i"}} lookups, which scan
+# the whole products collection, with an in-memory resolution step:
+#
+#   normalized name tokens  ->  productIds        (postings)
+#   2-grams of each token   ->  vocabulary tokens (substring lookup)
+#
+# A query matches a product when its normalized text is a substring of
+# the product's normalized name, which is what the old case-insensitive
+# regex did for plain text. Agents then read Mongo by productId only.
+# -------------------------------------------------------------------
+
+REFRESH_SECONDS = float(os.getenv("PRODUCT_INDEX_REFRESH_SECONDS", 60))
+FULL_REFRESH_SECONDS = float(os.getenv("PRODUCT_INDEX_FULL_REFRESH_SECONDS", 3600))
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_name(text: str) -> str:
+    """'  T-Shirt (Blue)! ' -> 't shirt blue'"""
+    return _NON_ALNUM.sub(" ", (text or "").lower()).strip()
+
+
+def _grams(token: str) -> Set[str]:
+    if len(token) < 2:
+        return {token}
+    return {token[i:i + 2] for i in range(len(token) - 1)}
+
+
+class ProductNameIndex:
+    """Thread-safe name -> productId index with incremental updates."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._names: Dict[str, str] = {}             # productId -> normalized name
+        self._seq: Dict[str, int] = {}               # productId -> load order
+        self._exact: Dict[str, Dict[str, None]] = {}     # normalized name -> productIds
+        self._postings: Dict[str, Dict[str, None]] = {}  # token -> productIds, in load order
+        self._grams: Dict[str, Set[str]] = {}        # 2-gram -> tokens containing it
+        self._fragments: Dict[str, List[str]] = {}   # memo: query fragment -> tokens
+        self._next_seq = 0
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, product_id):
+        return product_id in self._names
+
+    # ---------------- writes ----------------
+
+    def add(self, product_id: str, name: str):
+        """Inserts or renames one product."""
+        if not product_id or not name:
+            return
+        norm = normalize_name(name)
+        with self._lock:
+            old = self._names.get(product_id)
+            if old == norm:
+                return
+            if old is not None:
+                self._unlink(product_id, old)
+            # Postings are dicts used as ordered sets; a (re)named product is
+            # appended with a new seq so every posting stays in seq order.
+            self._seq[product_id] = self._next_seq
+            self._next_seq += 1
+            self._names[product_id] = norm
+            self._exact.setdefault(norm, {})[product_id] = None
+            for token in set(norm.split()):
+                postings = self._postings.get(token)
+                if postings is None:
+                    postings = self._postings[token] = {}
+                    for g in _grams(token):
+                        self._grams.setdefault(g, set()).add(token)
+                    self._fragments.clear()
+                postings[product_id] = None
+
+    def add_many(self, docs: Iterable[dict]):
+        for doc in docs:
+            self.add(doc.get("productId"), doc.get("name"))
+
+    def remove(self, product_id: str):
+        with self._lock:
+            old = self._names.pop(product_id, None)
+            self._seq.pop(product_id, None)
+            if old is not None:
+                self._unlink(product_id, old)
+
+    def replace(self, docs: Iterable[dict]):
+        """Rebuilds from `docs` off to the side, then swaps in one step."""
+        fresh = ProductNameIndex()
+        fresh.add_many(docs)
+        with self._lock:
+            self._names, self._seq, self._exact = fresh._names, fresh._seq, fresh._exact
+            self._postings, self._grams = fresh._postings, fresh._grams
+            self._fragments, self._next_seq = {}, fresh._next_seq
+
+    def _unlink(self, product_id: str, norm: str):
+        same_name = self._exact.get(norm)
+        if same_name is not None:
+            same_name.pop(product_id, None)
+            if not same_name:
+                del self._exact[norm]
+        for token in set(norm.split()):
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[token]
+                self._fragments.clear()
+                for g in _grams(token):
+                    tokens = self._grams.get(g)
+                    if tokens is not None:
+                        tokens.discard(token)
+                        if not tokens:
+                            del self._grams[g]
+
+    # ---------------- reads ----------------
+
+    def _tokens_containing(self, fragment: str) -> List[str]:
+        """Vocabulary tokens that contain `fragment` as a substring."""
+        tokens = self._fragments.get(fragment)
+        if tokens is not None:
+            return tokens
+
+        if len(fragment) < 2:
+            tokens = [t for t in self._postings if fragment in t]
+        else:
+            candidates = None
+            for g in sorted(_grams(fragment), key=lambda g: len(self._grams.get(g, ()))):
+                found = self._grams.get(g)
+                if not found:
+                    candidates = set()
+                    break
+                candidates = set(found) if candidates is None else candidates & found
+                if not candidates:
+                    break
+            tokens = [t for t in candidates if fragment in t]
+
+        if len(self._fragments) > 10_000:
+            self._fragments.clear()
+        self._fragments[fragment] = tokens
+        return tokens
+
+    def resolve(self, query: str, limit: Optional[int] = None) -> List[str]:
+        """
+        Returns productIds whose name contains `query` (case and
+        punctuation insensitive). Exact name matches come first, then
+        catalog load order, which is what find_one used to return.
+        """
+        norm = normalize_name(query)
+        if not norm:
+            return []
+
+        with self._lock:
+            # Candidates come from the rarest query fragment; the substring
+            # check on the full name then implies every other fragment.
+            driver = None
+            for fragment in set(norm.split()):
+                postings = [self._postings[t] for t in self._tokens_containing(fragment)]
+                if not postings:
+                    return []
+                size = sum(map(len, postings))
+                if driver is None or size < driver[0]:
+                    driver = (size, postings)
+            postings = driver[1]
+
+            hits = list(self._exact.get(norm, ()))
+            if limit is not None and len(hits) >= limit:
+                return hits[:limit]
+
+            if len(postings) == 1:
+                candidates = iter(postings[0])
+            else:
+                candidates = heapq.merge(*postings, key=self._seq.__getitem__)
+
+            names = self._names
+            seen = set(hits)
+            for pid in candidates:
+                if pid in seen:
+                    continue
+                seen.add(pid)
+                if norm in names[pid]:
+                    hits.append(pid)
+                    if limit is not None and len(hits) >= limit:
+                        break
+            return hits
+
+
+# -------------------------------------------------------------------
+# Shared index, refreshed from MongoDB
+# -------------------------------------------------------------------
+
+product_index = ProductNameIndex()
+
+_refresh_lock = threading.Lock()
+_last_refresh = 0.0
+_last_full_refresh = 0.0
+_last_object_id = None
+
+_PROJECTION = {"_id": 1, "productId": 1, "name": 1}
+_MIN_OBJECT_ID = ObjectId("0" * 24)
+
+
+def refresh(full: bool = False):
+    """
+    Pulls catalog changes into the index.
+
+    Incremental refreshes read only documents inserted since the last
+    refresh (by _id) or stamped with a newer `updatedAt`. A periodic full
+    reload picks up deletions and writers that do not stamp `updatedAt`.
+    """
+    global _last_refresh, _last_full_refresh, _last_object_id
+
+    started = time.time()
+    if full or _last_object_id is None:
+        docs = list(products_col.find({}, _PROJECTION).sort("_id", 1))
+        product_index.replace(docs)
+        _last_full_refresh = started
+        print(f"[Product Index] Loaded {len(docs)} products")
+    else:
+        # small overlap for clock skew between this host and the writers
+        since = datetime.datetime.fromtimestamp(_last_refresh - 1, datetime.timezone.utc)
+        docs = list(products_col.find(
+            {"$or": [
+                {"_id": {"$gt": _last_object_id}},
+                {"updatedAt": {"$gt": since}},
+            ]},
+            _PROJECTION
+        ).sort("_id", 1))
+        product_index.add_many(docs)
+
+    newest = max((d["_id"] for d in docs if isinstance(d["_id"], ObjectId)), default=None)
+    if _last_object_id is None or (newest is not None and newest > _last_object_id):
+        _last_object_id = newest or _MIN_OBJECT_ID
+    _last_refresh = started
+
+
+def needs_refresh() -> bool:
+    return _last_object_id is None or time.time() - _last_refresh >= REFRESH_SECONDS
+
+
+def is_fresh() -> bool:
+    """
+    The index has loaded and refreshed within REFRESH_SECONDS, so a name
+    it does not resolve is really missing (not a failed or late refresh).
+    """
+    return not needs_refresh()
+
+
+def ensure_fresh():
+    """Refreshes the index if it is older than the configured TTLs."""
+    now = time.time()
+    if not needs_refresh():
+        return
+    # Only one thread refreshes; the others keep serving the current index.
+    if not _refresh_lock.acquire(blocking=_last_object_id is None):
+        return
+    try:
+        if _last_object_id is None or now - _last_refresh >= REFRESH_SECONDS:
+            refresh(full=now - _last_full_refresh >= FULL_REFRESH_SECONDS)
+    except Exception as e:
+        print(f"[Product Index] ⚠️ Refresh failed: {e}")
+    finally:
+        _refresh_lock.release()
+
+
+def resolve_product_ids(product_name: str, limit: Optional[int] = None) -> List[str]:
+    """User-supplied product name -> matching productIds (best first)."""
+    ensure_fresh()
+    return product_index.resolve(product_name, limit=limit)
+
+
+def find_product(product_name: str, projection: Optional[dict] = None) -> Optional[dict]:
+    """Best matching product document, fetched from Mongo by productId."""
+    ids = resolve_product_ids(product_name, limit=1)
+    if not ids:
+        return None
+    return products_col.find_one({"productId": ids[0]}, projection)
+
+
+# --- ASYNC VARIANTS (refresh runs in a worker thread, lookups in memory) ---
+
+async def resolve_product_ids_async(product_name: str, limit: Optional[int] = None) -> List[str]:
+    if needs_refresh():
+        await asyncio.to_thread(ensure_fresh)
+    return product_index.resolve(product_name, limit=limit)
+
+
+async def find_product_async(product_name: str, projection: Optional[dict] = None) -> Optional[dict]:
+    ids = await resolve_product_ids_async(product_name, limit=1)
+    if not ids:
+        return None
+    return await aproducts_col.find_one({"productId": ids[0]}, projection)
@@ -0,0 +1,215 @@
+import os
+import time
+import asyncio
+import datetime
+import threading
+from dataclasses import dataclass, replace
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+import category_tree
+from database import promotions_col
+from product_index import normalize_name
+
+# -------------------------------------------------------------------
+# In-process promotion index.
+#
+# Replaces the per-quote {"$or": [{"promoId": code},
+# {"name": {"$regex": code, "$options": "i"}}]} lookup. The promotions
+# collection
+#
+#   {promoId, name, discount, startDate?, endDate?, active?,
+#    applicableProducts?: [productId], applicableCategories?: [categoryId]}
+#
+# is compiled into
+#
+#   promoId (upper case)  ->  Promotion     (exact code)
+#   normalized name       ->  Promotion     (exact name, then substring)
+#
+# and each Promotion carries its validity window and eligibility sets
+# (empty = every product), so resolving a coupon and checking it against
+# a product need no MongoDB round trip. applicableCategories may name
+# parent categories (by categoryId or name): they are expanded through
+# category_tree to every descendant, since products carry leaf ids.
+#
+# A reload builds a new _Snapshot off to the side and replaces the
+# module reference in one assignment: readers take the reference once
+# and never see a half-built index.
+# -------------------------------------------------------------------
+
+REFRESH_SECONDS = float(os.getenv("PROMOTION_INDEX_REFRESH_SECONDS", 60))
+
+
+@dataclass(frozen=True, slots=True)
+class Promotion:
+    promo_id: str
+    name: str
+    discount: float
+    starts: Optional[datetime.datetime] = None
+    ends: Optional[datetime.datetime] = None
+    products: FrozenSet[str] = frozenset()
+    categories: FrozenSet[str] = frozenset()
+
+    def is_active(self, now: Optional[datetime.datetime] = None) -> bool:
+        now = now or datetime.datetime.now()
+        return (self.starts is None or self.starts <= now) and (self.ends is None or now < self.ends)
+
+    def applies_to(self, product: Optional[dict]) -> bool:
+        """True if `product` (productId / category) is eligible."""
+        if not self.products and not self.categories:
+            return True
+        if not product:
+            return False
+        return product.get("productId") in self.products or product.get("category") in self.categories
+
+
+def _naive(value) -> Optional[datetime.datetime]:
+    """Dates are compared with datetime.now(), like the rest of the app."""
+    if not isinstance(value, datetime.datetime):
+        return None
+    return value.astimezone().replace(tzinfo=None) if value.tzinfo else value
+
+
+def compile_promotion(doc: dict) -> Optional[Promotion]:
+    """None for documents that cannot be applied: no promoId, active: false, discount outside 0-100."""
+    if not doc.get("promoId") or doc.get("active") is False:
+        return None
+    discount = float(doc.get("discount", 0))
+    if not 0 <= discount <= 100:
+        return None
+    return Promotion(
+        promo_id=str(doc["promoId"]).upper(),
+        name=doc.get("name") or doc["promoId"],
+        discount=discount,
+        starts=_naive(doc.get("startDate")),
+        ends=_naive(doc.get("endDate")),
+        products=frozenset(doc.get("applicableProducts") or ()),
+        categories=frozenset(doc.get("applicableCategories") or ()),
+    )
+
+
+def with_descendants(promos: List[Promotion]) -> List[Promotion]:
+    """`promos` with their categories expanded to descendants (as-is if the tree is unavailable)."""
+    if not any(promo.categories for promo in promos):
+        return promos
+    try:
+        tree = category_tree.get_tree()
+    except Exception as e:
+        print(f"[Promotion Index] ⚠️ Category tree unavailable, exact categories only: {e}")
+        return promos
+    return [replace(promo, categories=category_tree.expand_categories(promo.categories, tree))
+            if promo.categories else promo for promo in promos]
+
+
+class _Snapshot:
+    """One compiled, read-only generation of the index."""
+
+    __slots__ = ("by_code", "by_name", "names", "loaded_at")
+
+    def __init__(self, docs=()):
+        self.by_code: Dict[str, Promotion] = {}
+        self.by_name: Dict[str, Promotion] = {}
+        promos = with_descendants([promo for promo in map(compile_promotion, docs) if promo is not None])
+        for promo in promos:
+            self.by_code.setdefault(promo.promo_id, promo)
+            self.by_name.setdefault(normalize_name(promo.name), promo)
+        self.names: Tuple[str, ...] = tuple(self.by_name)  # load order, for substring matches
+        self.loaded_at = time.time()
+
+    def lookup(self, coupon_code: str) -> Optional[Promotion]:
+        """Exact code, then exact name, then the first name containing the text."""
+        promo = self.by_code.get(coupon_code.strip().upper())
+        if promo is not None:
+            return promo
+        norm = normalize_name(coupon_code)
+        if not norm:
+            return None
+        promo = self.by_name.get(norm)
+        if promo is not None:
+            return promo
+        for name in self.names:
+            if norm in name:
+                return self.by_name[name]
+        return None
+
+
+# -------------------------------------------------------------------
+# Shared index, reloaded from MongoDB
+# -------------------------------------------------------------------
+
+_current: Optional[_Snapshot] = None
+_refresh_lock = threading.Lock()
+
+
+def reload() -> int:
+    """Recompiles the index from the promotions collection. Returns its size."""
+    global _current
+    snapshot = _Snapshot(promotions_col.find({}, {"_id": 0}))
+    _current = snapshot  # atomic swap
+    print(f"[Promotion Index] Loaded {len(snapshot.by_code)} promotions")
+    return len(snapshot.by_code)
+
+
+def needs_refresh() -> bool:
+    return _current is None or time.time() - _current.loaded_at >= REFRESH_SECONDS
+
+
+def ensure_fresh():
+    """Reloads the index if it is older than REFRESH_SECONDS."""
+    if not needs_refresh():
+        return
+    # Only one thread reloads; the others keep serving the current snapshot.
+    if not _refresh_lock.acquire(blocking=_current is None):
+        return
+    try:
+        if needs_refresh():
+            reload()
+    except Exception as e:
+        print(f"[Promotion Index] ⚠️ Reload failed: {e}")
+    finally:
+        _refresh_lock.release()
+
+
+def _snapshot() -> _Snapshot:
+    return _current or _Snapshot()
+
+
+def find_promotion(coupon_code: str) -> Optional[Promotion]:
+    """Promotion for a coupon code or name, active or not."""
+    ensure_fresh()
+    return _snapshot().lookup(coupon_code) if coupon_code else None
+
+
+def applicable_promotion(coupon_code: str, product: Optional[dict] = None,
+                         now: Optional[datetime.datetime] = None) -> Optional[Promotion]:
+    """The coupon's promotion if it is running now and covers `product`."""
+    promo = find_promotion(coupon_code)
+    if promo is None or not promo.is_active(now) or not promo.applies_to(product):
+        return None
+    return promo
+
+
+def promotion_index_stats() -> dict:
+    snapshot = _current
+    if snapshot is None:
+        return {"loaded": False}
+    return {
+        "loaded": True,
+        "promotions": len(snapshot.by_code),
+        "age_seconds": round(time.time() - snapshot.loaded_at, 1),
+    }
+
+
+# --- ASYNC VARIANTS (reload runs in a worker thread, lookups in memory) ---
+
+async def find_promotion_async(coupon_code: str) -> Optional[Promotion]:
+    if needs_refresh():
+        await asyncio.to_thread(ensure_fresh)
+    return _snapshot().lookup(coupon_code) if coupon_code else None
+
+
+async def applicable_promotion_async(coupon_code: str, product: Optional[dict] = None,
+                                     now: Optional[datetime.datetime] = None) -> Optional[Promotion]:
+    promo = await find_promotion_async(coupon_code)
+    if promo is None or not promo.is_active(now) or not promo.applies_to(product):
+        return None
+    return promo
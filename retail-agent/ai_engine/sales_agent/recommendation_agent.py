@@ -1,82 +1,140 @@
 import os
-from typing import Optional, List, Dict
-from pymongo import MongoClient
-from dotenv import load_dotenv
-import certifi
+import time
+import threading
+from typing import Optional, List, Dict, Iterable
+from database import products_col, aproducts_col
+from product_index import resolve_product_ids, resolve_product_ids_async, normalize_name
+from ttl_cache import TTLCache
+from pymongo.errors import OperationFailure
+import category_tree
 
 # -------------------------------------------------------------------
-# Load environment variables
+# Helper: Resolve categoryIds (supports hierarchy)
 # -------------------------------------------------------------------
 
-load_dotenv()
+def resolve_category_ids(category_name: str) -> List[str]:
+    """
+    Converts semantic category (parent or leaf)
+    into one or more internal categoryIds.
 
-MONGO_URL = os.getenv("MONGO_URL")
-DB_NAME = os.getenv("MONGO_DB_NAME", "EY")
+    Served from the in-memory category tree (category_tree.py):
+    no DB round trip per call.
+    """
+    return category_tree.resolve_category_ids(category_name)
 
 # -------------------------------------------------------------------
-# MongoDB Connection
+# Result cache
+#
+# Keyed on (resolved categoryIds, normalized query, limit). Each entry is
+# tagged with the categoryIds it depends on so product writes can drop
+# exactly the affected entries; free-text entries are dropped on any
+# product write, since a new or renamed product may start matching.
+#
+# Entries hold product documents only (no stock), so inventory and
+# reservation writes never make them stale. Products are written by
+# other services (catalog imports, init-mongo.js), not by this process:
+# their writes reach the cache through a change stream on `products`
+# (replica sets / Atlas), and otherwise entries live out their TTL.
 # -------------------------------------------------------------------
 
-client = MongoClient(
-    MONGO_URL,
-    serverSelectionTimeoutMS=5000,
-    tls=True,
-    tlsCAFile=certifi.where()
+_results = TTLCache(
+    max_entries=int(os.getenv("RECOMMENDATION_CACHE_SIZE", 512)),
+    ttl=float(os.getenv("RECOMMENDATION_CACHE_TTL_SECONDS", 120)),
 )
+_tags: Dict[str, set] = {}
+_tags_lock = threading.Lock()
+_FREE_TEXT = "*"
+
+WATCH_PRODUCTS = os.getenv("RECOMMENDATION_CACHE_WATCH", "false").lower() in ("1", "true", "yes")
+# Reconnect delay of the change stream: doubles per failed attempt.
+WATCH_RETRY_MIN_SECONDS = float(os.getenv("RECOMMENDATION_CACHE_WATCH_RETRY_MIN", 1))
+WATCH_RETRY_MAX_SECONDS = float(os.getenv("RECOMMENDATION_CACHE_WATCH_RETRY_MAX", 60))
+_CHANGE_STREAMS_UNSUPPORTED = 40573  # standalone mongod
+_watcher = None
+
+
+def _cache_put(key, results: List[Dict], tags: Iterable[str]):
+    _results.set(key, results)
+    with _tags_lock:
+        for tag in tags:
+            _tags.setdefault(tag, set()).add(key)
+        # Evicted/expired keys leave stale tag refs behind; prune now and then.
+        if sum(map(len, _tags.values())) > 4 * _results.max_entries:
+            for tag in list(_tags):
+                _tags[tag] = {k for k in _tags[tag] if k in _results}
+                if not _tags[tag]:
+                    del _tags[tag]
+
+
+def invalidate_recommendations(category_ids: Optional[Iterable[str]] = None):
+    """
+    Drops cached results for the given categoryIds (and all free-text
+    results). With no argument, clears the whole cache.
+    """
+    if category_ids is None:
+        _results.clear()
+        with _tags_lock:
+            _tags.clear()
+        return
 
-db = client[DB_NAME]
+    with _tags_lock:
+        keys = set(_tags.pop(_FREE_TEXT, ()))
+        for cat_id in category_ids:
+            keys |= _tags.pop(cat_id, set())
+    for key in keys:
+        _results.delete(key)
 
-products_col = db["products"]
-categories_col = db["categories"]
 
-print("\n[Recommendation Agent] Connected to MongoDB")
-print("[Recommendation Agent] Using DB:", DB_NAME)
-print("[DEBUG] Collections:", db.list_collection_names())
+def _on_product_change(event: dict):
+    """Drops the cache entries a change-stream event can have made stale."""
+    doc = event.get("fullDocument")
+    moved = (event.get("operationType") == "replace"
+             or "category" in event.get("updateDescription", {}).get("updatedFields", {}))
+    if doc and doc.get("category") and not moved:
+        invalidate_recommendations([doc["category"]])
+    else:  # deletes carry no document; a move leaves the old category unknown
+        invalidate_recommendations()
 
-# -------------------------------------------------------------------
-# Parent → Child category hierarchy (from your DB)
-# -------------------------------------------------------------------
 
-PARENT_CATEGORY_MAP = {
-    "Apparel": ["T-Shirts"],
-    "Sportswear": ["Footwear"],
-    "Electronics": ["Smartphones", "Laptops"],
-}
+def recommendation_cache_stats() -> dict:
+    return _results.stats()
 
-# -------------------------------------------------------------------
-# Helper: Resolve categoryIds (supports hierarchy)
-# -------------------------------------------------------------------
 
-def resolve_category_ids(category_name: str) -> List[str]:
+def _watch_products():
     """
-    Converts semantic category (parent or leaf)
-    into one or more internal categoryIds.
+    Follows the products change stream for good. On an error it
+    reconnects with exponential backoff and resumes after the last event
+    seen; if it cannot resume (no event yet, or the oplog moved on) the
+    whole cache is dropped, since writes may have been missed.
     """
-
-    if not category_name:
-        return []
-
-    category_ids = []
-
-    # 1️⃣ If category is a parent, expand children
-    if category_name in PARENT_CATEGORY_MAP:
-        for child_name in PARENT_CATEGORY_MAP[category_name]:
-            doc = categories_col.find_one(
-                {"name": {"$regex": f"^{child_name}$", "$options": "i"}}
-            )
-            if doc:
-                category_ids.append(doc["categoryId"])
-
-        return category_ids
-
-    # 2️⃣ Otherwise treat as leaf category
-    doc = categories_col.find_one(
-        {"name": {"$regex": f"^{category_name}$", "$options": "i"}}
-    )
-    if doc:
-        return [doc["categoryId"]]
-
-    return []
+    resume_token, delay = None, WATCH_RETRY_MIN_SECONDS
+    while True:
+        try:
+            with products_col.watch(full_document="updateLookup", resume_after=resume_token) as stream:
+                if resume_token is None:
+                    invalidate_recommendations()
+                delay = WATCH_RETRY_MIN_SECONDS
+                for event in stream:
+                    _on_product_change(event)
+                    resume_token = stream.resume_token
+        except OperationFailure as e:
+            if e.code == _CHANGE_STREAMS_UNSUPPORTED:
+                print(f"[Recommendation Agent] ⚠️ Change streams unsupported, using TTL only: {e}")
+                return
+            print(f"[Recommendation Agent] ⚠️ Change stream failed, reconnecting in {delay:g}s: {e}")
+            resume_token = None  # e.g. resume point no longer in the oplog
+        except Exception as e:
+            print(f"[Recommendation Agent] ⚠️ Change stream lost, reconnecting in {delay:g}s: {e}")
+        time.sleep(delay)
+        delay = min(delay * 2, WATCH_RETRY_MAX_SECONDS)
+
+
+def _start_product_watcher():
+    global _watcher
+    if _watcher is not None:
+        return
+    _watcher = threading.Thread(target=_watch_products, name="recommendation-cache-watch", daemon=True)
+    _watcher.start()
 
 # -------------------------------------------------------------------
 # Recommendation Agent (Worker Agent)
@@ -91,6 +149,9 @@ def get_recommendations(
     Fetch products using hierarchical category resolution.
     """
 
+    if WATCH_PRODUCTS:
+        _start_product_watcher()
+
     try:
         mongo_query = {}
 
@@ -106,6 +167,11 @@ def get_recommendations(
             if not category_ids:
                 return []
 
+            cache_key = (tuple(sorted(category_ids)), None, limit)
+            cached = _results.get(cache_key)
+            if cached is not None:
+                return list(cached)
+
             mongo_query = {
                 "category": {"$in": category_ids}
             }
@@ -114,8 +180,17 @@ def get_recommendations(
         # FREE-TEXT SEARCH (fallback)
         # -------------------------------
         elif query:
+            cache_key = ((), normalize_name(query), limit)
+            cached = _results.get(cache_key)
+            if cached is not None:
+                return list(cached)
+
+            product_ids = resolve_product_ids(query, limit=limit)
+            if not product_ids:
+                return []
+
             mongo_query = {
-                "name": {"$regex": query, "$options": "i"}
+                "productId": {"$in": product_ids}
             }
 
         else:
@@ -127,9 +202,75 @@ def get_recommendations(
             products_col.find(mongo_query, {"_id": 0}).limit(limit)
         )
 
+        if query and not category:
+            # keep the index's ranking (best name match first)
+            rank = {pid: i for i, pid in enumerate(product_ids)}
+            results.sort(key=lambda p: rank.get(p.get("productId"), len(rank)))
+
         print("[DEBUG] Product results:", results)
 
-        return results
+        if category:
+            _cache_put(cache_key, results, category_ids)
+        else:
+            _cache_put(cache_key, results, [_FREE_TEXT])
+
+        return list(results)
+
+    except Exception as e:
+        print("[Recommendation Agent] Error:", e)
+        return []
+
+
+async def get_recommendations_async(
+    category: Optional[str] = None,
+    query: Optional[str] = None,
+    limit: int = 5
+) -> List[Dict]:
+    """
+    Async twin of get_recommendations (same cache, async Mongo driver).
+    """
+
+    if WATCH_PRODUCTS:
+        _start_product_watcher()
+
+    try:
+        if category:
+            category_ids = await category_tree.resolve_category_ids_async(category)
+            if not category_ids:
+                return []
+
+            cache_key = (tuple(sorted(category_ids)), None, limit)
+            cached = _results.get(cache_key)
+            if cached is not None:
+                return list(cached)
+
+            mongo_query = {"category": {"$in": category_ids}}
+
+        elif query:
+            cache_key = ((), normalize_name(query), limit)
+            cached = _results.get(cache_key)
+            if cached is not None:
+                return list(cached)
+
+            product_ids = await resolve_product_ids_async(query, limit=limit)
+            if not product_ids:
+                return []
+
+            mongo_query = {"productId": {"$in": product_ids}}
+
+        else:
+            return []
+
+        results = await aproducts_col.find(mongo_query, {"_id": 0}).limit(limit).to_list(None)
+
+        if category:
+            _cache_put(cache_key, results, category_ids)
+        else:
+            rank = {pid: i for i, pid in enumerate(product_ids)}
+            results.sort(key=lambda p: rank.get(p.get("productId"), len(rank)))
+            _cache_put(cache_key, results, [_FREE_TEXT])
+
+        return list(results)
 
     except Exception as e:
         print("[Recommendation Agent] Error:", e)
@@ -0,0 +1,268 @@
+import os
+import time
+import datetime
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+import category_tree
+from database import products_col
+from loyalty_agent import MAX_POINT_COVERAGE
+from promotion_index import Promotion, compile_promotion, with_descendants
+from ttl_cache import TTLCache
+
+# -------------------------------------------------------------------
+# Catalog-wide repricing simulator.
+#
+# Answers "what would this promotion do?" before it goes live. The
+# catalog is loaded once into columns
+#
+#   product_ids  (str)   prices  (float64)   category_codes  (int32)
+#
+# and simulate() prices every SKU in one vectorized pass with the same
+# rules as loyalty_agent._price_quote: the coupon comes off the base
+# price, then loyalty points cover at most `coverage` of what is left.
+# With several candidate promotions each SKU gets the best one it is
+# eligible for (a shopper redeems one coupon), so a set of candidates
+# can be compared against each one alone.
+#
+# Loaded catalogs are kept per category for REPRICING_CATALOG_TTL_SECONDS
+# (cached_catalog), so repeated what-ifs do not re-read every product;
+# reload_catalogs() drops them after a bulk price change.
+#
+# Candidates are promotion documents (same fields as the promotions
+# collection) or promotion_index.Promotion objects. A document the
+# promotion index would skip (no promoId, active: false, a discount
+# outside 0-100) raises ValueError rather than silently pricing without
+# it, as do points < 0 and a coverage outside 0-1. Parent categories
+# cover their descendants (category_tree), in candidates and in the
+# catalog filter alike. Validity windows
+# are ignored unless `at` is given, since the point is usually to try
+# a promotion that has not started yet.
+# -------------------------------------------------------------------
+
+_CATALOG_PROJECTION = {"_id": 0, "productId": 1, "price": 1, "category": 1}
+PERCENTILES = (5, 25, 50, 75, 95)
+SAVINGS_PCT_BINS = np.arange(0, 105, 5)  # histogram edges, % of base price
+
+_catalogs = TTLCache(
+    max_entries=int(os.getenv("REPRICING_CATALOG_CACHE_SIZE", 16)),
+    ttl=float(os.getenv("REPRICING_CATALOG_TTL_SECONDS", 300)),
+)
+_load_lock = threading.Lock()
+
+
+@dataclass(slots=True)
+class Catalog:
+    product_ids: np.ndarray      # str, one per SKU
+    prices: np.ndarray           # float64
+    category_codes: np.ndarray   # int32 index into `categories`
+    categories: tuple = ()       # categoryId per code
+
+    def __len__(self):
+        return len(self.prices)
+
+    @classmethod
+    def from_docs(cls, docs: Iterable[dict]) -> "Catalog":
+        codes: Dict[str, int] = {}
+        ids, prices, cats = [], [], []
+        for doc in docs:
+            ids.append(doc.get("productId"))
+            prices.append(doc.get("price") or 0)
+            cats.append(codes.setdefault(doc.get("category"), len(codes)))
+        return cls(
+            product_ids=np.array(ids, dtype=str),
+            prices=np.array(prices, dtype=np.float64),
+            category_codes=np.array(cats, dtype=np.int32),
+            categories=tuple(codes),
+        )
+
+
+def load_catalog(query: Optional[dict] = None, batch_size: int = 10_000) -> Catalog:
+    """Reads (productId, price, category) for every matching product."""
+    t0 = time.perf_counter()
+    catalog = Catalog.from_docs(products_col.find(query or {}, _CATALOG_PROJECTION, batch_size=batch_size))
+    print(f"[Repricing] Loaded {len(catalog)} SKUs in {time.perf_counter() - t0:.2f}s")
+    return catalog
+
+
+def cached_catalog(category: Optional[str] = None) -> Catalog:
+    """
+    load_catalog() for one category (categoryId or name, descendants
+    included; None = all), reused until the TTL runs out.
+    """
+    catalog = _catalogs.get(category)
+    if catalog is None:
+        with _load_lock:  # concurrent requests share one load
+            catalog = _catalogs.get(category, count=False)
+            if catalog is None:
+                query = {"category": {"$in": sorted(category_tree.expand_categories([category]))}} if category else None
+                catalog = load_catalog(query)
+                _catalogs.set(category, catalog)
+    return catalog
+
+
+def reload_catalogs():
+    _catalogs.clear()
+
+
+def catalog_cache_stats() -> dict:
+    return _catalogs.stats()
+
+
+def _distribution(values: np.ndarray) -> dict:
+    if not len(values):
+        return {}
+    points = np.percentile(values, PERCENTILES)
+    return {
+        "min": round(float(values.min()), 2),
+        "mean": round(float(values.mean()), 2),
+        **{f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, points)},
+        "max": round(float(values.max()), 2),
+    }
+
+
+@dataclass(slots=True)
+class SimulationResult:
+    catalog: Catalog
+    promotions: List[Promotion]
+    discount_pct: np.ndarray      # coupon discount each SKU gets (0 = none)
+    winner: np.ndarray            # index into `promotions`, -1 = none
+    coupon_discount: np.ndarray   # ₹ per SKU
+    points_redeemed: np.ndarray   # ₹ per SKU
+    final_prices: np.ndarray
+    elapsed: float = 0            # seconds spent in the vectorized pass
+    _summary: Optional[dict] = field(default=None, repr=False)
+
+    @property
+    def savings(self) -> np.ndarray:
+        return self.coupon_discount + self.points_redeemed
+
+    def summary(self) -> dict:
+        """Final-price and savings distributions for the whole catalog."""
+        if self._summary is not None:
+            return self._summary
+        prices, savings = self.catalog.prices, self.savings
+        savings_pct = np.divide(savings * 100, prices, out=np.zeros_like(savings), where=prices > 0)
+        hist, edges = np.histogram(savings_pct, bins=SAVINGS_PCT_BINS)
+        reach = np.bincount(self.winner + 1, minlength=len(self.promotions) + 1)[1:]
+
+        codes, n_categories = self.catalog.category_codes, len(self.catalog.categories)
+        per_category = np.bincount(codes, minlength=n_categories)
+        category_pct = np.bincount(codes, weights=savings_pct, minlength=n_categories)
+
+        self._summary = {
+            "skus": len(prices),
+            "discounted_skus": int((self.winner >= 0).sum()),
+            "reach": {promo.promo_id: int(n) for promo, n in zip(self.promotions, reach)},
+            "base_total": round(float(prices.sum()), 2),
+            "final_total": round(float(self.final_prices.sum()), 2),
+            "coupon_total": round(float(self.coupon_discount.sum()), 2),
+            "points_total": round(float(self.points_redeemed.sum()), 2),
+            "final_price": _distribution(self.final_prices),
+            "savings": _distribution(savings),
+            "savings_pct": _distribution(savings_pct),
+            "savings_pct_histogram": {f"{lo:g}-{hi:g}": int(n) for lo, hi, n in zip(edges, edges[1:], hist)},
+            "by_category": {
+                cat: {"skus": int(count), "mean_savings_pct": round(float(total / count), 2)}
+                for cat, count, total in zip(self.catalog.categories, per_category, category_pct) if count
+            },
+            "seconds": round(self.elapsed, 3),
+        }
+        return self._summary
+
+    def render(self) -> str:
+        s = self.summary()
+        lines = [
+            f"📊 REPRICING SIMULATION ({s['skus']} SKUs, {s['seconds']:.2f}s)",
+            "Promotions: " + (", ".join(f"{pid} ({n} SKUs)" for pid, n in s["reach"].items()) or "none"),
+            f"Revenue at list price: ₹{s['base_total']:,.2f}",
+            f"Revenue after promotion: ₹{s['final_total']:,.2f} "
+            f"(coupons -₹{s['coupon_total']:,.2f}, points -₹{s['points_total']:,.2f})",
+        ]
+        for label, key in (("Final price", "final_price"), ("Savings ₹", "savings"), ("Savings %", "savings_pct")):
+            d = s[key]
+            if not d:  # empty catalog
+                lines.append(f"{label}: no SKUs")
+                continue
+            lines.append(f"{label}: p5 {d['p5']} | p50 {d['p50']} | p95 {d['p95']} | max {d['max']}")
+        return "\n".join(lines)
+
+    __str__ = render
+
+
+def _eligible(catalog: Catalog, promo: Promotion) -> Optional[np.ndarray]:
+    """Boolean mask of SKUs `promo` covers (None = every SKU)."""
+    if not promo.products and not promo.categories:
+        return None
+    codes = [code for code, cat in enumerate(catalog.categories) if cat in promo.categories]
+    mask = np.isin(catalog.category_codes, codes)
+    if promo.products:
+        mask |= np.isin(catalog.product_ids, list(promo.products))
+    return mask
+
+
+def simulate(
+    catalog: Catalog,
+    promotions: Sequence = (),
+    points: Optional[float] = None,
+    coverage: float = MAX_POINT_COVERAGE,
+    at: Optional[datetime.datetime] = None,
+    expand_categories: bool = True,
+) -> SimulationResult:
+    """
+    Prices every SKU under the best eligible candidate promotion, then
+    redeems up to `points` loyalty points per purchase (capped at
+    `coverage` of the price after the coupon). points=None: no loyalty.
+    Raises ValueError for a candidate that is not a usable promotion and
+    for out-of-range points / coverage. expand_categories=False matches
+    categories exactly (catalogs with no category tree behind them).
+    """
+    if points is not None and points < 0:
+        raise ValueError("points must not be negative")
+    if not 0 <= coverage <= 1:
+        raise ValueError("coverage must be between 0 and 1")
+    promos = []
+    for i, candidate in enumerate(promotions):
+        try:
+            promo = candidate if isinstance(candidate, Promotion) else compile_promotion(candidate)
+        except (TypeError, ValueError) as e:  # e.g. a non-numeric discount
+            raise ValueError(f"promotion {i}: {e}") from e
+        if promo is None or not 0 <= promo.discount <= 100:
+            raise ValueError(f"promotion {i}: needs a promoId, a discount from 0 to 100 and must not be active: false")
+        if at is None or promo.is_active(at):
+            promos.append(promo)
+    if expand_categories:
+        promos = with_descendants(promos)
+
+    t0 = time.perf_counter()
+    prices = catalog.prices
+    discount_pct = np.zeros_like(prices)
+    winner = np.full(len(prices), -1, dtype=np.int32)
+    for k, promo in enumerate(promos):
+        better = discount_pct < promo.discount
+        mask = _eligible(catalog, promo)
+        if mask is not None:
+            better &= mask
+        discount_pct[better] = promo.discount
+        winner[better] = k
+
+    coupon = prices * discount_pct / 100
+    net = prices - coupon
+    if points is None:
+        redeemed = np.zeros_like(prices)
+    else:
+        redeemed = np.minimum(points, net * coverage).clip(min=0)
+
+    return SimulationResult(
+        catalog=catalog,
+        promotions=promos,
+        discount_pct=discount_pct,
+        winner=winner,
+        coupon_discount=coupon,
+        points_redeemed=redeemed,
+        final_prices=net - redeemed,
+        elapsed=time.perf_counter() - t0,
+    )
@@ -0,0 +1,622 @@
+import os
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import datetime
+import threading
+from typing import Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+import stock
+from database import inventory_col, ainventory_col, orders_col, aorders_col
+from database import reservations_col, areservations_col, stock_shards_col, astock_shards_col
+from ttl_cache import TTLCache
+
+# -------------------------------------------------------------------
+# Stock reservations.
+#
+# place_order takes stock out of a location with a conditional atomic
+# decrement (stock.take_stock: the update only matches while the
+# location still has the units), so concurrent buyers can never drive a
+# quantity negative. Each reservation is recorded as a hold:
+#
+#   reservations: {reservationId, orderId, productId, locationId, shard,
+#                  qty, status, createdAt, expiresAt, updatedAt}
+#
+#   HELD      -> COMMITTED   payment is being taken (commit)
+#   COMMITTED -> SOLD        the payment went through (settle, in the
+#                            payment transaction)
+#   COMMITTED -> HELD        the gateway declined or the payment failed;
+#                            the buyer may retry (reopen). The sweeper
+#                            also reopens commits older than
+#                            COMMIT_TIMEOUT_SECONDS whose payment never
+#                            finished, so they can expire normally
+#   HELD      -> RELEASED    expired unpaid (release_expired; the order
+#                            becomes EXPIRED) or cancelled (release)
+#
+# Releasing claims the hold first and gives the stock back second, so a
+# crash in between can lose units from sale but never sell them twice.
+#
+# Hot SKUs: split_stock() moves a location's units into N sub-counters
+# (stock_shards: {productId, locationId, shard, qty}), separate
+# documents that buyers decrement in parallel instead of queueing on
+# one inventory document. Sub-counter units are not in the inventory
+# totals until merge_stock() hands the remainder back, so the inventory
+# document of a split SKU is flagged `sharded: true` and availability
+# adds shard_stock() (one query per batch, only for flagged SKUs).
+#
+# Indexes (created by ensure_indexes() on app startup):
+#          reservations {orderId}, {status, expiresAt}, {status, updatedAt};
+#          stock_shards {productId, locationId, shard}.
+# -------------------------------------------------------------------
+
+HOLD_SECONDS = int(os.getenv("RESERVATION_HOLD_SECONDS", 900))
+SWEEP_INTERVAL_SECONDS = float(os.getenv("RESERVATION_SWEEP_SECONDS", 30))
+COMMIT_TIMEOUT_SECONDS = int(os.getenv("RESERVATION_COMMIT_TIMEOUT_SECONDS", 600))
+RESERVE_ATTEMPTS = 3  # re-reads of the inventory document after lost races
+
+HELD, COMMITTED, SOLD, RELEASED = "HELD", "COMMITTED", "SOLD", "RELEASED"
+
+# productId -> {locationId: [shard numbers]} ({} = not sharded)
+_shard_map = TTLCache(max_entries=4096, ttl=float(os.getenv("SHARD_MAP_TTL_SECONDS", 5)))
+_SHARD_FIELDS = {"_id": 0, "locationId": 1, "shard": 1}
+
+_stats = {"reserved": 0, "rejected": 0, "lost_races": 0, "committed": 0, "expired": 0, "released": 0,
+          "stale_reopened": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name, n=1):
+    with _stats_lock:
+        _stats[name] += n
+
+
+def reservation_stats() -> dict:
+    with _stats_lock:
+        return dict(_stats)
+
+# -------------------------------------------------------------------
+# HELPERS (shared by the sync and async paths)
+# -------------------------------------------------------------------
+
+def _hold_doc(order_id, product_id, location_id, qty, shard=None) -> dict:
+    now = datetime.datetime.now()
+    return {
+        "reservationId": f"RES-{uuid.uuid4().hex[:10].upper()}",
+        "orderId": order_id,
+        "productId": product_id,
+        "locationId": location_id,
+        "shard": shard,
+        "qty": qty,
+        "status": HELD,
+        "createdAt": now,
+        "expiresAt": now + datetime.timedelta(seconds=HOLD_SECONDS),
+    }
+
+
+def _matches_hint(location_id, hint) -> bool:
+    return bool(hint) and hint.upper() in location_id.upper()
+
+
+def _shard_groups(docs) -> Dict[str, List[int]]:
+    groups = {}
+    for doc in docs:
+        groups.setdefault(doc["locationId"], []).append(doc["shard"])
+    return groups
+
+
+def _shard_order(groups, hint) -> List[tuple]:
+    """(locationId, shards in random order) for every sharded location."""
+    order = []
+    for location_id in sorted(groups, key=lambda loc: not _matches_hint(loc, hint)):
+        shards = list(groups[location_id])
+        random.shuffle(shards)  # spread buyers over the sub-counters
+        order.append((location_id, shards))
+    return order
+
+
+def _entry_order(inventory, qty, hint) -> List[str]:
+    """Locations that had enough stock when read: the hinted one, then the fullest."""
+    entries = [
+        (entry["locationId"], int(entry.get("qty", 0)))
+        for entry in (inventory or {}).get("stockByLocation", [])
+        if int(entry.get("qty", 0)) >= qty
+    ]
+    entries.sort(key=lambda e: (not _matches_hint(e[0], hint), -e[1]))
+    return [location_id for location_id, _ in entries]
+
+
+def _shard_filter(product_id, location_id, shard, qty=None) -> dict:
+    flt = {"productId": product_id, "locationId": location_id, "shard": shard}
+    if qty is not None:
+        flt["qty"] = {"$gte": qty}
+    return flt
+
+
+def _expired_filter(now) -> dict:
+    return {"status": HELD, "expiresAt": {"$lt": now}}
+
+
+def _claim(status) -> dict:
+    return {"$set": {"status": status, "updatedAt": datetime.datetime.now()}}
+
+
+def _expire_orders(order_ids) -> tuple:
+    return {"orderId": {"$in": order_ids}, "status": "CONFIRMED"}, {"$set": {"status": "EXPIRED"}}
+
+
+def _reopen_update() -> dict:
+    expires = datetime.datetime.now() + datetime.timedelta(seconds=HOLD_SECONDS)
+    return {"$set": {"status": HELD, "expiresAt": expires, "updatedAt": datetime.datetime.now()}}
+
+
+def _stale_commit_filter(now) -> dict:
+    return {"status": COMMITTED, "updatedAt": {"$lt": now - datetime.timedelta(seconds=COMMIT_TIMEOUT_SECONDS)}}
+
+
+def _indexes():
+    """(collection name, keys) for every index the sweeps and lookups rely on."""
+    return [
+        ("reservations", [("orderId", 1)]),
+        ("reservations", [("status", 1), ("expiresAt", 1)]),
+        ("reservations", [("status", 1), ("updatedAt", 1)]),
+        ("stock_shards", [("productId", 1), ("locationId", 1), ("shard", 1)]),
+    ]
+
+# -------------------------------------------------------------------
+# RESERVE (sync)
+# -------------------------------------------------------------------
+
+def _shards_for(product_id) -> Dict[str, List[int]]:
+    groups = _shard_map.get(product_id)
+    if groups is None:
+        groups = _shard_groups(stock_shards_col.find({"productId": product_id, "qty": {"$gt": 0}}, _SHARD_FIELDS))
+        _shard_map.set(product_id, groups)
+    return groups
+
+
+def _take_from_shards(product_id, location_id, shards, qty) -> Optional[int]:
+    assert qty > 0, qty
+    for shard in shards:
+        result = stock_shards_col.update_one(
+            _shard_filter(product_id, location_id, shard, qty), {"$inc": {"qty": -qty}}
+        )
+        if result.matched_count:
+            return shard
+    return None
+
+
+def _record_hold(hold) -> dict:
+    try:
+        reservations_col.insert_one(hold)
+    except Exception:
+        _give_back(hold)
+        raise
+    _count("reserved")
+    return hold
+
+
+def reserve(product_id: str, qty: int, order_id: str, location_hint: Optional[str] = None) -> Optional[dict]:
+    """
+    Takes `qty` units out of stock for an order and records the hold.
+    Prefers sub-counters, then the location matching `location_hint`,
+    then the fullest location. Returns the hold, or None if no single
+    location has the units. `qty` must be positive (callers validate).
+    """
+    assert qty > 0, qty
+    shards = _shards_for(product_id)
+    for location_id, numbers in _shard_order(shards, location_hint):
+        shard = _take_from_shards(product_id, location_id, numbers, qty)
+        if shard is not None:
+            return _record_hold(_hold_doc(order_id, product_id, location_id, qty, shard))
+    if shards:
+        _shard_map.delete(product_id)  # every sub-counter ran dry: re-read next time
+
+    for _ in range(RESERVE_ATTEMPTS):
+        inventory = inventory_col.find_one({"productId": product_id}, {"_id": 0, "stockByLocation": 1})
+        locations = _entry_order(inventory, qty, location_hint)
+        if not locations:
+            break
+        for location_id in locations:
+            if stock.take_stock(product_id, location_id, qty):
+                return _record_hold(_hold_doc(order_id, product_id, location_id, qty))
+            _count("lost_races")
+    _count("rejected")
+    return None
+
+# -------------------------------------------------------------------
+# COMMIT / RELEASE (sync)
+# -------------------------------------------------------------------
+
+def _give_back(hold):
+    if hold.get("shard") is not None:
+        result = stock_shards_col.update_one(
+            _shard_filter(hold["productId"], hold["locationId"], hold["shard"]), {"$inc": {"qty": hold["qty"]}}
+        )
+        if result.matched_count:
+            return
+    stock.restock(hold["productId"], hold["locationId"], hold["qty"])
+
+
+def commit(order_id: str) -> bool:
+    """
+    Marks the order's holds COMMITTED before payment is taken, so the
+    sweeper can no longer release them. False if a hold already expired
+    (its stock went back on sale); the order's other holds stay HELD.
+    Orders placed without holds commit trivially.
+    """
+    result = reservations_col.update_many({"orderId": order_id, "status": HELD}, _claim(COMMITTED))
+    if reservations_col.count_documents({"orderId": order_id, "status": RELEASED}):
+        reopen(order_id)
+        return False
+    _count("committed", result.modified_count)
+    return True
+
+
+def reopen(order_id: str):
+    """COMMITTED -> HELD with a fresh expiry (payment declined; the buyer may retry)."""
+    reservations_col.update_many({"orderId": order_id, "status": COMMITTED}, _reopen_update())
+
+
+def settle(order_id: str, session=None):
+    """COMMITTED -> SOLD once the order is paid (pass the payment transaction's session)."""
+    reservations_col.update_many({"orderId": order_id, "status": COMMITTED}, _claim(SOLD), session=session)
+
+
+def reopen_unpaid(order_id: str):
+    """reopen() unless the order did get paid: for payments that failed with an error."""
+    if not orders_col.find_one({"orderId": order_id, "status": "PAID"}, {"_id": 1}):
+        reopen(order_id)
+
+
+def release(order_id: str) -> int:
+    """Cancels an order's unpaid holds and puts the stock back. Returns holds released."""
+    released = 0
+    while True:
+        hold = reservations_col.find_one_and_update(
+            {"orderId": order_id, "status": HELD}, _claim(RELEASED), return_document=ReturnDocument.AFTER
+        )
+        if not hold:
+            break
+        _give_back(hold)
+        released += 1
+    _count("released", released)
+    return released
+
+
+def release_expired(limit: int = 1000) -> int:
+    """Releases holds whose payment never arrived. Returns holds released."""
+    now = datetime.datetime.now()
+    order_ids = []
+    while len(order_ids) < limit:
+        hold = reservations_col.find_one_and_update(
+            _expired_filter(now), _claim(RELEASED), return_document=ReturnDocument.AFTER
+        )
+        if not hold:
+            break
+        _give_back(hold)
+        order_ids.append(hold["orderId"])
+    released = len(order_ids)
+    if released:
+        orders_col.update_many(*_expire_orders(order_ids))
+        _count("expired", released)
+        print(f"[Reservations] Released {released} expired hold(s)")
+    return released
+
+
+def reopen_stale_commits(limit: int = 1000) -> int:
+    """
+    Holds left COMMITTED by a payment that crashed: SOLD if the order got
+    paid, otherwise back to HELD so they expire. Returns holds reopened.
+    """
+    holds = list(reservations_col.find(_stale_commit_filter(datetime.datetime.now()), {"orderId": 1}).limit(limit))
+    order_ids = list({hold["orderId"] for hold in holds})
+    if not order_ids:
+        return 0
+    paid = {o["orderId"] for o in orders_col.find({"orderId": {"$in": order_ids}, "status": "PAID"}, {"orderId": 1})}
+    reopened = 0
+    for order_id in order_ids:
+        if order_id in paid:
+            settle(order_id)
+        else:
+            result = reservations_col.update_many({"orderId": order_id, "status": COMMITTED}, _reopen_update())
+            reopened += result.modified_count
+    if reopened:
+        _count("stale_reopened", reopened)
+        print(f"[Reservations] Reopened {reopened} hold(s) left committed by unfinished payments")
+    return reopened
+
+
+def ensure_indexes():
+    """Creates the indexes (a no-op for ones that exist). Failures are logged, not raised."""
+    cols = {"reservations": reservations_col, "stock_shards": stock_shards_col}
+    for name, keys in _indexes():
+        try:
+            cols[name].create_index(keys)
+        except Exception as e:
+            print(f"[Reservations] ⚠️ Could not create index {name} {keys}: {e}")
+
+
+def start_sweeper(interval: float = SWEEP_INTERVAL_SECONDS) -> threading.Thread:
+    """Runs reopen_stale_commits() and release_expired() every `interval` seconds in a daemon thread."""
+    def loop():
+        while True:
+            try:
+                reopen_stale_commits()
+                release_expired()
+            except Exception as e:
+                print(f"[Reservations] ⚠️ Sweep failed: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=loop, name="reservation-sweeper", daemon=True)
+    thread.start()
+    return thread
+
+# -------------------------------------------------------------------
+# ASYNC VARIANTS
+# -------------------------------------------------------------------
+
+async def _shards_for_async(product_id) -> Dict[str, List[int]]:
+    groups = _shard_map.get(product_id)
+    if groups is None:
+        docs = await astock_shards_col.find({"productId": product_id, "qty": {"$gt": 0}}, _SHARD_FIELDS).to_list(None)
+        groups = _shard_groups(docs)
+        _shard_map.set(product_id, groups)
+    return groups
+
+
+async def _take_from_shards_async(product_id, location_id, shards, qty) -> Optional[int]:
+    assert qty > 0, qty
+    for shard in shards:
+        result = await astock_shards_col.update_one(
+            _shard_filter(product_id, location_id, shard, qty), {"$inc": {"qty": -qty}}
+        )
+        if result.matched_count:
+            return shard
+    return None
+
+
+async def _record_hold_async(hold) -> dict:
+    try:
+        await areservations_col.insert_one(hold)
+    except Exception:
+        await _give_back_async(hold)
+        raise
+    _count("reserved")
+    return hold
+
+
+async def reserve_async(product_id: str, qty: int, order_id: str,
+                        location_hint: Optional[str] = None) -> Optional[dict]:
+    assert qty > 0, qty
+    shards = await _shards_for_async(product_id)
+    for location_id, numbers in _shard_order(shards, location_hint):
+        shard = await _take_from_shards_async(product_id, location_id, numbers, qty)
+        if shard is not None:
+            return await _record_hold_async(_hold_doc(order_id, product_id, location_id, qty, shard))
+    if shards:
+        _shard_map.delete(product_id)
+
+    for _ in range(RESERVE_ATTEMPTS):
+        inventory = await ainventory_col.find_one({"productId": product_id}, {"_id": 0, "stockByLocation": 1})
+        locations = _entry_order(inventory, qty, location_hint)
+        if not locations:
+            break
+        for location_id in locations:
+            if await stock.take_stock_async(product_id, location_id, qty):
+                return await _record_hold_async(_hold_doc(order_id, product_id, location_id, qty))
+            _count("lost_races")
+    _count("rejected")
+    return None
+
+
+async def _give_back_async(hold):
+    if hold.get("shard") is not None:
+        result = await astock_shards_col.update_one(
+            _shard_filter(hold["productId"], hold["locationId"], hold["shard"]), {"$inc": {"qty": hold["qty"]}}
+        )
+        if result.matched_count:
+            return
+    await stock.restock_async(hold["productId"], hold["locationId"], hold["qty"])
+
+
+async def commit_async(order_id: str) -> bool:
+    result = await areservations_col.update_many({"orderId": order_id, "status": HELD}, _claim(COMMITTED))
+    if await areservations_col.count_documents({"orderId": order_id, "status": RELEASED}):
+        await reopen_async(order_id)
+        return False
+    _count("committed", result.modified_count)
+    return True
+
+
+async def reopen_async(order_id: str):
+    await areservations_col.update_many({"orderId": order_id, "status": COMMITTED}, _reopen_update())
+
+
+async def settle_async(order_id: str, session=None):
+    await areservations_col.update_many({"orderId": order_id, "status": COMMITTED}, _claim(SOLD), session=session)
+
+
+async def reopen_unpaid_async(order_id: str):
+    if not await aorders_col.find_one({"orderId": order_id, "status": "PAID"}, {"_id": 1}):
+        await reopen_async(order_id)
+
+
+async def release_async(order_id: str) -> int:
+    released = 0
+    while True:
+        hold = await areservations_col.find_one_and_update(
+            {"orderId": order_id, "status": HELD}, _claim(RELEASED), return_document=ReturnDocument.AFTER
+        )
+        if not hold:
+            break
+        await _give_back_async(hold)
+        released += 1
+    _count("released", released)
+    return released
+
+
+async def release_expired_async(limit: int = 1000) -> int:
+    now = datetime.datetime.now()
+    order_ids = []
+    while len(order_ids) < limit:
+        hold = await areservations_col.find_one_and_update(
+            _expired_filter(now), _claim(RELEASED), return_document=ReturnDocument.AFTER
+        )
+        if not hold:
+            break
+        await _give_back_async(hold)
+        order_ids.append(hold["orderId"])
+    released = len(order_ids)
+    if released:
+        await aorders_col.update_many(*_expire_orders(order_ids))
+        _count("expired", released)
+        print(f"[Reservations] Released {released} expired hold(s)")
+    return released
+
+
+async def reopen_stale_commits_async(limit: int = 1000) -> int:
+    cursor = areservations_col.find(_stale_commit_filter(datetime.datetime.now()), {"orderId": 1}).limit(limit)
+    order_ids = list({hold["orderId"] for hold in await cursor.to_list(None)})
+    if not order_ids:
+        return 0
+    docs = await aorders_col.find({"orderId": {"$in": order_ids}, "status": "PAID"}, {"orderId": 1}).to_list(None)
+    paid = {o["orderId"] for o in docs}
+    reopened = 0
+    for order_id in order_ids:
+        if order_id in paid:
+            await settle_async(order_id)
+        else:
+            result = await areservations_col.update_many({"orderId": order_id, "status": COMMITTED},
+                                                         _reopen_update())
+            reopened += result.modified_count
+    if reopened:
+        _count("stale_reopened", reopened)
+        print(f"[Reservations] Reopened {reopened} hold(s) left committed by unfinished payments")
+    return reopened
+
+
+async def sweep_forever_async(interval: float = SWEEP_INTERVAL_SECONDS):
+    """Event-loop sweeper for the backend (started on app startup)."""
+    while True:
+        try:
+            await reopen_stale_commits_async()
+            await release_expired_async()
+        except Exception as e:
+            print(f"[Reservations] ⚠️ Sweep failed: {e}")
+        await asyncio.sleep(interval)
+
+
+async def ensure_indexes_async():
+    cols = {"reservations": areservations_col, "stock_shards": astock_shards_col}
+    for name, keys in _indexes():
+        try:
+            await cols[name].create_index(keys)
+        except Exception as e:
+            print(f"[Reservations] ⚠️ Could not create index {name} {keys}: {e}")
+
+# -------------------------------------------------------------------
+# HOT SKU SUB-COUNTERS
+# -------------------------------------------------------------------
+
+_SHARD_STOCK_FIELDS = {"_id": 0, "productId": 1, "locationId": 1, "region": 1, "qty": 1}
+
+
+def _group_shard_stock(docs) -> Dict[str, List[dict]]:
+    stock_by_product = {}
+    for doc in docs:
+        stock_by_product.setdefault(doc["productId"], []).append(doc)
+    return stock_by_product
+
+
+def sharded_ids(inventory_docs) -> List[str]:
+    """productIds of the documents flagged by split_stock."""
+    return [doc["productId"] for doc in inventory_docs if doc and doc.get("sharded")]
+
+
+def shard_stock(product_ids: List[str]) -> Dict[str, List[dict]]:
+    """Units in sub-counters: productId -> [{locationId, region, qty}]."""
+    if not product_ids:
+        return {}
+    return _group_shard_stock(stock_shards_col.find(
+        {"productId": {"$in": product_ids}, "qty": {"$gt": 0}}, _SHARD_STOCK_FIELDS))
+
+
+async def shard_stock_async(product_ids: List[str]) -> Dict[str, List[dict]]:
+    if not product_ids:
+        return {}
+    return _group_shard_stock(await astock_shards_col.find(
+        {"productId": {"$in": product_ids}, "qty": {"$gt": 0}}, _SHARD_STOCK_FIELDS).to_list(None))
+
+
+def split_stock(product_id: str, location_id: str, shards: int, qty: Optional[int] = None) -> int:
+    """
+    Moves `qty` units (default: all of them) from a location into
+    `shards` sub-counters. Returns the units moved (0 if the location
+    no longer had them).
+    """
+    inventory = inventory_col.find_one({"productId": product_id}, {"_id": 0, "stockByLocation": 1})
+    entry = next((e for e in (inventory or {}).get("stockByLocation", [])
+                  if e.get("locationId") == location_id), {})
+    if qty is None:
+        qty = int(entry.get("qty", 0))
+    if qty <= 0:
+        return 0
+    # flag first: availability may briefly under-count, never double count
+    inventory_col.update_one({"productId": product_id}, {"$set": {"sharded": True}})
+    if not stock.take_stock(product_id, location_id, qty):
+        return 0
+    base, extra = divmod(qty, shards)
+    for shard in range(shards):
+        stock_shards_col.update_one(
+            _shard_filter(product_id, location_id, shard),
+            {"$inc": {"qty": base + (shard < extra)},
+             "$setOnInsert": {"region": entry.get("region", stock.DEFAULT_REGION)}},
+            upsert=True,
+        )
+    _shard_map.delete(product_id)
+    print(f"[Reservations] Split {qty} units of {product_id}@{location_id} into {shards} sub-counters")
+    return qty
+
+
+def merge_stock(product_id: str, location_id: Optional[str] = None) -> int:
+    """Hands what is left in the sub-counters back to the location. Returns units moved."""
+    flt = {"productId": product_id, **({"locationId": location_id} if location_id else {})}
+    moved = 0
+    for doc in stock_shards_col.find(flt, {"_id": 1, "locationId": 1}):
+        before = stock_shards_col.find_one_and_update(
+            {"_id": doc["_id"], "qty": {"$gt": 0}}, {"$set": {"qty": 0}}, return_document=ReturnDocument.BEFORE
+        )
+        if before:
+            stock.restock(product_id, before["locationId"], before["qty"])
+            moved += before["qty"]
+    # a release that lands after the delete goes to the location instead
+    stock_shards_col.delete_many({**flt, "qty": 0})
+    if not stock_shards_col.count_documents({"productId": product_id}):
+        inventory_col.update_one({"productId": product_id}, {"$unset": {"sharded": ""}})
+    _shard_map.delete(product_id)
+    print(f"[Reservations] Merged {moved} units of {product_id} back from sub-counters")
+    return moved
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stock reservation maintenance.")
+    parser.add_argument("--sweep", action="store_true", help="release expired holds once")
+    parser.add_argument("--split", metavar="PRODUCT_ID", help="split a hot SKU's stock into sub-counters")
+    parser.add_argument("--merge", metavar="PRODUCT_ID", help="merge a SKU's sub-counters back")
+    parser.add_argument("--location", default="ONLINE")
+    parser.add_argument("--shards", type=int, default=8)
+    args = parser.parse_args()
+
+    if args.sweep:
+        reopen_stale_commits()
+        release_expired()
+    elif args.split:
+        split_stock(args.split, args.location, args.shards)
+    elif args.merge:
+        merge_stock(args.merge, args.location)
+    else:
+        parser.print_help()
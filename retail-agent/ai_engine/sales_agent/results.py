@@ -0,0 +1,295 @@
+import datetime
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+# -------------------------------------------------------------------
+# Typed agent results.
+#
+# The order, payment, pricing and post-purchase agents return one of
+# these instead of a formatted string. The orchestrator reads fields
+# (order_id, status, ...) directly, render() produces the chat text and
+# panel() the dict the backend sends for the UI's side panels. str()
+# renders too, so LangChain tools still hand readable text to an LLM.
+#
+# `error` is set (and every other field may be empty) when the request
+# could not be carried out; render() then returns the error message.
+# -------------------------------------------------------------------
+
+
+@dataclass(slots=True)
+class OrderResult:
+    order_id: Optional[str] = None
+    product_id: Optional[str] = None
+    product_name: Optional[str] = None
+    quantity: int = 0
+    total: float = 0
+    fulfillment_type: Optional[str] = None
+    location: Optional[str] = None
+    location_id: Optional[str] = None  # where the units were reserved
+    hold_expires_at: Optional[datetime.datetime] = None
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def render(self) -> str:
+        if self.error:
+            return self.error
+        return (
+            f"📦 ORDER CONFIRMED\n"
+            f"Order ID: {self.order_id}\n"
+            f"Total: ₹{self.total}\n"
+            f"Reserved at: {self.location_id} "
+            f"until {self.hold_expires_at:%H:%M}\n"
+            f"Next step: Payment"
+        )
+
+    def panel(self) -> dict:
+        if self.error:
+            return {"Mode": "-", "Status": "Failed", "Reason": self.error}
+        return {
+            "Mode": self.fulfillment_type,
+            "Status": "Reserved",
+            "Order ID": self.order_id,
+            "Location": self.location_id,
+            "Reserved until": f"{self.hold_expires_at:%H:%M}",
+        }
+
+    __str__ = render
+
+
+PAYMENT_SUCCESS, PAYMENT_FAILED, PAYMENT_IN_PROGRESS = "SUCCESS", "FAILED", "IN_PROGRESS"
+ALREADY_PAID, ORDER_NOT_FOUND, HOLD_EXPIRED = "ALREADY_PAID", "ORDER_NOT_FOUND", "HOLD_EXPIRED"
+IDEMPOTENCY_CONFLICT = "IDEMPOTENCY_CONFLICT"
+
+
+@dataclass(slots=True)
+class PaymentResult:
+    order_id: str
+    status: str  # one of the constants above
+    payment_id: Optional[str] = None
+    amount: float = 0
+    method: Optional[str] = None
+    message: Optional[str] = None  # gateway message
+
+    @property
+    def ok(self) -> bool:
+        return self.status in (PAYMENT_SUCCESS, ALREADY_PAID)
+
+    def render(self) -> str:
+        if self.status == PAYMENT_SUCCESS:
+            return (
+                f"💳 PAYMENT SUCCESS\n"
+                f"Payment ID: {self.payment_id}\n"
+                f"Amount: ₹{self.amount}\n"
+                f"Order closed."
+            )
+        if self.status == ALREADY_PAID:
+            return f"✅ Order already paid. Payment ID: {self.payment_id}"
+        if self.status == ORDER_NOT_FOUND:
+            return f"❌ Payment Failed: Order '{self.order_id}' not found."
+        if self.status == PAYMENT_IN_PROGRESS:
+            return "⏳ This payment is already being processed. Please check again in a moment."
+        if self.status == HOLD_EXPIRED:
+            return ("❌ Payment Failed: the reservation for this order expired and the stock "
+                    "was released. Please place the order again.")
+        if self.status == IDEMPOTENCY_CONFLICT:
+            return "❌ Payment rejected: this idempotency key was already used for a different payment."
+        return f"❌ Payment failed: {self.message}"
+
+    def panel(self) -> dict:
+        status = "Completed" if self.ok else "Failed"
+        if self.status == PAYMENT_IN_PROGRESS:
+            status = "Processing"
+        return {
+            "Mode": self.method or "-",
+            "Status": status,
+            "Payment ID": self.payment_id,
+            "Amount": self.amount,
+            "Message": self.message,
+        }
+
+    __str__ = render
+
+
+@dataclass(slots=True)
+class PriceQuote:
+    base_price: float = 0
+    final_price: float = 0
+    savings: float = 0
+    coupon_code: Optional[str] = None
+    coupon_name: Optional[str] = None
+    coupon_discount: float = 0  # ₹ taken off by the coupon (0 = invalid coupon)
+    points_balance: Optional[int] = None  # None when points were not used
+    points_redeemed: float = 0
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def render(self) -> str:
+        if self.error:
+            return self.error
+        logs = []
+        if self.coupon_code:
+            if self.coupon_discount:
+                logs.append(f"🎫 Coupon {self.coupon_name}: -₹{self.coupon_discount:.2f}")
+            else:
+                logs.append("⚠️ Invalid coupon")
+        if self.points_redeemed > 0:
+            logs.append(f"💎 Loyalty applied: -₹{self.points_redeemed:.2f}")
+
+        return (
+            f"💰 PRICE SUMMARY\n"
+            f"Original: ₹{self.base_price}\n"
+            f"{chr(10).join(logs)}\n"
+            f"------------------\n"
+            f"Final: ₹{self.final_price:.2f}\n"
+            f"You saved: ₹{self.savings:.2f}"
+        )
+
+    def panel(self) -> dict:
+        return {
+            "Tier": "-",
+            "Points": self.points_balance or 0,
+            "Points used": round(self.points_redeemed, 2),
+            "Coupon": self.coupon_name if self.coupon_discount else None,
+            "Original": self.base_price,
+            "Final": round(self.final_price, 2),
+            "You saved": round(self.savings, 2),
+        }
+
+    __str__ = render
+
+
+@dataclass(slots=True)
+class CartLine:
+    product_id: str
+    name: str
+    quantity: int
+    unit_price: float
+    base_price: float = 0  # unit_price * quantity
+    coupon_code: Optional[str] = None
+    coupon_name: Optional[str] = None
+    coupon_discount: float = 0
+    points_redeemed: float = 0  # this line's share of the cart's points
+    final_price: float = 0
+
+
+@dataclass(slots=True)
+class CartQuote:
+    customer_id: str
+    lines: List[CartLine] = field(default_factory=list)
+    subtotal: float = 0
+    coupon_discount: float = 0
+    points_balance: Optional[int] = None  # None when points were not used
+    points_redeemed: float = 0
+    final_total: float = 0
+    savings: float = 0
+    errors: List[dict] = field(default_factory=list)  # {line, product, error} for unpriced lines
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def render(self) -> str:
+        if not self.lines:
+            return self.errors[0]["error"] if self.errors else "🛒 Your cart is empty."
+        rows = []
+        for line in self.lines:
+            row = f"• {line.name} x{line.quantity}: ₹{line.base_price:.2f}"
+            if line.coupon_discount:
+                row += f" (🎫 {line.coupon_name} -₹{line.coupon_discount:.2f})"
+            elif line.coupon_code:
+                row += " (⚠️ invalid coupon)"
+            rows.append(row)
+        rows += [f"⚠️ {e['product']}: {e['error']}" for e in self.errors]
+        if self.points_redeemed > 0:
+            rows.append(f"💎 Loyalty applied: -₹{self.points_redeemed:.2f}")
+
+        return (
+            f"🛒 CART SUMMARY\n"
+            f"{chr(10).join(rows)}\n"
+            f"------------------\n"
+            f"Subtotal: ₹{self.subtotal:.2f}\n"
+            f"Final: ₹{self.final_total:.2f}\n"
+            f"You saved: ₹{self.savings:.2f}"
+        )
+
+    def panel(self) -> dict:
+        return {
+            "Tier": "-",
+            "Points": self.points_balance or 0,
+            "Points used": round(self.points_redeemed, 2),
+            "Items": sum(line.quantity for line in self.lines),
+            "Original": round(self.subtotal, 2),
+            "Final": round(self.final_total, 2),
+            "You saved": round(self.savings, 2),
+        }
+
+    __str__ = render
+
+
+@dataclass(slots=True)
+class PostPurchaseResult:
+    request_type: str
+    order_id: str
+    status: Optional[str] = None  # order status after the request
+    fulfillment_type: Optional[str] = None
+    rating: Optional[int] = None
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def render(self) -> str:
+        if self.error:
+            return self.error
+        if self.request_type == "TRACK":
+            return (
+                f"📦 TRACKING INFO\n"
+                f"Order ID: {self.order_id}\n"
+                f"Status: {self.status}\n"
+                f"Fulfillment: {self.fulfillment_type or 'N/A'}"
+            )
+        if self.request_type == "RETURN":
+            return f"🔄 RETURN PROCESSED for Order {self.order_id}"
+        return f"⭐ Feedback received ({self.rating}/5). Thank you!"
+
+    def panel(self) -> dict:
+        return {
+            "Mode": self.fulfillment_type or "-",
+            "Status": self.status,
+            "Order ID": self.order_id,
+        }
+
+    __str__ = render
+
+
+@dataclass(slots=True)
+class ReturnsReport:
+    batch_id: str
+    returned: List[str] = field(default_factory=list)  # orders marked (partially) returned
+    units_restocked: int = 0
+    restock_writes: int = 0  # grouped (product, location) updates sent
+    errors: List[dict] = field(default_factory=list)  # {orderId, productId?, error}
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def errors_for(self, order_id: str) -> List[dict]:
+        return [e for e in self.errors if e["orderId"] == order_id]
+
+    def render(self) -> str:
+        return (
+            f"🔄 RETURNS PROCESSED ({self.batch_id})\n"
+            f"Orders returned: {len(self.returned)}\n"
+            f"Units restocked: {self.units_restocked}\n"
+            f"Errors: {len(self.errors)}"
+        )
+
+    __str__ = render
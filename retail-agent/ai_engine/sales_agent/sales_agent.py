@@ -1,45 +1,108 @@
-from recommendation_agent import get_recommendations
-from inventory_agent import inventory_agent_run
-from fulfillment_agent import place_order
-from payment_agent import process_payment
-from loyalty_agent import calculate_final_price
-from post_purchase_agent import handle_post_purchase
-from cache import get_session, save_session
-import re
+import os
+import json
+import importlib
+
+from keyword_matcher import KeywordMatcher, PLURAL_SUFFIXES
+from results import PAYMENT_FAILED, PAYMENT_IN_PROGRESS
+
+# -------------------------------------------------------------------
+# WORKER AGENTS
+#
+# The conversation flow below is written once and *yields* the agent
+# calls it needs. sales_agent_chat() runs those calls with the blocking
+# agents (terminal mode); sales_agent_chat_async() awaits their async
+# twins (backend). Agents are imported on first use (see load_agents)
+# so a fresh worker can answer without loading langchain and every
+# agent module.
+# -------------------------------------------------------------------
+
+AGENTS = {
+    # name: (module, sync callable, async callable)
+    "recommend": ("recommendation_agent", "get_recommendations", "get_recommendations_async"),
+    "inventory": ("inventory_agent", "inventory_agent_run", "inventory_agent_run_async"),
+    "inventory_many": ("inventory_agent", "inventory_agent_run_many", "inventory_agent_run_many_async"),
+    "order": ("fulfillment_agent", "place_order", "place_order_async"),
+    "payment": ("payment_agent", "process_payment", "process_payment_async"),
+    "price": ("loyalty_agent", "calculate_final_price", "calculate_final_price_async"),
+    "post_purchase": ("post_purchase_agent", "handle_post_purchase", "handle_post_purchase_async"),
+}
+
+AGENT_MODULES = sorted({module for module, _, _ in AGENTS.values()})
+
+
+def load_agents():
+    """Imports every worker agent up front (used by the readiness phase)."""
+    for name in AGENT_MODULES:
+        importlib.import_module(name)
+
+
+def _call_agent(name, kwargs):
+    module, sync_attr, _ = AGENTS[name]
+    fn = getattr(importlib.import_module(module), sync_attr)
+    if hasattr(fn, "invoke"):  # LangChain tool
+        return fn.invoke(kwargs)
+    return fn(**kwargs)
+
+
+async def _call_agent_async(name, kwargs):
+    module, _, async_attr = AGENTS[name]
+    fn = getattr(importlib.import_module(module), async_attr)
+    return await fn(**kwargs)
 
 # -------------------------------------------------------------------
 # SEMANTIC NORMALIZATION
 # -------------------------------------------------------------------
 
 CATEGORY_KEYWORDS = {
-    "Smartphones": ["phone", "mobile", "smartphone"],
+    "Smartphones": ["phone", "mobile", "smartphone", "iphone"],
     "Laptops": ["laptop", "notebook", "computer", "macbook","mac"],
     "Sportswear": ["shoe", "shoes", "running shoes", "sports shoes"],
     "Apparel": ["t shirt", "t-shirt", "tshirt", "shirt", "clothing"],
-    "Accessories": ["watch", "belt", "wallet", "accessory"],
+    "Accessories": ["watch", "smartwatch", "belt", "wallet", "accessory"],
     "Home Decor": ["decor", "home decor"],
-    "Bags": ["bag", "bags", "backpack"]
+    "Bags": ["bag", "bags", "backpack", "handbag"]
 }
 
 YES_WORDS = ["yes", "yeah", "yep", "sure", "ok"]
 STORE_WORDS = ["store", "shop", "outlet", "nearby"]
-DELIVERY_WORDS = ["delivery", "home", "ship", "online"]
+DELIVERY_WORDS = ["delivery", "home", "ship", "shipping", "shipped", "online"]
 PAYMENT_WORDS = ["upi", "card", "pos", "gift"]
 POST_WORDS = ["track", "return", "feedback"]
 
+# More category synonyms and brand names, as JSON {"Category": [keyword, ...]}
+CATEGORY_KEYWORDS_FILE = os.getenv("CATEGORY_KEYWORDS_FILE")
+if CATEGORY_KEYWORDS_FILE:
+    with open(CATEGORY_KEYWORDS_FILE, encoding="utf-8") as f:
+        for category, keywords in json.load(f).items():
+            CATEGORY_KEYWORDS.setdefault(category, []).extend(keywords)
+
+# Every table above compiled into one automaton, so a message is scanned
+# once however many keywords there are. Keywords match whole words, plus
+# plural and -ing/-ed endings ("tracking", "returned", "phones"). Words
+# that only contain a keyword ("iphone", "shipping", "handbag") need
+# their own entry; ai_engine/tests/test_keyword_router.py pins both sides.
+ROUTER = KeywordMatcher(CATEGORY_KEYWORDS, suffixes=PLURAL_SUFFIXES + ("ing", "ed"))
+ROUTER.add_all("STORE", STORE_WORDS)
+ROUTER.add_all("DELIVERY", DELIVERY_WORDS)
+ROUTER.add_all("PAYMENT", PAYMENT_WORDS)
+ROUTER.add_all("POST", POST_WORDS)
+ROUTER.build()
+
 # -------------------------------------------------------------------
 # HELPERS
 # -------------------------------------------------------------------
 
-def resolve_category(text):
-    text = text.lower()
-    for category, keywords in CATEGORY_KEYWORDS.items():
-        for kw in keywords:
-            if kw in text:
-                return category
+def _category(hits):
+    for category in CATEGORY_KEYWORDS:  # table order breaks ties
+        if category in hits:
+            return category
     return None
 
 
+def resolve_category(text):
+    return _category(ROUTER.concepts(text))
+
+
 def parse_product_selection(text, recommendations):
     text = text.lower().strip()
 
@@ -55,11 +118,25 @@ def parse_product_selection(text, recommendations):
     return None
 
 
+def _stock_label(i, inventory):
+    availability = inventory[i] if i < len(inventory) else {}
+    if availability.get("status") == "in_stock":
+        return f" ({availability['total_qty']} in stock)"
+    if availability.get("status") == "out_of_stock":
+        return " (out of stock)"
+    return ""
+
+
 # -------------------------------------------------------------------
 # SALES AGENT (ORCHESTRATOR)
 # -------------------------------------------------------------------
 
-def sales_agent_chat(user_message: str, session: dict):
+def _chat_flow(user_message: str, session: dict):
+    """
+    One conversation turn. Yields (agent_name, kwargs) for every worker
+    agent call and receives the agent's result back; returns
+    (reply, session).
+    """
 
     session.setdefault("stage", "BROWSING")
     session.setdefault("recommendations", [])
@@ -68,11 +145,12 @@ def sales_agent_chat(user_message: str, session: dict):
     session.setdefault("customer_id", "CUST_GUEST")
 
     msg = user_message.lower().strip()
+    hits = ROUTER.concepts(msg)  # concept -> matched keywords, one pass
 
     # --------------------------------------------------
     # OVERRIDE: NEW CATEGORY ALWAYS RESETS FLOW ✅
     # --------------------------------------------------
-    new_category = resolve_category(msg)
+    new_category = _category(hits)
 
     if new_category and session.get("stage") == "AWAITING_SELECTION":
         session["stage"] = "BROWSING"
@@ -82,30 +160,32 @@ def sales_agent_chat(user_message: str, session: dict):
     # --------------------------------------------------
     # POST PURCHASE (TRACK / RETURN / FEEDBACK)
     # --------------------------------------------------
-    if any(w in msg for w in POST_WORDS):
+    post = hits.get("POST", [])
+    if post:
         if not session.get("order_id"):
             return "Please provide your order ID first.", session
 
-        if "track" in msg:
-            return handle_post_purchase(
-                request_type="TRACK",
-                order_id=session["order_id"]
-            ), session
-
-        if "return" in msg:
-            return handle_post_purchase(
+        if "track" in post:
+            request = dict(request_type="TRACK", order_id=session["order_id"])
+        elif "return" in post:
+            request = dict(
                 request_type="RETURN",
                 order_id=session["order_id"],
                 details="User initiated return"
-            ), session
-
-        if "feedback" in msg:
-            return handle_post_purchase(
+            )
+        else:
+            request = dict(
                 request_type="FEEDBACK",
                 order_id=session["order_id"],
                 details=msg,
                 rating=5
-            ), session
+            )
+
+        result = yield "post_purchase", request
+        if result.ok and result.request_type != "FEEDBACK":
+            session["fulfillment"] = result.panel()
+
+        return result.render(), session
 
     # --------------------------------------------------
     # PRODUCT SELECTION
@@ -138,10 +218,10 @@ def sales_agent_chat(user_message: str, session: dict):
     # --------------------------------------------------
     # STORE AVAILABILITY
     # --------------------------------------------------
-    if any(w in msg for w in STORE_WORDS):
+    if "STORE" in hits and session["selected_product"]:
         product = session["selected_product"]
 
-        inventory = inventory_agent_run({"product_name": product["name"]})
+        inventory = yield "inventory", {"payload": {"product_name": product["name"]}}
         availability = inventory.get("availability", {})
         locations = availability.get("locations", {})
 
@@ -166,25 +246,25 @@ def sales_agent_chat(user_message: str, session: dict):
     if msg in YES_WORDS and session["stage"] == "CONFIRM_RESERVATION":
         product = session["selected_product"]
 
-        result = place_order.invoke({
+        result = yield "order", {
             "product_name": product["name"],
             "quantity": 1,
             "fulfillment_type": "PICKUP",
             "location_query": "Mall"
-        })
+        }
 
-        match = re.search(r"(ORD-[A-Z0-9]+)", result)
-        if match:
-            session["order_id"] = match.group()
-            session["stage"] = "LOYALTY"
+        if not result.ok:
+            return result.render(), session
 
-            return (
-                f"{result}\n\n"
-                "Do you want to apply coupons or loyalty points?",
-                session
-            )
+        session["order_id"] = result.order_id
+        session["fulfillment"] = result.panel()
+        session["stage"] = "LOYALTY"
 
-        return result, session
+        return (
+            f"{result.render()}\n\n"
+            "Do you want to apply coupons or loyalty points?",
+            session
+        )
 
     # --------------------------------------------------
     # LOYALTY
@@ -192,17 +272,19 @@ def sales_agent_chat(user_message: str, session: dict):
     if session["stage"] == "LOYALTY":
         product = session["selected_product"]
 
-        price_info = calculate_final_price(
+        quote = yield "price", dict(
             product_name=product["name"],
             base_price=product["price"],
             customer_id=session["customer_id"],
             use_points=True
         )
 
+        if quote.ok:
+            session["loyalty"] = quote.panel()
         session["stage"] = "PAYMENT"
 
         return (
-            f"{price_info}\n\n"
+            f"{quote.render()}\n\n"
             "How would you like to pay? (UPI / Card / POS / Gift)",
             session
         )
@@ -211,15 +293,23 @@ def sales_agent_chat(user_message: str, session: dict):
     # PAYMENT
     # --------------------------------------------------
     if session["stage"] == "PAYMENT":
-        result = process_payment.invoke({
+        result = yield "payment", {
             "order_id": session["order_id"],
             "payment_method": msg.upper()
-        })
+        }
+
+        session["payment"] = result.panel()
+        if result.status in (PAYMENT_FAILED, PAYMENT_IN_PROGRESS):  # the hold is kept: try again
+            return (
+                f"{result.render()}\n\n"
+                "How would you like to pay? (UPI / Card / POS / Gift)",
+                session
+            )
 
         session["stage"] = "COMPLETED"
 
         return (
-            f"{result}\n\n"
+            f"{result.render()}\n\n"
             "🎉 Thank you for shopping with us!\n"
             "You can track, return, or leave feedback anytime.",
             session
@@ -229,12 +319,16 @@ def sales_agent_chat(user_message: str, session: dict):
     # PRODUCT DISCOVERY
     # --------------------------------------------------
     if new_category:
-        recommendations = get_recommendations(category=new_category)
+        recommendations = yield "recommend", {"category": new_category}
         session["recommendations"] = recommendations
         session["stage"] = "AWAITING_SELECTION"
 
+        # stock for the whole list in one batch lookup
+        stock = (yield "inventory_many", {"products": recommendations, "locations": False}) if recommendations else []
+        session["inventory"] = [r.get("availability", {}) for r in stock]
+
         product_list = "\n".join(
-            [f"{i+1}️⃣ {p['name']} – ₹{p['price']}"
+            [f"{i+1}️⃣ {p['name']} – ₹{p['price']}{_stock_label(i, session['inventory'])}"
              for i, p in enumerate(recommendations)]
         )
 
@@ -247,11 +341,54 @@ def sales_agent_chat(user_message: str, session: dict):
     return "How can I assist you today?", session
 
 
+
+def sales_agent_chat(user_message: str, session: dict):
+    """Runs one turn with the blocking agents. Returns (reply, session)."""
+    flow = _chat_flow(user_message, session)
+    result = None
+    try:
+        while True:
+            name, kwargs = flow.send(result)
+            result = _call_agent(name, kwargs)
+    except StopIteration as done:
+        return done.value
+
+
+async def sales_agent_chat_async(user_message: str, session: dict):
+    """Runs one turn with the async agents. Returns (reply, session)."""
+    flow = _chat_flow(user_message, session)
+    result = None
+    try:
+        while True:
+            name, kwargs = flow.send(result)
+            result = await _call_agent_async(name, kwargs)
+    except StopIteration as done:
+        return done.value
+
+
+async def sales_agent_chat_stream(user_message: str, session: dict):
+    """
+    Streaming driver: yields ("agent", name) as each worker agent starts,
+    then ("done", (reply, session)).
+    """
+    flow = _chat_flow(user_message, session)
+    result = None
+    try:
+        while True:
+            name, kwargs = flow.send(result)
+            yield "agent", name
+            result = await _call_agent_async(name, kwargs)
+    except StopIteration as done:
+        yield "done", done.value
+
+
 # -------------------------------------------------------------------
 # TERMINAL MODE
 # -------------------------------------------------------------------
 
 if __name__ == "__main__":
+    from cache import get_session, save_session
+
     TEST_SESSION_ID = "CONSOLE_TEST_USER_001"
 
     print(f"\nSales Agent Running (Session: {TEST_SESSION_ID})")
@@ -0,0 +1,119 @@
+import sys
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# -------------------------------------------------------------------
+# Bounded in-process session store.
+#
+# Holds sessions in the same encoded form as the Redis hashes in
+# cache.py (field -> JSON string, products as productId references),
+# so an entry's memory footprint can be measured exactly with
+# sys.getsizeof instead of estimated. Entries expire after `idle_ttl`
+# seconds without a read or write; past `max_sessions` or `max_bytes`
+# the least recently used sessions are evicted.
+# -------------------------------------------------------------------
+
+
+def _entry_size(session_id: str, fields: Dict[str, str]) -> int:
+    size = sys.getsizeof(session_id) + sys.getsizeof(fields)
+    for key, value in fields.items():
+        size += sys.getsizeof(key) + sys.getsizeof(value)
+    return size
+
+
+class LocalSessionStore:
+    """Thread-safe LRU of encoded sessions with idle expiry and a byte budget."""
+
+    def __init__(self, max_sessions: int = 10000, idle_ttl: float = 3600.0,
+                 max_bytes: int = 64 * 1024 * 1024):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        # session_id -> (expires_at, fields, size); least recently used first
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def _drop(self, session_id: str):
+        _, _, size = self._data.pop(session_id)
+        self.bytes -= size
+
+    def _expire(self, now: float):
+        # Idle TTL is the same for every entry, so the LRU end expires first.
+        while self._data:
+            session_id, (expires_at, _, _) = next(iter(self._data.items()))
+            if expires_at > now:
+                break
+            self._drop(session_id)
+            self.expirations += 1
+
+    def get(self, session_id: str) -> Optional[Dict[str, str]]:
+        """Encoded fields of a live session (refreshes its idle TTL), or None."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._data.get(session_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data[session_id] = (now + self.idle_ttl, entry[1], entry[2])
+            self._data.move_to_end(session_id)
+            self.hits += 1
+            return dict(entry[1])
+
+    def put(self, session_id: str, fields: Dict[str, str]):
+        """Stores a session's encoded fields (an empty dict deletes it)."""
+        now = time.monotonic()
+        fields = dict(fields)
+        with self._lock:
+            self._expire(now)
+            if session_id in self._data:
+                self._drop(session_id)
+            if not fields:
+                return
+
+            size = _entry_size(session_id, fields)
+            self._data[session_id] = (now + self.idle_ttl, fields, size)
+            self.bytes += size
+            while len(self._data) > 1 and (
+                len(self._data) > self.max_sessions or self.bytes > self.max_bytes
+            ):
+                self._drop(next(iter(self._data)))
+                self.evictions += 1
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            if session_id not in self._data:
+                return False
+            self._drop(session_id)
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._expire(time.monotonic())
+            return {
+                "sessions": len(self._data),
+                "max_sessions": self.max_sessions,
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "avg_session_bytes": self.bytes // len(self._data) if self._data else 0,
+                "idle_ttl_seconds": self.idle_ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
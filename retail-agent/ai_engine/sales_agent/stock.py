@@ -0,0 +1,205 @@
+import argparse
+from typing import Optional
+
+from database import inventory_col, ainventory_col
+
+# -------------------------------------------------------------------
+# Precomputed stock totals.
+#
+# Every inventory document carries, next to its `stockByLocation` array:
+#
+#   totalQty  : sum of all location quantities
+#   regionQty : {region: sum of that region's locations}
+#
+# A location's region is the `region` field of its stockByLocation entry
+# (DEFAULT_REGION if it has none). Writers never compute the totals
+# themselves: each stock change is a pipeline update that adjusts the
+# location and recomputes both totals from the array inside the same
+# atomic document write, so the fields cannot drift from the array.
+#
+# Repair / backfill:  python stock.py --rebuild
+# -------------------------------------------------------------------
+
+DEFAULT_REGION = "UNASSIGNED"
+
+_LOCATIONS = {"$ifNull": ["$stockByLocation", []]}
+_REGION = {"$ifNull": ["$$loc.region", DEFAULT_REGION]}
+
+# Pipeline stage that recomputes totalQty / regionQty from stockByLocation.
+TOTALS_STAGE = {"$set": {
+    "totalQty": {"$sum": "$stockByLocation.qty"},
+    "regionQty": {"$arrayToObject": {"$map": {
+        "input": {"$setUnion": [{"$map": {"input": _LOCATIONS, "as": "loc", "in": _REGION}}]},
+        "as": "region",
+        "in": {"k": "$$region", "v": {"$sum": {"$map": {
+            "input": {"$filter": {
+                "input": _LOCATIONS, "as": "loc", "cond": {"$eq": [_REGION, "$$region"]}
+            }},
+            "as": "loc",
+            "in": "$$loc.qty",
+        }}}},
+    }}},
+}}
+
+# What an availability check needs to read.
+TOTALS_PROJECTION = {"_id": 0, "productId": 1, "totalQty": 1, "regionQty": 1, "sharded": 1}
+
+
+def _adjusted(location_id: str, delta: int) -> dict:
+    """stockByLocation with `delta` added to one location's qty."""
+    return {"$map": {
+        "input": _LOCATIONS,
+        "as": "loc",
+        "in": {"$cond": [
+            {"$eq": ["$$loc.locationId", location_id]},
+            {"$mergeObjects": ["$$loc", {"qty": {"$add": [{"$ifNull": ["$$loc.qty", 0]}, delta]}}]},
+            "$$loc",
+        ]},
+    }}
+
+
+def _appended(location_id: str, qty: int, region: Optional[str]) -> dict:
+    """stockByLocation with a new location entry at the end."""
+    entry = {"locationId": location_id, "qty": qty}
+    if region:
+        entry["region"] = region
+    return {"$concatArrays": [_LOCATIONS, [{"$literal": entry}]]}
+
+
+def adjust_update(location_id: str, delta: int) -> list:
+    """
+    Update pipeline: add `delta` to one location's qty and recompute the
+    totals. Pair it with a filter on "stockByLocation.locationId".
+    """
+    return [{"$set": {"stockByLocation": _adjusted(location_id, delta)}}, TOTALS_STAGE]
+
+
+def add_location_update(location_id: str, qty: int, region: Optional[str] = None) -> list:
+    """Update pipeline: append a new location entry and recompute the totals."""
+    return [{"$set": {"stockByLocation": _appended(location_id, qty, region)}}, TOTALS_STAGE]
+
+
+def restock_update(location_id: str, qty: int, region: Optional[str] = None) -> list:
+    """
+    Update pipeline: add `qty` at a location, appending the entry if the
+    document has none, in one write. Pair it with a productId filter
+    (bulk restocks, where restock()'s fallback write would double the
+    operations).
+    """
+    location_ids = {"$map": {"input": _LOCATIONS, "as": "loc", "in": "$$loc.locationId"}}
+    return [
+        {"$set": {"stockByLocation": {"$cond": [
+            {"$in": [location_id, location_ids]},
+            _adjusted(location_id, qty),
+            _appended(location_id, qty, region),
+        ]}}},
+        TOTALS_STAGE,
+    ]
+
+
+def location_filter(product_id: str, location_id: str) -> dict:
+    return {"productId": product_id, "stockByLocation.locationId": location_id}
+
+
+def available_filter(product_id: str, location_id: str, qty: int) -> dict:
+    """Matches only while the location still holds at least `qty` units."""
+    return {"productId": product_id, "stockByLocation": {"$elemMatch": {
+        "locationId": location_id, "qty": {"$gte": qty}
+    }}}
+
+
+def total_qty(inventory: Optional[dict]) -> int:
+    """Stored total; documents not yet rebuilt fall back to summing."""
+    if not inventory:
+        return 0
+    if "totalQty" in inventory:
+        return int(inventory["totalQty"])
+    return sum(int(entry.get("qty", 0)) for entry in inventory.get("stockByLocation", []))
+
+
+# -------------------------------------------------------------------
+# WRITE PATHS
+# -------------------------------------------------------------------
+
+def adjust_stock(product_id: str, location_id: str, delta: int) -> bool:
+    """Adds `delta` units at a location (negative to take stock out)."""
+    result = inventory_col.update_one(
+        location_filter(product_id, location_id), adjust_update(location_id, delta)
+    )
+    return result.matched_count == 1
+
+
+def take_stock(product_id: str, location_id: str, qty: int) -> bool:
+    """
+    Conditional decrement: removes `qty` units only if the location has
+    them, in one atomic document write. False means not enough stock;
+    the quantity can never go negative. `qty` must be positive.
+    """
+    assert qty > 0, qty
+    result = inventory_col.update_one(
+        available_filter(product_id, location_id, qty), adjust_update(location_id, -qty)
+    )
+    return result.matched_count == 1
+
+
+def restock(product_id: str, location_id: str, qty: int, region: Optional[str] = None) -> bool:
+    """Adds `qty` units at a location, creating the location entry if needed."""
+    if adjust_stock(product_id, location_id, qty):
+        return True
+    result = inventory_col.update_one(
+        {"productId": product_id, "stockByLocation.locationId": {"$ne": location_id}},
+        add_location_update(location_id, qty, region),
+    )
+    return result.matched_count == 1
+
+
+async def adjust_stock_async(product_id: str, location_id: str, delta: int) -> bool:
+    result = await ainventory_col.update_one(
+        location_filter(product_id, location_id), adjust_update(location_id, delta)
+    )
+    return result.matched_count == 1
+
+
+async def take_stock_async(product_id: str, location_id: str, qty: int) -> bool:
+    assert qty > 0, qty
+    result = await ainventory_col.update_one(
+        available_filter(product_id, location_id, qty), adjust_update(location_id, -qty)
+    )
+    return result.matched_count == 1
+
+
+async def restock_async(product_id: str, location_id: str, qty: int, region: Optional[str] = None) -> bool:
+    if await adjust_stock_async(product_id, location_id, qty):
+        return True
+    result = await ainventory_col.update_one(
+        {"productId": product_id, "stockByLocation.locationId": {"$ne": location_id}},
+        add_location_update(location_id, qty, region),
+    )
+    return result.matched_count == 1
+
+
+# -------------------------------------------------------------------
+# REPAIR / REBUILD
+# -------------------------------------------------------------------
+
+def rebuild_totals(product_id: Optional[str] = None) -> int:
+    """
+    Recomputes totals server-side in one update_many (no documents are
+    shipped to this process). Returns the number of documents changed.
+    """
+    flt = {"productId": product_id} if product_id else {}
+    result = inventory_col.update_many(flt, [TOTALS_STAGE])
+    print(f"[Stock] Rebuilt totals: {result.matched_count} matched, {result.modified_count} corrected")
+    return result.modified_count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain precomputed inventory totals.")
+    parser.add_argument("--rebuild", action="store_true", help="recompute totalQty/regionQty for every document")
+    parser.add_argument("--product", help="only rebuild this productId")
+    args = parser.parse_args()
+
+    if args.rebuild or args.product:
+        rebuild_totals(args.product)
+    else:
+        parser.print_help()
@@ -0,0 +1,129 @@
+"""
+TRAIN / EVALUATE THE LOCAL INTENT CLASSIFIER
+--------------------------------------------
+Reads labeled transcripts, reports held-out accuracy (overall, per
+intent, and at the confidence threshold used by intent_detector.py,
+averaged over --splits stratified splits), then trains on all of the
+data and writes the model file.
+
+Input: JSONL lines {"text": ..., "intent": ...} or CSV with text,intent
+columns. Labels must be among intent_detector.INTENTS.
+
+Usage:
+    python train_intent_classifier.py                       # seed data
+    python train_intent_classifier.py transcripts.jsonl intent_examples.jsonl
+    python train_intent_classifier.py --eval-only
+"""
+
+import argparse
+import csv
+import json
+import os
+import random
+from collections import defaultdict
+
+from intent_classifier import IntentClassifier, MODEL_PATH
+from intent_detector import INTENTS, INTENT_CONFIDENCE
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SEED_DATA = os.path.join(HERE, "intent_examples.jsonl")
+
+
+def load_examples(paths):
+    examples = []
+    for path in paths:
+        with open(path, newline="", encoding="utf-8") as f:
+            if path.endswith(".csv"):
+                rows = csv.DictReader(f)
+            else:
+                rows = (json.loads(line) for line in f if line.strip())
+            for row in rows:
+                if row.get("intent") not in INTENTS:
+                    raise ValueError(f"{path}: unknown intent {row.get('intent')!r}")
+                examples.append((row["text"], row["intent"]))
+    return examples
+
+
+def split(examples, holdout, seed):
+    """Stratified train / held-out split."""
+    by_intent = defaultdict(list)
+    for text, intent in examples:
+        by_intent[intent].append((text, intent))
+    rng = random.Random(seed)
+    train, test = [], []
+    for rows in by_intent.values():
+        rng.shuffle(rows)
+        cut = max(1, int(len(rows) * holdout))
+        test += rows[:cut]
+        train += rows[cut:]
+    return train, test
+
+
+def _rates(correct, n, confident, confident_correct):
+    return {
+        "accuracy": correct / n,
+        "coverage": confident / n,  # share answered locally
+        "confident_accuracy": confident_correct / confident if confident else 0.0,
+    }
+
+
+def evaluate(model, examples, threshold):
+    # intent -> [correct, n, confident, confident_correct]
+    per_intent = defaultdict(lambda: [0, 0, 0, 0])
+    for text, intent in examples:
+        label, confidence = model.classify(text)
+        counts = per_intent[intent]
+        counts[0] += label == intent
+        counts[1] += 1
+        if confidence >= threshold:
+            counts[2] += 1
+            counts[3] += label == intent
+    report = _rates(*(sum(column) for column in zip(*per_intent.values())))
+    report["per_intent"] = {k: _rates(*v) for k, v in sorted(per_intent.items())}
+    return report
+
+
+def _mean(reports):
+    """Field-by-field mean of evaluate() reports."""
+    if isinstance(reports[0], dict):
+        return {k: _mean([r[k] for r in reports]) for k in reports[0]}
+    return sum(reports) / len(reports)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("data", nargs="*", default=[SEED_DATA])
+    parser.add_argument("--out", default=MODEL_PATH)
+    parser.add_argument("--holdout", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--splits", type=int, default=5, help="held-out splits to average (seeds seed, seed+1, ...)")
+    parser.add_argument("--epochs", type=int, default=300)
+    parser.add_argument("--threshold", type=float, default=INTENT_CONFIDENCE)
+    parser.add_argument("--eval-only", action="store_true", help="do not write the model file")
+    args = parser.parse_args()
+
+    examples = load_examples(args.data)
+    reports = []
+    for seed in range(args.seed, args.seed + args.splits):
+        train, test = split(examples, args.holdout, seed)
+        model = IntentClassifier.train([t for t, _ in train], [i for _, i in train], INTENTS, epochs=args.epochs)
+        reports.append(evaluate(model, test, args.threshold))
+    report = _mean(reports)
+
+    print(f"{len(examples)} examples: {len(train)} train / {len(test)} held out, mean of {args.splits} splits")
+    print(f"held-out accuracy        : {report['accuracy']:.1%}")
+    print(f"answered locally (>= {args.threshold:.2f}): {report['coverage']:.1%}"
+          f"  accuracy there: {report['confident_accuracy']:.1%}")
+    print(f"  {'intent':<20} {'accuracy':>8} {'local':>7} {'there':>7}")
+    for intent, rates in report["per_intent"].items():
+        print(f"  {intent:<20} {rates['accuracy']:8.1%} {rates['coverage']:7.1%} {rates['confident_accuracy']:7.1%}")
+
+    if not args.eval_only:
+        final = IntentClassifier.train([t for t, _ in examples], [i for _, i in examples], INTENTS,
+                                       epochs=args.epochs)
+        final.save(args.out)
+        print(f"saved {args.out} ({os.path.getsize(args.out) / 1024:.0f} KiB)")
+
+
+if __name__ == "__main__":
+    main()
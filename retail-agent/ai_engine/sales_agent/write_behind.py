@@ -0,0 +1,202 @@
+import os
+import time
+import atexit
+import threading
+from collections import defaultdict
+from typing import Dict, List
+
+from bson import ObjectId, json_util
+from pymongo.errors import BulkWriteError, PyMongoError
+
+import database
+from metrics import Histogram, LATENCY_BUCKETS_MS
+from micro_batcher import BATCH_SIZE_BUCKETS
+
+# -------------------------------------------------------------------
+# Write-behind buffer for append-only records nobody reads back in the
+# same turn (feedback, declined payments, POS audit trail).
+#
+# enqueue() only appends to an in-process queue, so it never blocks the
+# chat response, from sync or async code alike. A background thread
+# writes each collection's queue with one insert_many, as soon as
+# FLUSH_SIZE records are waiting or FLUSH_INTERVAL seconds after the
+# first one arrived.
+#
+# Every record gets its _id at enqueue time, so a flush that is retried
+# after a partial failure skips what already went in (duplicate _id)
+# instead of inserting twice. If MongoDB cannot take a batch, or the
+# queue is over MAX_QUEUE, the records are appended to SPILL_PATH (one
+# extended-JSON line each) and re-inserted by the next successful
+# flush. drain() (at exit, and on backend shutdown) flushes everything
+# still queued.
+# -------------------------------------------------------------------
+
+FLUSH_SIZE = int(os.getenv("WRITE_BEHIND_FLUSH_SIZE", 500))
+FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_MS", 200)) / 1000
+MAX_QUEUE = int(os.getenv("WRITE_BEHIND_MAX_QUEUE", 100_000))
+SPILL_PATH = os.getenv("WRITE_BEHIND_SPILL_PATH", "write_behind_spill.jsonl")
+
+_queues: Dict[str, List[dict]] = defaultdict(list)
+_depth = 0
+_first_at = None  # monotonic time the oldest queued record arrived
+_cond = threading.Condition()
+_flush_lock = threading.Lock()  # one flush (and one spill writer) at a time
+_thread = None
+
+flush_ms = Histogram(LATENCY_BUCKETS_MS)
+batch_sizes = Histogram(BATCH_SIZE_BUCKETS + (128, 256, 512, 1024))
+_stats = {"enqueued": 0, "written": 0, "flushes": 0, "failed_flushes": 0,
+          "spilled": 0, "replayed": 0, "duplicates": 0, "loop_errors": 0}
+
+
+def _count(name, n=1):
+    with _cond:
+        _stats[name] += n
+
+
+def write_behind_stats() -> dict:
+    with _cond:
+        stats = dict(_stats, depth=_depth, queues={name: len(q) for name, q in _queues.items() if q})
+    stats["spill_file_bytes"] = os.path.getsize(SPILL_PATH) if os.path.exists(SPILL_PATH) else 0
+    stats["flush_ms"] = flush_ms.snapshot()
+    stats["batch_size"] = batch_sizes.snapshot()
+    return stats
+
+# -------------------------------------------------------------------
+# ENQUEUE
+# -------------------------------------------------------------------
+
+def enqueue(collection: str, doc: dict):
+    """Queues `doc` for insertion into `collection`; returns immediately."""
+    global _depth, _first_at
+    doc.setdefault("_id", ObjectId())
+    _ensure_thread()
+    with _cond:
+        if _depth >= MAX_QUEUE:
+            overflow = True
+        else:
+            overflow = False
+            _queues[collection].append(doc)
+            _depth += 1
+            _stats["enqueued"] += 1
+            if _first_at is None:  # starts the FLUSH_INTERVAL clock
+                _first_at = time.monotonic()
+                _cond.notify()
+            elif _depth >= FLUSH_SIZE:
+                _cond.notify()
+    if overflow:
+        with _flush_lock:
+            _spill({collection: [doc]})
+
+# -------------------------------------------------------------------
+# FLUSH
+# -------------------------------------------------------------------
+
+def _take() -> Dict[str, List[dict]]:
+    global _depth, _first_at
+    with _cond:
+        batches = {name: q for name, q in _queues.items() if q}
+        _queues.clear()
+        _depth, _first_at = 0, None
+    return batches
+
+
+def _insert(collection: str, docs: List[dict]) -> int:
+    """insert_many, ignoring records a previous attempt already wrote."""
+    try:
+        return len(database.get_collection(collection).insert_many(docs, ordered=False).inserted_ids)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(err.get("code") != 11000 for err in errors):
+            raise
+        _count("duplicates", len(errors))
+        return e.details.get("nInserted", 0)
+
+
+def _spill(batches: Dict[str, List[dict]]):
+    with open(SPILL_PATH, "a", encoding="utf-8") as f:
+        for collection, docs in batches.items():
+            for doc in docs:
+                f.write(json_util.dumps({"collection": collection, "doc": doc}) + "\n")
+    n = sum(len(docs) for docs in batches.values())
+    _count("spilled", n)
+    print(f"[WriteBehind] ⚠️ Spilled {n} record(s) to {SPILL_PATH}")
+
+
+def _replay_spill():
+    """Re-inserts spilled records (called under _flush_lock after a good flush)."""
+    if not os.path.exists(SPILL_PATH) or not os.path.getsize(SPILL_PATH):
+        return
+    batches = defaultdict(list)
+    with open(SPILL_PATH, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json_util.loads(line)
+                batches[record["collection"]].append(record["doc"])
+    for collection, docs in batches.items():
+        _insert(collection, docs)
+    os.remove(SPILL_PATH)  # only reached if every collection went in
+    n = sum(len(docs) for docs in batches.values())
+    _count("replayed", n)
+    print(f"[WriteBehind] Replayed {n} spilled record(s)")
+
+
+def flush() -> int:
+    """Writes everything queued now. Returns records written."""
+    with _flush_lock:
+        batches = _take()
+        written = 0
+        t0 = time.perf_counter()
+        try:
+            for collection in list(batches):
+                batch_sizes.observe(len(batches[collection]))
+                written += _insert(collection, batches[collection])
+                del batches[collection]
+            _replay_spill()
+        except PyMongoError as e:
+            _count("failed_flushes")
+            print(f"[WriteBehind] ⚠️ Flush failed: {e}")
+            if batches:
+                _spill(batches)
+        finally:
+            flush_ms.observe((time.perf_counter() - t0) * 1000)
+        _count("flushes")
+        _count("written", written)
+        return written
+
+
+def _loop():
+    while True:
+        try:
+            with _cond:
+                while not _depth:
+                    _cond.wait()
+                wait = _first_at + FLUSH_INTERVAL - time.monotonic()
+                if _depth < FLUSH_SIZE and wait > 0:
+                    _cond.wait(wait)  # woken early by a full batch
+            flush()
+        except Exception as e:  # e.g. OSError from _spill: keep the flusher alive
+            _count("loop_errors")
+            print(f"[WriteBehind] ⚠️ Flusher error: {e}")
+            time.sleep(FLUSH_INTERVAL)
+
+
+def _ensure_thread():
+    global _thread
+    if _thread is None:
+        with _flush_lock:
+            if _thread is None:
+                _thread = threading.Thread(target=_loop, name="write-behind", daemon=True)
+                _thread.start()
+
+
+def drain():
+    """Flushes whatever is still queued (graceful shutdown)."""
+    with _cond:
+        pending = _depth
+    if pending:
+        print(f"[WriteBehind] Draining {pending} queued record(s)")
+        flush()
+
+
+atexit.register(drain)
@@ -0,0 +1,1326 @@
+"""
+LOCAL STAND-INS
+---------------
+In-memory MongoDB collections and Redis with configurable latency, for
+the tests here and the sales_agent benchmarks that must run without the
+real services.
+
+They implement the subset of the pymongo / redis-py APIs the agents use
+(sync and asyncio flavours). `install()` points database.py and cache.py
+at them for the current process:
+
+    import standins
+    env = standins.install(mongo_latency=0.002, redis_latency=0.0005)
+    env.collection("products").insert_many([...])
+
+Real-MongoDB mode: with TEST_MONGO_URL set, install() keeps Redis in
+memory but points database.py at that server instead, in a throwaway
+database that is dropped at exit. Use a replica set (a single-node
+`mongod --replSet rs0` is enough): the transaction checks need one.
+
+    TEST_MONGO_URL=mongodb://localhost:27017/?replicaSet=rs0 python test_payment_idempotency.py
+"""
+
+import asyncio
+import atexit
+import copy
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import monitoring
+from pymongo.collection import Collection
+from pymongo.errors import DuplicateKeyError, InvalidOperation
+from redis.exceptions import ResponseError
+
+# The agents import each other by flat name (see backend/main.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sales_agent"))
+
+TEST_MONGO_URL = os.getenv("TEST_MONGO_URL")
+
+# -------------------------------------------------------------------
+# Query matching
+# -------------------------------------------------------------------
+
+_NO_COND = object()
+
+def _values(doc, path: str):
+    """All values at a dotted path; arrays fan out like MongoDB does."""
+    current = [doc]
+    for part in path.split("."):
+        nxt = []
+        for value in current:
+            if isinstance(value, dict):
+                if part in value:
+                    nxt.append(value[part])
+            elif isinstance(value, list):
+                if part.isdigit() and int(part) < len(value):
+                    nxt.append(value[int(part)])
+                else:
+                    nxt.extend(v[part] for v in value if isinstance(v, dict) and part in v)
+        current = nxt
+    out = []
+    for value in current:
+        out.append(value)
+        if isinstance(value, list):
+            out.extend(value)
+    return out
+
+
+def _compare(value, op, arg):
+    if op == "$eq":
+        return value == arg
+    if op == "$ne":
+        return value != arg
+    if op == "$in":
+        return value in arg
+    if op == "$nin":
+        return value not in arg
+    try:
+        if op == "$gt":
+            return value > arg
+        if op == "$gte":
+            return value >= arg
+        if op == "$lt":
+            return value < arg
+        if op == "$lte":
+            return value <= arg
+    except TypeError:
+        return False  # MongoDB only compares within a type bracket
+    raise NotImplementedError(f"stand-in does not support {op}")
+
+
+def _match_condition(doc, path, cond) -> bool:
+    values = _values(doc, path)
+    if isinstance(cond, dict) and cond and all(k.startswith("$") for k in cond):
+        for op, arg in cond.items():
+            if op == "$options":
+                continue
+            if op == "$exists":
+                if bool(values) != bool(arg):
+                    return False
+            elif op == "$regex":
+                flags = re.IGNORECASE if "i" in cond.get("$options", "") else 0
+                pattern = re.compile(arg, flags)
+                if not any(isinstance(v, str) and pattern.search(v) for v in values):
+                    return False
+            elif op == "$elemMatch":
+                arrays = [v for v in _values(doc, path) if isinstance(v, list)]
+                if not any(matches(e, arg) for a in arrays for e in a if isinstance(e, dict)):
+                    return False
+            elif op in ("$ne", "$nin"):
+                if any(not _compare(v, op, arg) for v in values):
+                    return False
+            else:
+                if not any(_compare(v, op, arg) for v in values):
+                    return False
+        return True
+    return any(v == cond for v in values)
+
+
+def matches(doc: dict, flt: Optional[dict]) -> bool:
+    for key, cond in (flt or {}).items():
+        if key == "$or":
+            if not any(matches(doc, sub) for sub in cond):
+                return False
+        elif key == "$and":
+            if not all(matches(doc, sub) for sub in cond):
+                return False
+        elif not _match_condition(doc, key, cond):
+            return False
+    return True
+
+
+def _project(doc: dict, projection) -> dict:
+    doc = copy.deepcopy(doc)
+    if not projection:
+        return doc
+    if isinstance(projection, (list, tuple)):
+        projection = {k: 1 for k in projection}
+    include = {k for k, v in projection.items() if v and k != "_id"}
+    if include:
+        out = {k: doc[k] for k in include if k in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            out["_id"] = doc["_id"]
+        return out
+    for k, v in projection.items():
+        if not v:
+            doc.pop(k, None)
+    return doc
+
+
+# -------------------------------------------------------------------
+# Updates
+# -------------------------------------------------------------------
+
+def _positional_index(doc, array_path, flt) -> int:
+    """Index the `$` operator refers to: first element matching the filter."""
+    array = _get(doc, array_path)
+    prefix = array_path + "."
+    conds = {}
+    for key, cond in (flt or {}).items():
+        if key == array_path and isinstance(cond, dict) and "$elemMatch" in cond:
+            conds.update(cond["$elemMatch"])
+        elif key.startswith(prefix):
+            conds[key[len(prefix):]] = cond
+    for i, element in enumerate(array or []):
+        if isinstance(element, dict) and matches(element, conds):
+            return i
+    raise ValueError(f"positional operator did not find a match for {array_path}")
+
+
+def _get(doc, path):
+    for part in path.split("."):
+        if isinstance(doc, list):
+            doc = doc[int(part)]
+        elif isinstance(doc, dict):
+            doc = doc.get(part)
+        else:
+            return None
+    return doc
+
+
+def _expand_paths(doc, path, flt, array_filters) -> List[str]:
+    parts = path.split(".")
+    paths = [[]]
+    for part in parts:
+        nxt = []
+        for prefix in paths:
+            if part == "$":
+                nxt.append(prefix + [str(_positional_index(doc, ".".join(prefix), flt))])
+            elif part.startswith("$[") and part.endswith("]"):
+                ident = part[2:-1]
+                array = _get(doc, ".".join(prefix)) or []
+                for i, element in enumerate(array):
+                    if not ident or _array_filter_ok(element, ident, array_filters):
+                        nxt.append(prefix + [str(i)])
+            else:
+                nxt.append(prefix + [part])
+        paths = nxt
+    return [".".join(p) for p in paths]
+
+
+def _array_filter_ok(element, ident, array_filters) -> bool:
+    for af in array_filters or []:
+        conds = {}
+        for key, cond in af.items():
+            if key == ident:
+                if not _match_condition({"v": element}, "v", cond):
+                    return False
+            elif key.startswith(ident + "."):
+                conds[key[len(ident) + 1:]] = cond
+        if conds and not (isinstance(element, dict) and matches(element, conds)):
+            return False
+    return True
+
+
+def _set(doc, path, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        if isinstance(doc, list):
+            doc = doc[int(part)]
+        else:
+            doc = doc.setdefault(part, {})
+    if isinstance(doc, list):
+        doc[int(parts[-1])] = value
+    else:
+        doc[parts[-1]] = value
+
+
+def _unset(doc, path):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc[int(part)] if isinstance(doc, list) else doc.get(part, {})
+    if isinstance(doc, dict):
+        doc.pop(parts[-1], None)
+
+
+# -------------------------------------------------------------------
+# Aggregation expressions (for pipeline-style updates)
+# -------------------------------------------------------------------
+
+_MISSING = object()
+
+
+def _path_value(value, parts):
+    for part in parts:
+        if isinstance(value, dict):
+            value = value.get(part, _MISSING)
+        elif isinstance(value, list):
+            value = [v for v in (_path_value(item, [part]) for item in value) if v is not _MISSING]
+        else:
+            return _MISSING
+        if value is _MISSING:
+            return _MISSING
+    return value
+
+
+def evaluate(expr, doc, variables=None):
+    """Evaluates the subset of aggregation expressions the agents use."""
+    variables = variables or {}
+    if isinstance(expr, str) and expr.startswith("$$"):
+        name, *parts = expr[2:].split(".")
+        value = _path_value(variables.get(name, doc if name in ("ROOT", "CURRENT") else None), parts)
+        return None if value is _MISSING else value
+    if isinstance(expr, str) and expr.startswith("$"):
+        value = _path_value(doc, expr[1:].split("."))
+        return None if value is _MISSING else value
+    if isinstance(expr, list):
+        return [evaluate(e, doc, variables) for e in expr]
+    if not isinstance(expr, dict):
+        return expr
+    if len(expr) != 1 or not next(iter(expr)).startswith("$"):
+        return {k: evaluate(v, doc, variables) for k, v in expr.items()}
+
+    op, arg = next(iter(expr.items()))
+    if op == "$literal":
+        return arg
+    if op in ("$map", "$filter"):
+        items = evaluate(arg["input"], doc, variables)
+        if items is None:
+            return None
+        name = arg.get("as", "this")
+        out = []
+        for item in items:
+            scope = {**variables, name: item}
+            if op == "$map":
+                out.append(evaluate(arg["in"], doc, scope))
+            elif evaluate(arg["cond"], doc, scope):
+                out.append(item)
+        return out
+    if op == "$cond":
+        if isinstance(arg, dict):
+            arg = [arg["if"], arg["then"], arg["else"]]
+        branch = arg[1] if evaluate(arg[0], doc, variables) else arg[2]
+        return evaluate(branch, doc, variables)
+
+    args = evaluate(arg, doc, variables)
+    if op == "$ifNull":
+        return next((a for a in args if a is not None), None)
+    if op in ("$eq", "$ne", "$gt", "$gte", "$lt", "$lte"):
+        return _compare(args[0], op, args[1])
+    if op == "$in":
+        return args[0] in (args[1] or [])
+    if op == "$add":
+        return sum(a for a in args if a is not None)
+    if op == "$sum":
+        values = args if isinstance(args, list) else [args]
+        flat = itertools.chain.from_iterable(v if isinstance(v, list) else [v] for v in values)
+        return sum(v for v in flat if isinstance(v, (int, float)) and not isinstance(v, bool))
+    if op == "$mergeObjects":
+        merged = {}
+        for a in (args if isinstance(args, list) else [args]):
+            merged.update(a or {})
+        return merged
+    if op == "$concatArrays":
+        return None if any(a is None for a in args) else list(itertools.chain.from_iterable(args))
+    if op == "$setUnion":
+        union = []
+        for a in args:
+            union += [v for v in a or [] if v not in union]
+        return union
+    if op == "$arrayToObject":
+        if isinstance(arg, list) and len(arg) == 1:
+            args = args[0]
+        return dict((p["k"], p["v"]) if isinstance(p, dict) else tuple(p) for p in args or [])
+    raise NotImplementedError(f"stand-in does not support {op}")
+
+
+def _apply_pipeline(doc: dict, stages: List[dict]):
+    for stage in stages:
+        (op, spec), = stage.items()
+        if op in ("$set", "$addFields"):
+            values = {path: evaluate(expr, doc) for path, expr in spec.items()}
+            for path, value in values.items():
+                _set(doc, path, copy.deepcopy(value))
+        elif op == "$unset":
+            for path in [spec] if isinstance(spec, str) else spec:
+                _unset(doc, path)
+        else:
+            raise NotImplementedError(f"stand-in does not support pipeline stage {op}")
+
+
+def apply_update(doc: dict, update, flt=None, array_filters=None, inserting=False):
+    if isinstance(update, list):
+        return _apply_pipeline(doc, update)
+    for op, fields in update.items():
+        if op == "$setOnInsert" and not inserting:
+            continue
+        for path, arg in fields.items():
+            for target in _expand_paths(doc, path, flt, array_filters):
+                current = _get(doc, target)
+                if op in ("$set", "$setOnInsert"):
+                    _set(doc, target, copy.deepcopy(arg))
+                elif op == "$unset":
+                    _unset(doc, target)
+                elif op == "$inc":
+                    _set(doc, target, (current or 0) + arg)
+                elif op == "$min":
+                    _set(doc, target, arg if current is None else min(current, arg))
+                elif op == "$max":
+                    _set(doc, target, arg if current is None else max(current, arg))
+                elif op == "$push":
+                    items = arg["$each"] if isinstance(arg, dict) and "$each" in arg else [arg]
+                    _set(doc, target, (current or []) + copy.deepcopy(items))
+                elif op == "$addToSet":
+                    items = arg["$each"] if isinstance(arg, dict) and "$each" in arg else [arg]
+                    merged = list(current or [])
+                    merged += [i for i in items if i not in merged]
+                    _set(doc, target, merged)
+                elif op == "$pull":
+                    _set(doc, target, [v for v in (current or []) if not (
+                        matches(v, arg) if isinstance(arg, dict) and isinstance(v, dict) else v == arg)])
+                else:
+                    raise NotImplementedError(f"stand-in does not support {op}")
+
+
+# -------------------------------------------------------------------
+# Results / cursors (shapes mirror pymongo's)
+# -------------------------------------------------------------------
+
+class InsertOneResult:
+    def __init__(self, inserted_id):
+        self.inserted_id = inserted_id
+        self.acknowledged = True
+
+
+class InsertManyResult:
+    def __init__(self, inserted_ids):
+        self.inserted_ids = inserted_ids
+        self.acknowledged = True
+
+
+class UpdateResult:
+    def __init__(self, matched, modified, upserted_id=None):
+        self.matched_count = matched
+        self.modified_count = modified
+        self.upserted_id = upserted_id
+        self.acknowledged = True
+
+
+class DeleteResult:
+    def __init__(self, deleted):
+        self.deleted_count = deleted
+        self.acknowledged = True
+
+
+class BulkWriteResult:
+    def __init__(self):
+        self.inserted_count = 0
+        self.matched_count = 0
+        self.modified_count = 0
+        self.upserted_count = 0
+        self.deleted_count = 0
+        self.acknowledged = True
+
+
+class MemoryCursor:
+    def __init__(self, docs: List[dict]):
+        self._docs = docs
+
+    def sort(self, key, direction=1):
+        keys = key if isinstance(key, list) else [(key, direction)]
+        for field, d in reversed(keys):
+            self._docs.sort(key=lambda doc: (_get(doc, field) is None, _get(doc, field)), reverse=d < 0)
+        return self
+
+    def skip(self, n):
+        self._docs = self._docs[n:]
+        return self
+
+    def limit(self, n):
+        if n:
+            self._docs = self._docs[:n]
+        return self
+
+    def batch_size(self, n):
+        return self
+
+    def __iter__(self):
+        return iter(self._docs)
+
+    def to_list(self, length=None):
+        return list(self._docs if length is None else self._docs[:length])
+
+
+class AsyncMemoryCursor(MemoryCursor):
+    def __init__(self, docs, latency):
+        super().__init__(docs)
+        self._latency = latency
+
+    async def to_list(self, length=None):
+        if self._latency:
+            await asyncio.sleep(self._latency)
+        return MemoryCursor.to_list(self, length)
+
+    def __aiter__(self):
+        return self._aiter()
+
+    async def _aiter(self):
+        for doc in await self.to_list():
+            yield doc
+
+
+# -------------------------------------------------------------------
+# Collections
+# -------------------------------------------------------------------
+
+class MemoryCollection:
+    """
+    Thread-safe in-memory collection.
+
+    `latency` is a simulated network round trip per operation (slept
+    outside any lock). `write_lock_latency` is how long a write holds
+    the per-document lock, to emulate contention on hot documents.
+    """
+
+    def __init__(self, name: str, latency: float = 0.0, write_lock_latency: float = 0.0):
+        self.name = name
+        self.latency = latency
+        self.write_lock_latency = write_lock_latency
+        self._docs: List[dict] = []
+        self._lock = threading.RLock()
+        self._doc_locks: Dict[Any, threading.Lock] = {}
+        self._unique: List[List[str]] = []
+        self._indexes: Dict[str, Dict[Any, List[dict]]] = {}  # field -> value -> docs
+        self._docs_order: Dict[int, int] = {}  # id(doc) -> insertion order
+        self._ids = set()
+        self._seq = itertools.count()
+        self._local = threading.local()
+        self.ops = 0
+
+    # ---------------- helpers ----------------
+
+    def _rtt(self):
+        self.ops += 1
+        if self.latency and not getattr(self._local, "async_call", False):
+            time.sleep(self.latency)
+
+    @staticmethod
+    def _journal(kwargs):
+        """Undo log of the transaction this write runs in, if any."""
+        session = kwargs.get("session")
+        return session._undo if session is not None and session.in_transaction else None
+
+    def _restore(self, doc, before):
+        with self._lock:
+            self._index_remove(doc)
+            doc.clear()
+            doc.update(before)
+            self._index_add(doc)
+
+    def _remove(self, doc):
+        with self._lock:
+            if doc in self._docs:
+                self._docs.remove(doc)
+                self._ids.discard(doc["_id"])
+                self._index_remove(doc)
+
+    def _doc_lock(self, doc):
+        with self._lock:
+            return self._doc_locks.setdefault(doc["_id"], threading.Lock())
+
+    def _check_unique(self, doc, exclude=None):
+        for fields in self._unique:
+            key = tuple(_get(doc, f) for f in fields)
+            if all(k is None for k in key):
+                continue
+            for other in self._docs:
+                if other is not exclude and tuple(_get(other, f) for f in fields) == key:
+                    raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} "
+                                            f"index: {'_'.join(fields)} dup key: {key}")
+
+    def _index_add(self, doc):
+        for field, index in self._indexes.items():
+            value = doc.get(field)
+            if isinstance(value, (str, int, float)):
+                index.setdefault(value, []).append(doc)
+
+    def _index_remove(self, doc):
+        for field, index in self._indexes.items():
+            bucket = index.get(doc.get(field))
+            if bucket:
+                bucket[:] = [d for d in bucket if d is not doc]
+
+    def _candidates(self, flt):
+        with self._lock:
+            docs = self._docs
+            for field, index in self._indexes.items():
+                cond = (flt or {}).get(field, _NO_COND)
+                if isinstance(cond, (str, int, float)):
+                    docs = index.get(cond, [])
+                    break
+                if isinstance(cond, dict) and set(cond) == {"$in"}:
+                    docs = [d for v in dict.fromkeys(cond["$in"]) for d in index.get(v, [])]
+                    docs.sort(key=lambda d: self._docs_order[id(d)])
+                    break
+            return [d for d in docs if matches(d, flt)]
+
+    # ---------------- reads ----------------
+
+    def find(self, flt=None, projection=None, **kwargs):
+        self._rtt()
+        return MemoryCursor([_project(d, projection) for d in self._candidates(flt)])
+
+    def find_one(self, flt=None, projection=None, **kwargs):
+        self._rtt()
+        for d in self._candidates(flt):
+            return _project(d, projection)
+        return None
+
+    def count_documents(self, flt=None, **kwargs):
+        self._rtt()
+        return len(self._candidates(flt))
+
+    def estimated_document_count(self, **kwargs):
+        return len(self._docs)
+
+    # ---------------- writes ----------------
+
+    def create_index(self, keys, unique=False, **kwargs):
+        fields = [keys] if isinstance(keys, str) else [k for k, _ in keys]
+        with self._lock:
+            if unique:
+                self._unique.append(fields)
+            if fields[0] not in self._indexes:
+                self._indexes = {field: {} for field in [*self._indexes, fields[0]]}
+                for doc in self._docs:
+                    self._index_add(doc)
+        return "_".join(fields)
+
+    def _insert(self, doc, undo=None):
+        doc.setdefault("_id", ObjectId())
+        stored = copy.deepcopy(doc)
+        with self._lock:
+            if stored["_id"] in self._ids:
+                raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} "
+                                        f"index: _id_ dup key: {stored['_id']!r}")
+            self._check_unique(stored)
+            self._docs.append(stored)
+            self._ids.add(stored["_id"])
+            self._docs_order[id(stored)] = next(self._seq)
+            self._index_add(stored)
+        if undo is not None:
+            undo.append(lambda: self._remove(stored))
+        return doc["_id"]
+
+    def insert_one(self, doc, **kwargs):
+        self._rtt()
+        return InsertOneResult(self._insert(doc, self._journal(kwargs)))
+
+    def insert_many(self, docs, ordered=True, **kwargs):
+        self._rtt()
+        from pymongo.errors import BulkWriteError
+        undo = self._journal(kwargs)
+        ids, errors = [], []
+        for index, doc in enumerate(docs):
+            try:
+                ids.append(self._insert(doc, undo))
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e), "op": doc})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(ids), "writeConcernErrors": []})
+        return InsertManyResult(ids)
+
+    def _update(self, flt, update, multi, upsert=False, array_filters=None, undo=None):
+        matched = modified = 0
+        for doc in self._candidates(flt):
+            with self._doc_lock(doc):
+                if self.write_lock_latency:
+                    time.sleep(self.write_lock_latency)
+                with self._lock:
+                    if doc not in self._docs or not matches(doc, flt):
+                        continue  # lost the race: re-checked under the document lock
+                    before = copy.deepcopy(doc)
+                    self._index_remove(doc)
+                    apply_update(doc, update, flt, array_filters)
+                    try:
+                        self._check_unique(doc, exclude=doc)
+                    except DuplicateKeyError:
+                        doc.clear()
+                        doc.update(before)
+                        raise
+                    finally:
+                        self._index_add(doc)
+                    matched += 1
+                    modified += doc != before
+                    if undo is not None:
+                        undo.append(lambda doc=doc, before=before: self._restore(doc, before))
+            if not multi:
+                return UpdateResult(matched, modified), doc
+        if matched or not upsert:
+            return UpdateResult(matched, modified), None
+        new = {k: v for k, v in flt.items() if not k.startswith("$") and not isinstance(v, dict)}
+        apply_update(new, update, flt, array_filters, inserting=True)
+        return UpdateResult(0, 0, self._insert(new, undo)), new
+
+    def update_one(self, flt, update, upsert=False, array_filters=None, **kwargs):
+        self._rtt()
+        return self._update(flt, update, False, upsert, array_filters, self._journal(kwargs))[0]
+
+    def update_many(self, flt, update, upsert=False, array_filters=None, **kwargs):
+        self._rtt()
+        return self._update(flt, update, True, upsert, array_filters, self._journal(kwargs))[0]
+
+    def find_one_and_update(self, flt, update, projection=None, sort=None, upsert=False,
+                            return_document=False, array_filters=None, **kwargs):
+        self._rtt()
+        undo = self._journal(kwargs)
+        before = None
+        for doc in self._candidates(flt):
+            before = copy.deepcopy(doc)
+            result, updated = self._update({"_id": doc["_id"], **flt}, update, False,
+                                           array_filters=array_filters, undo=undo)
+            if result.matched_count:
+                return _project(updated if return_document else before, projection)
+        if upsert:
+            _, created = self._update(flt, update, False, True, array_filters, undo)
+            return _project(created, projection) if return_document else None
+        return None
+
+    def delete_one(self, flt, **kwargs):
+        self._rtt()
+        undo = self._journal(kwargs)
+        with self._lock:
+            for i, d in enumerate(self._docs):
+                if matches(d, flt):
+                    del self._docs[i]
+                    self._ids.discard(d["_id"])
+                    self._index_remove(d)
+                    if undo is not None:
+                        undo.append(lambda d=d: self._insert(d))
+                    return DeleteResult(1)
+        return DeleteResult(0)
+
+    def delete_many(self, flt, **kwargs):
+        self._rtt()
+        with self._lock:
+            keep = [d for d in self._docs if not matches(d, flt)]
+            deleted = len(self._docs) - len(keep)
+            for d in self._docs:
+                if not matches(d, flt):
+                    continue
+                self._ids.discard(d["_id"])
+                self._index_remove(d)
+            self._docs[:] = keep
+        return DeleteResult(deleted)
+
+    def bulk_write(self, requests, ordered=True, **kwargs):
+        from pymongo.errors import BulkWriteError
+        self._rtt()
+        result = BulkWriteResult()
+        errors = []
+        for index, req in enumerate(requests):
+            kind = type(req).__name__
+            doc = getattr(req, "_doc", None)
+            flt = getattr(req, "_filter", None)
+            try:
+                if kind == "InsertOne":
+                    self._insert(doc)
+                    result.inserted_count += 1
+                elif kind in ("UpdateOne", "UpdateMany"):
+                    res, _ = self._update(flt, doc, kind == "UpdateMany", req._upsert,
+                                          getattr(req, "_array_filters", None))
+                    result.matched_count += res.matched_count
+                    result.modified_count += res.modified_count
+                    result.upserted_count += res.upserted_id is not None
+                elif kind == "DeleteOne":
+                    with self._lock:
+                        for i, d in enumerate(self._docs):
+                            if matches(d, flt):
+                                del self._docs[i]
+                                self._ids.discard(d["_id"])
+                                self._index_remove(d)
+                                result.deleted_count += 1
+                                break
+                else:
+                    raise NotImplementedError(f"stand-in does not support {kind}")
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e), "op": doc})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({
+                "writeErrors": errors,
+                "nInserted": result.inserted_count,
+                "nMatched": result.matched_count,
+                "nModified": result.modified_count,
+                "nUpserted": result.upserted_count,
+                "nRemoved": result.deleted_count,
+                "upserted": [],
+                "writeConcernErrors": [],
+            })
+        return result
+
+    def watch(self, *args, **kwargs):
+        raise NotImplementedError("stand-in does not support change streams")
+
+
+class AsyncMemoryCollection:
+    """asyncio view of a MemoryCollection (latency via asyncio.sleep)."""
+
+    def __init__(self, collection: MemoryCollection):
+        self._col = collection
+
+    @property
+    def name(self):
+        return self._col.name
+
+    async def _rtt(self):
+        if self._col.latency:
+            await asyncio.sleep(self._col.latency)
+
+    def find(self, flt=None, projection=None, **kwargs):
+        self._col.ops += 1
+        docs = [_project(d, projection) for d in self._col._candidates(flt)]
+        return AsyncMemoryCursor(docs, self._col.latency)
+
+    def __getattr__(self, attr):
+        sync = getattr(self._col, attr)
+        if not callable(sync):
+            return sync
+
+        async def call(*args, **kwargs):
+            await self._rtt()
+            # the sync body must not time.sleep() on the event loop thread
+            local = self._col._local
+            local.async_call = True
+            try:
+                return sync(*args, **kwargs)
+            finally:
+                local.async_call = False
+        return call
+
+
+# -------------------------------------------------------------------
+# Redis
+# -------------------------------------------------------------------
+
+class MemoryRedis:
+    """The slice of redis-py (decode_responses=True) the agents use."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self._data: Dict[str, Any] = {}
+        self._expires: Dict[str, float] = {}
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self.ops = 0
+        self.bytes_written = 0
+        self.bytes_read = 0
+
+    def _rtt(self):
+        if getattr(self._local, "in_pipeline", False):
+            return
+        self.ops += 1
+        if self.latency and not getattr(self._local, "async_call", False):
+            time.sleep(self.latency)
+
+    def _alive(self, key):
+        exp = self._expires.get(key)
+        if exp is not None and exp <= time.monotonic():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return key in self._data
+
+    def _read(self, value):
+        if isinstance(value, str):
+            self.bytes_read += len(value.encode())
+        return value
+
+    def _wrote(self, *values):
+        for v in values:
+            self.bytes_written += len(str(v).encode())
+
+    # ---------------- strings ----------------
+
+    def ping(self):
+        self._rtt()
+        return True
+
+    def get(self, key):
+        self._rtt()
+        with self._lock:
+            if not self._alive(key):
+                return None
+            value = self._data[key]
+            if not isinstance(value, str):
+                raise ResponseError("WRONGTYPE Operation against a key holding the wrong kind of value")
+            return self._read(value)
+
+    def set(self, key, value, ex=None, px=None, nx=False, xx=False):
+        self._rtt()
+        with self._lock:
+            exists = self._alive(key)
+            if (nx and exists) or (xx and not exists):
+                return None
+            self._data[key] = str(value)
+            self._wrote(key, value)
+            self._expires.pop(key, None)
+            if ex or px:
+                self._expires[key] = time.monotonic() + (ex if ex else px / 1000)
+            return True
+
+    def setex(self, key, seconds, value):
+        return self.set(key, value, ex=seconds)
+
+    def incr(self, key, amount=1):
+        self._rtt()
+        with self._lock:
+            value = int(self._data.get(key, 0)) + amount if self._alive(key) else amount
+            self._data[key] = str(value)
+            return value
+
+    def delete(self, *keys):
+        self._rtt()
+        with self._lock:
+            n = 0
+            for key in keys:
+                if self._alive(key):
+                    n += 1
+                    self._data.pop(key, None)
+                    self._expires.pop(key, None)
+            return n
+
+    def exists(self, key):
+        self._rtt()
+        with self._lock:
+            return int(self._alive(key))
+
+    def expire(self, key, seconds):
+        self._rtt()
+        with self._lock:
+            if not self._alive(key):
+                return False
+            self._expires[key] = time.monotonic() + seconds
+            self._wrote(key)
+            return True
+
+    def ttl(self, key):
+        with self._lock:
+            if not self._alive(key):
+                return -2
+            exp = self._expires.get(key)
+            return -1 if exp is None else int(exp - time.monotonic())
+
+    def type(self, key):
+        with self._lock:
+            if not self._alive(key):
+                return "none"
+            return "hash" if isinstance(self._data[key], dict) else "string"
+
+    # ---------------- hashes ----------------
+
+    def _hash(self, key, create=False):
+        if not self._alive(key):
+            if not create:
+                return {}
+            self._data[key] = {}
+        value = self._data[key]
+        if not isinstance(value, dict):
+            raise ResponseError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        self._rtt()
+        with self._lock:
+            h = self._hash(key, create=True)
+            items = dict(mapping or {})
+            if field is not None:
+                items[field] = value
+            added = sum(1 for f in items if f not in h)
+            for f, v in items.items():
+                h[f] = str(v)
+                self._wrote(f, v)
+            self._wrote(key)
+            return added
+
+    def hget(self, key, field):
+        self._rtt()
+        with self._lock:
+            return self._read(self._hash(key).get(field))
+
+    def hmget(self, key, fields):
+        self._rtt()
+        with self._lock:
+            h = self._hash(key)
+            return [self._read(h.get(f)) for f in fields]
+
+    def hgetall(self, key):
+        self._rtt()
+        with self._lock:
+            h = dict(self._hash(key))
+            for f, v in h.items():
+                self._read(f)
+                self._read(v)
+            return h
+
+    def hdel(self, key, *fields):
+        self._rtt()
+        with self._lock:
+            h = self._hash(key)
+            n = sum(1 for f in fields if h.pop(f, None) is not None)
+            self._wrote(key, *fields)
+            if not h:
+                self._data.pop(key, None)
+            return n
+
+    # ---------------- pipelines ----------------
+
+    def pipeline(self, transaction=True):
+        return MemoryPipeline(self)
+
+
+class MemoryPipeline:
+    """Buffers commands; execute() costs a single round trip."""
+
+    def __init__(self, redis_: MemoryRedis):
+        self._redis = redis_
+        self._calls = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._calls = []
+
+    def __getattr__(self, attr):
+        fn = getattr(self._redis, attr)
+
+        def queue(*args, **kwargs):
+            self._calls.append((fn, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        r = self._redis
+        r._rtt()
+        r._local.in_pipeline = True
+        try:
+            return [fn(*args, **kwargs) for fn, args, kwargs in self._calls]
+        finally:
+            r._local.in_pipeline = False
+            self._calls = []
+
+
+class AsyncMemoryRedis:
+    """redis.asyncio view of a MemoryRedis."""
+
+    def __init__(self, redis_: MemoryRedis):
+        self._redis = redis_
+
+    def pipeline(self, transaction=True):
+        return AsyncMemoryPipeline(self._redis)
+
+    def __getattr__(self, attr):
+        sync = getattr(self._redis, attr)
+        if not callable(sync):
+            return sync
+
+        async def call(*args, **kwargs):
+            if self._redis.latency:
+                await asyncio.sleep(self._redis.latency)
+            local = self._redis._local
+            local.async_call = True
+            try:
+                return sync(*args, **kwargs)
+            finally:
+                local.async_call = False
+        return call
+
+
+class AsyncMemoryPipeline(MemoryPipeline):
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self._calls = []
+
+    async def execute(self):
+        if self._redis.latency:
+            await asyncio.sleep(self._redis.latency)
+        local = self._redis._local
+        local.async_call = True
+        try:
+            return MemoryPipeline.execute(self)
+        finally:
+            local.async_call = False
+
+
+# -------------------------------------------------------------------
+# Sessions (multi-document transactions)
+# -------------------------------------------------------------------
+
+class _Transaction:
+    """Context manager from start_transaction(): commits, or aborts on error."""
+
+    def __init__(self, session):
+        self._session = session
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if self._session.in_transaction:
+            if exc_type is None:
+                MemorySession.commit_transaction(self._session)
+            else:
+                MemorySession.abort_transaction(self._session)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.__exit__(*exc)
+
+
+class MemorySession:
+    """
+    Client session for the stand-ins. Writes made with `session=` inside
+    a transaction are rolled back (documents restored, inserts removed)
+    if it aborts. There is no snapshot isolation: other clients can see
+    a transaction's writes before it commits.
+    """
+
+    def __init__(self, env: "StandinEnv"):
+        self._env = env
+        self.in_transaction = False
+        self._undo: List = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.end_session()
+
+    def start_transaction(self, **kwargs) -> _Transaction:
+        if self.in_transaction:
+            raise InvalidOperation("Transaction already in progress")
+        self.in_transaction = True
+        self._undo = []
+        return _Transaction(self)
+
+    def commit_transaction(self):
+        self.in_transaction = False
+        self._undo = []
+        self._env.transactions["committed"] += 1
+
+    def abort_transaction(self):
+        self.in_transaction = False
+        undo, self._undo = self._undo, []
+        for step in reversed(undo):
+            step()
+        self._env.transactions["aborted"] += 1
+
+    def with_transaction(self, callback, **kwargs):
+        self.start_transaction()
+        try:
+            result = callback(self)
+        except BaseException:
+            self.abort_transaction()
+            raise
+        self.commit_transaction()
+        return result
+
+    def end_session(self):
+        if self.in_transaction:
+            MemorySession.abort_transaction(self)
+
+
+class AsyncMemorySession(MemorySession):
+    """asyncio flavour (AsyncMongoClient.start_session())."""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.end_session()
+
+    async def commit_transaction(self):
+        MemorySession.commit_transaction(self)
+
+    async def abort_transaction(self):
+        MemorySession.abort_transaction(self)
+
+    async def with_transaction(self, callback, **kwargs):
+        self.start_transaction()
+        try:
+            result = await callback(self)
+        except BaseException:
+            MemorySession.abort_transaction(self)
+            raise
+        MemorySession.commit_transaction(self)
+        return result
+
+
+# -------------------------------------------------------------------
+# Wiring
+# -------------------------------------------------------------------
+
+class StandinEnv:
+    collection_class = MemoryCollection  # patch its methods to inject failures
+
+    def __init__(self, mongo_latency: float, redis_latency: float, write_lock_latency: float):
+        self.mongo_latency = mongo_latency
+        self.write_lock_latency = write_lock_latency
+        self._collections: Dict[str, MemoryCollection] = {}
+        self._lock = threading.Lock()
+        self.redis = MemoryRedis(redis_latency)
+        self.async_redis = AsyncMemoryRedis(self.redis)
+        self.transactions = {"committed": 0, "aborted": 0}
+
+    def collection(self, name: str) -> MemoryCollection:
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = MemoryCollection(
+                    name, self.mongo_latency, self.write_lock_latency
+                )
+            return self._collections[name]
+
+    def async_collection(self, name: str) -> AsyncMemoryCollection:
+        return AsyncMemoryCollection(self.collection(name))
+
+    def start_session(self) -> MemorySession:
+        return MemorySession(self)
+
+    def start_async_session(self) -> AsyncMemorySession:
+        return AsyncMemorySession(self)
+
+    def mongo_ops(self) -> int:
+        return sum(c.ops for c in self._collections.values())
+
+
+class _CommandCounter(monitoring.CommandListener):
+    """Counts what a real server is asked to do, like the stand-ins' ops."""
+
+    COLLECTION_COMMANDS = {"find", "getMore", "insert", "update", "delete", "findAndModify",
+                           "aggregate", "count", "distinct"}
+
+    def __init__(self):
+        self.ops = 0
+        self.transactions = {"committed": 0, "aborted": 0}
+
+    def started(self, event):
+        if event.command_name in self.COLLECTION_COMMANDS:
+            self.ops += 1
+        elif event.command_name == "commitTransaction":
+            self.transactions["committed"] += 1
+        elif event.command_name == "abortTransaction":
+            self.transactions["aborted"] += 1
+
+    def succeeded(self, event): pass
+    def failed(self, event): pass
+
+
+class MongoEnv(StandinEnv):
+    """StandinEnv whose collections live in a throwaway database on TEST_MONGO_URL."""
+
+    collection_class = Collection
+
+    def __init__(self, redis_latency: float):
+        super().__init__(0.0, redis_latency, 0.0)
+        import database
+
+        self._database = database
+        self._counter = _CommandCounter()
+        self.transactions = self._counter.transactions
+        monitoring.register(self._counter)  # before the clients are created
+        database.MONGO_URL = TEST_MONGO_URL
+        database.DB_NAME = f"standins_{uuid.uuid4().hex[:8]}"
+        database._client = database._async_client = None
+        database._transactions = None  # detect, as in production
+        atexit.register(self.drop)
+
+    def collection(self, name: str) -> Collection:
+        return self._database.get_collection(name)
+
+    def async_collection(self, name: str):
+        return self._database.get_async_collection(name)
+
+    def start_session(self):
+        return self._database.start_session()
+
+    def start_async_session(self):
+        return self._database.start_async_session()
+
+    def mongo_ops(self) -> int:
+        return self._counter.ops
+
+    def drop(self):
+        try:
+            self._database.get_client().drop_database(self._database.DB_NAME)
+        except Exception as e:
+            print(f"[Standins] ⚠️ Could not drop {self._database.DB_NAME}: {e}")
+
+
+def install(mongo_latency: float = 0.0, redis_latency: float = 0.0,
+            write_lock_latency: float = 0.0) -> StandinEnv:
+    """
+    Routes database.py and cache.py to fresh in-memory stand-ins, or
+    only cache.py when TEST_MONGO_URL names a real server (the latency
+    arguments then only apply to Redis).
+    """
+    import cache
+    import database
+
+    if TEST_MONGO_URL:
+        env = MongoEnv(redis_latency)
+        print(f"[Standins] Real MongoDB: {database.DB_NAME} on {TEST_MONGO_URL}")
+    else:
+        env = StandinEnv(mongo_latency, redis_latency, write_lock_latency)
+        database.get_collection = env.collection
+        database.get_async_collection = env.async_collection
+        database.start_session = env.start_session
+        database.start_async_session = env.start_async_session
+        database._transactions = True
+    for name, fields in INDEXES.items():
+        for field in fields:
+            env.collection(name).create_index(field)
+    cache.get_redis = lambda: env.redis
+    cache.get_async_redis = lambda: env.async_redis
+    return env
+
+
+def seed_catalog(env: StandinEnv, n_products: int = 200, stock: int = 1000):
+    """A small catalog shaped like the real collections."""
+    categories = [("CAT-PHONE", "Smartphones"), ("CAT-LAPTOP", "Laptops"),
+                  ("CAT-SHOE", "Footwear"), ("CAT-TEE", "T-Shirts")]
+    env.collection("categories").insert_many(
+        [{"categoryId": cid, "name": name} for cid, name in categories]
+    )
+    products, inventory = [], []
+    for i, (cid, name) in zip(range(n_products), itertools.cycle(categories)):
+        pid = f"PROD-{i:05d}"
+        products.append({"productId": pid, "name": f"{name[:-1]} Model {i}",
+                         "price": 100 + (i % 50) * 10, "category": cid})
+        inventory.append({"productId": pid, "stockByLocation": [
+            {"locationId": "STORE-MALL", "region": "SOUTH", "qty": stock},
+            {"locationId": "ONLINE", "region": "ONLINE", "qty": stock},
+        ]})
+    env.collection("products").insert_many(products)
+    env.collection("inventory").insert_many(inventory)
+    import stock as stock_totals
+    env.collection("inventory").update_many({}, [stock_totals.TOTALS_STAGE])
+    env.collection("loyalty_accounts").insert_one({"customerId": "CUST_GUEST", "points": 50})
+    return products
+
+
+# Indexes the real deployment has; the stand-ins use them for lookups.
+INDEXES = {
+    "products": ["productId", "category"],
+    "categories": ["categoryId"],
+    "inventory": ["productId"],
+    "orders": ["orderId"],
+    "payments": ["orderId"],
+    "loyalty_accounts": ["customerId"],
+    "reservations": ["orderId"],
+    "stock_shards": ["productId"],
+}
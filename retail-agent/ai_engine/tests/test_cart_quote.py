@@ -0,0 +1,97 @@
+"""
+Cart quotes against the in-memory stand-ins.
+
+Checks that a cart of N lines costs one query per collection (coupons
+are resolved in memory by promotion_index), that a one-line cart
+prices exactly like calculate_final_price, that the loyalty cap
+applies to the cart total rather than per line, that line coupons
+override the cart coupon, and that the async twin agrees.
+
+    python test_cart_quote.py
+"""
+
+import asyncio
+
+import standins
+
+
+def main():
+    env = standins.install()
+    products = standins.seed_catalog(env)
+    env.collection("promotions").insert_many([
+        {"promoId": "SAVE10", "name": "Festive Ten", "discount": 10},
+        {"promoId": "SHOE20", "name": "Footwear Week", "discount": 20},
+    ])
+    env.collection("loyalty_accounts").insert_one({"customerId": "CUST_RICH", "points": 100_000})
+
+    from loyalty_agent import MAX_POINT_COVERAGE, calculate_final_price, quote_cart, quote_cart_async, quote_carts
+
+    def close(a, b):
+        return abs(a - b) < 1e-6
+
+    print("---- ONE QUERY PER COLLECTION ----")
+    items = [{"product_name": p["name"], "quantity": 1 + i % 3} for i, p in enumerate(products[:25])]
+    quote_cart(items[:1], "CUST_GUEST", coupon_code="SAVE10")  # loads the product and promotion indexes
+    ops = env.mongo_ops()
+    quote = quote_cart(items, "CUST_GUEST", coupon_code="SAVE10", use_points=True)
+    assert env.mongo_ops() - ops == 2, env.mongo_ops() - ops  # products, loyalty (coupons: promotion_index)
+    assert quote.ok and len(quote.lines) == 25
+    assert close(quote.subtotal, sum(p["price"] * (1 + i % 3) for i, p in enumerate(products[:25])))
+    assert close(quote.final_total, sum(line.final_price for line in quote.lines))
+    assert close(quote.subtotal - quote.savings, quote.final_total)
+    print(quote.render().splitlines()[0], f"{len(quote.lines)} lines, {env.mongo_ops() - ops} queries")
+
+    print("\n---- ONE LINE == calculate_final_price ----")
+    for product in products[:8]:
+        for code in (None, "SAVE10", "festive", "NOPE"):
+            single = calculate_final_price(product["name"], product["price"], "CUST_GUEST",
+                                           coupon_code=code, use_points=True)
+            cart = quote_cart([{"product_name": product["name"]}], "CUST_GUEST", coupon_code=code, use_points=True)
+            assert close(single.final_price, cart.final_total), (product, code, single, cart)
+            assert close(single.points_redeemed, cart.points_redeemed)
+            assert single.coupon_name == cart.lines[0].coupon_name
+    print("8 products x 4 coupons agree")
+
+    print("\n---- POINTS CAP ON THE CART TOTAL ----")
+    quote = quote_cart(items, "CUST_RICH", coupon_code="SAVE10", use_points=True)
+    after_coupons = quote.subtotal - quote.coupon_discount
+    assert close(quote.points_redeemed, after_coupons * MAX_POINT_COVERAGE)
+    assert close(quote.final_total, after_coupons * (1 - MAX_POINT_COVERAGE))
+    for line in quote.lines:  # spread in proportion to price
+        assert close(line.points_redeemed, (line.base_price - line.coupon_discount) * MAX_POINT_COVERAGE)
+    poor = quote_cart(items, "CUST_GUEST", use_points=True)
+    assert close(poor.points_redeemed, 50) and poor.points_balance == 50
+    print(f"capped at ₹{quote.points_redeemed:.2f} of ₹{after_coupons:.2f}; guest uses all 50 points")
+
+    print("\n---- LINE COUPONS, UNKNOWN PRODUCTS, BAD QUANTITIES ----")
+    shoe = next(p for p in products if p["category"] == "CAT-SHOE")
+    quote = quote_cart([{"productId": shoe["productId"], "coupon_code": "SHOE20"},
+                        {"product_name": products[0]["name"]},
+                        {"product_name": "No Such Gadget"}], "CUST_GUEST", coupon_code="SAVE10")
+    assert [line.coupon_name for line in quote.lines] == ["Footwear Week", "Festive Ten"]
+    assert close(quote.lines[0].coupon_discount, shoe["price"] * 0.2)
+    assert not quote.ok and quote.errors[0]["line"] == 2
+    print(quote.render())
+    bad = quote_cart([{"product_name": products[0]["name"], "quantity": -2},
+                      {"product_name": products[1]["name"], "quantity": 0},
+                      {"product_name": products[2]["name"]}], "CUST_GUEST")
+    assert [e["line"] for e in bad.errors] == [0, 1] and len(bad.lines) == 1 and bad.final_total > 0
+
+    print("\n---- BATCH AND ASYNC ----")
+    carts = [{"customer_id": "CUST_GUEST" if i % 2 else "CUST_RICH", "coupon_code": "SAVE10" if i % 3 else None,
+              "use_points": bool(i % 4), "items": items[i % 5:i % 5 + 4]} for i in range(50)]
+    ops = env.mongo_ops()
+    batch = quote_carts(carts)
+    assert env.mongo_ops() - ops == 2
+    for cart, quote in zip(carts, batch):
+        alone = quote_cart(cart["items"], cart["customer_id"], cart["coupon_code"], cart["use_points"])
+        assert close(alone.final_total, quote.final_total) and close(alone.points_redeemed, quote.points_redeemed)
+        async_quote = asyncio.run(quote_cart_async(cart["items"], cart["customer_id"],
+                                                   cart["coupon_code"], cart["use_points"]))
+        assert async_quote == quote
+    print(f"{len(carts)} carts in 2 queries; batch, single and async quotes agree")
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+LLM intent labels and their response cache, on the in-memory stand-ins.
+
+The model's reply is mapped to a known intent before it is cached
+("Intent: buy now." -> BUY_NOW); a reply that names no intent falls back
+to PRODUCT_DISCOVERY without being cached, so the next turn asks again.
+Also runs the batched path on two event loops one after the other.
+
+    python test_intent_detector.py
+"""
+
+import asyncio
+from collections import Counter
+
+import standins
+
+
+def main():
+    standins.install()
+
+    import cache
+    import intent_detector
+
+    cache.LLM_CACHE_ENABLED = True
+    intent_detector.get_model = lambda: None  # every message goes to the LLM
+    replies = {}  # message -> replies still to give, in order
+    asked = Counter()
+
+    def reply_for(message):
+        asked[message] += 1
+        return replies[message].pop(0)
+
+    def fake_llm(prompt, use_cache=True):
+        assert not use_cache  # intent_detector caches only valid labels itself
+        message = prompt.split('"')[1]
+        return reply_for(message)
+
+    async def fake_llm_async(prompt, use_cache=True):
+        assert not use_cache
+        if "Customer messages:" in prompt:  # batch: number each message's reply
+            messages = [line.split('"')[1] for line in prompt.splitlines() if line[:1].isdigit()]
+            return "\n".join(f"{i}: {reply_for(m)}" for i, m in enumerate(messages, 1))
+        return fake_llm(prompt, use_cache)
+
+    intent_detector.llm = fake_llm
+    intent_detector.llm_async = fake_llm_async
+
+    print("---- LABELS ARE MAPPED, THEN CACHED ----")
+    replies["can i pay now"] = ["Intent: buy now."]
+    assert intent_detector.detect_intent("can i pay now") == "BUY_NOW"
+    assert intent_detector.detect_intent("can i pay now") == "BUY_NOW"
+    assert asked["can i pay now"] == 1
+    print("'Intent: buy now.' -> BUY_NOW, second turn from the cache")
+
+    print("\n---- UNKNOWN LABELS ARE NOT CACHED ----")
+    replies["hmm"] = ["I am not sure.", "PRICE_OFFERS"]
+    assert intent_detector.detect_intent("hmm") == "PRODUCT_DISCOVERY"
+    assert intent_detector.detect_intent("hmm") == "PRICE_OFFERS"
+    assert asked["hmm"] == 2
+    print("fallback on a bad reply; asked again next turn")
+
+    print("\n---- BATCHED, ON TWO EVENT LOOPS ----")
+
+    async def detect(messages):
+        return await asyncio.gather(*(intent_detector.detect_intent_async(m) for m in messages))
+
+    replies.update({"where is my order": ["POST_PURCHASE"], "any deals": ["garbled"],
+                    "is it in stock": ["AVAILABILITY_CHECK"]})
+    replies["any deals"].append("no idea")  # the garbled line is asked again on its own
+    first = asyncio.run(detect(["where is my order", "any deals", "is it in stock"]))
+    assert first == ["POST_PURCHASE", "PRODUCT_DISCOVERY", "AVAILABILITY_CHECK"], first
+
+    replies["any deals"] = ["PRICE_OFFERS"]
+    replies["show me shoes"] = ["PRODUCT_DISCOVERY"]
+    second = asyncio.run(detect(["any deals", "show me shoes", "where is my order"]))
+    assert second == ["PRICE_OFFERS", "PRODUCT_DISCOVERY", "POST_PURCHASE"], second
+    assert asked["where is my order"] == 1 and asked["any deals"] == 3, asked
+    stats = intent_detector.batching_stats()
+    assert stats["batches"] == 1 and stats["failed_batches"] == 0, stats
+    print(first, "->", second)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Chat router keyword matching, on the in-memory stand-ins.
+
+Keywords match whole words (plus plural and -ing/-ed endings), so a
+word that merely contains a keyword does not route. Pins both sides:
+the aliases that keep compound words working ("iphone", "shipping",
+"handbag") and the substrings that must stay unmatched, and that a
+store word before any product is picked starts browsing instead.
+
+    python test_keyword_router.py
+"""
+
+import standins
+
+
+def main():
+    env = standins.install()
+    standins.seed_catalog(env)
+
+    from sales_agent import ROUTER, resolve_category, sales_agent_chat
+
+    print("---- CATEGORIES ----")
+    for text, category in [
+        ("show me phones", "Smartphones"),
+        ("any iphone deals?", "Smartphones"),
+        ("iPhones under 50k", "Smartphones"),
+        ("a new smartwatch", "Accessories"),
+        ("leather handbags", "Bags"),
+        ("running shoes", "Sportswear"),
+        ("is a mac any good", "Laptops"),
+        ("my stomach hurts", None),        # "mac" inside a word
+        ("headphones", None),              # no alias: not a phone
+        ("microphone stand", None),
+    ]:
+        assert resolve_category(text) == category, (text, resolve_category(text))
+    print("category keywords route on whole words and aliases")
+
+    print("\n---- STORE / DELIVERY / POST ----")
+    for text, concept in [
+        ("pick up at the shop", "STORE"),
+        ("free shipping?", "DELIVERY"),
+        ("it shipped yesterday", "DELIVERY"),
+        ("tracking my order", "POST"),
+        ("I returned it", "POST"),
+        ("pay at the pos", "PAYMENT"),
+    ]:
+        assert concept in ROUTER.concepts(text), (text, ROUTER.concepts(text))
+    for text, concept in [
+        ("I'm shopping for a laptop", "STORE"),  # browsing, not a store visit
+        ("is it possible", "PAYMENT"),     # "pos" inside a word
+        ("a workshop near me", "STORE"),   # "shop" inside a word
+        ("friendship bracelet", "DELIVERY"),
+        ("racetrack shoes", "POST"),
+    ]:
+        assert concept not in ROUTER.concepts(text), (text, ROUTER.concepts(text))
+    print("decision words route on whole words and aliases")
+
+    print("\n---- STORE WORD BEFORE A PRODUCT IS PICKED ----")
+    reply, session = sales_agent_chat("any laptops in the store near me?", {})
+    assert session["stage"] == "AWAITING_SELECTION" and session["recommendations"], (reply, session)
+    print(reply.splitlines()[0])
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
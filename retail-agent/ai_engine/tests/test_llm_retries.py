@@ -0,0 +1,67 @@
+"""
+Status retries of the async LLM client, against an in-process transport.
+
+llm_async must ride out 429/502/503/504 like the sync requests client
+does: retry with backoff (or the server's Retry-After), and give up with
+the last error after LLM_RETRIES retries.
+
+    python test_llm_retries.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+# The agents import each other by flat name (see backend/main.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sales_agent"))
+
+
+def main():
+    import llm_client
+
+    calls = []
+
+    def flaky(request):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            return httpx.Response(503)
+        if len(calls) == 2:
+            return httpx.Response(429, headers={"Retry-After": "0.05"})
+        return httpx.Response(200, json={"response": " Hello! "})
+
+    def down(request):
+        calls.append(time.monotonic())
+        return httpx.Response(502)
+
+    def client(handler):
+        return httpx.AsyncClient(transport=llm_client.StatusRetryTransport(
+            httpx.MockTransport(handler), retries=2, backoff_factor=0.01))
+
+    async def run():
+        print("---- 503, THEN 429 WITH RETRY-AFTER, THEN 200 ----")
+        llm_client._async_http = client(flaky)
+        assert await llm_client.llm_async("hi", use_cache=False) == "Hello!"
+        gaps = [b - a for a, b in zip(calls, calls[1:])]
+        assert len(calls) == 3 and gaps[1] >= 0.05, gaps
+        print("recovered after", len(calls) - 1, "retries")
+
+        print("\n---- STILL DOWN AFTER THE RETRIES ----")
+        calls.clear()
+        llm_client._async_http = client(down)
+        try:
+            await llm_client.llm_async("hi", use_cache=False)
+            raise AssertionError("expected the 502 to surface")
+        except httpx.HTTPStatusError as e:
+            assert e.response.status_code == 502 and len(calls) == 3, calls
+        print("gave up after", len(calls), "attempts")
+        await llm_client.close_async_client()
+
+    asyncio.run(run())
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Retry storm against process_payment, on the in-memory stand-ins.
+
+Each order gets --retries concurrent submissions (threads for the sync
+tool, tasks for the async one) while the gateway takes --gateway-ms.
+Every order must be charged exactly once, have exactly one successful
+payment record matching its paymentId, and every submission must get
+that same payment back. Also checks that a failure between the two
+payment writes rolls both back, that a decline can be retried, that a
+key reused for a different payment is refused, and that a gateway call
+slower than the lease is not charged twice.
+
+    python test_payment_idempotency.py
+"""
+
+import argparse
+import asyncio
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import standins
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=20)
+    parser.add_argument("--retries", type=int, default=25)
+    parser.add_argument("--gateway-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    env = standins.install(mongo_latency=0.001)
+    standins.seed_catalog(env)
+
+    import payment_agent
+    from fulfillment_agent import place_order
+    from payment_agent import process_payment, process_payment_async
+    from results import PAYMENT_SUCCESS, PAYMENT_FAILED, IDEMPOTENCY_CONFLICT
+
+    charges = Counter()
+    charges_lock = threading.Lock()
+    real_gateway = payment_agent.simulate_gateway_process
+
+    def slow_gateway(method, amount, idempotency_key=None):
+        with charges_lock:
+            charges[idempotency_key] += 1
+        time.sleep(args.gateway_ms / 1000)
+        return real_gateway(method, amount, idempotency_key)
+
+    payment_agent.simulate_gateway_process = slow_gateway
+    orders_col, payments_col = env.collection("orders"), env.collection("payments")
+
+    def new_orders(n):
+        return [place_order.invoke({"product_name": f"Smartphone Model {4 * (i % 50)}", "quantity": 1,
+                                    "fulfillment_type": "PICKUP"}).order_id for i in range(n)]
+
+    def check(order_ids, results):
+        for order_id in order_ids:
+            order = orders_col.find_one({"orderId": order_id})
+            paid = payments_col.find({"orderId": order_id, "status": PAYMENT_SUCCESS}).to_list()
+            assert order["status"] == "PAID", order
+            assert len(paid) == 1, paid
+            assert paid[0]["paymentId"] == order["paymentId"]
+            assert charges[payment_agent.default_idempotency_key(order_id)] == 1
+            seen = {(r.status, r.payment_id) for r in results[order_id]}
+            assert seen == {(PAYMENT_SUCCESS, order["paymentId"])}, seen
+
+    print("---- SYNC RETRY STORM ----")
+    order_ids = new_orders(args.orders)
+    results = {order_id: [] for order_id in order_ids}
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.orders * args.retries) as pool:
+        futures = [(order_id, pool.submit(process_payment.invoke, {"order_id": order_id, "payment_method": "UPI"}))
+                   for _ in range(args.retries) for order_id in order_ids]
+        for order_id, future in futures:
+            results[order_id].append(future.result())
+    check(order_ids, results)
+    print(f"{len(futures)} submissions for {len(order_ids)} orders in {time.perf_counter() - t0:.2f}s: "
+          f"{sum(charges.values())} charges")
+
+    print("\n---- ASYNC RETRY STORM ----")
+    order_ids = new_orders(args.orders)
+
+    async def storm():
+        calls = [(order_id, process_payment_async(order_id, "CARD"))
+                 for _ in range(args.retries) for order_id in order_ids]
+        done = await asyncio.gather(*(call for _, call in calls))
+        return {order_id: [r for (oid, _), r in zip(calls, done) if oid == order_id] for order_id in order_ids}
+
+    t0 = time.perf_counter()
+    results = asyncio.run(storm())
+    check(order_ids, results)
+    print(f"{args.orders * args.retries} submissions for {len(order_ids)} orders in "
+          f"{time.perf_counter() - t0:.2f}s: {sum(charges.values())} charges")
+
+    print("\n---- FAILURE BETWEEN THE TWO WRITES ----")
+    [order_id] = new_orders(1)
+    real_insert = env.collection_class.insert_one
+
+    def failing_insert(self, doc, **kwargs):
+        if self.name == "payments" and kwargs.get("session") is not None:
+            raise ConnectionError("connection reset while storing the payment")
+        return real_insert(self, doc, **kwargs)
+
+    env.collection_class.insert_one = failing_insert
+    try:
+        process_payment.invoke({"order_id": order_id, "payment_method": "UPI"})
+        raise AssertionError("expected the payment write to fail")
+    except ConnectionError:
+        pass
+    finally:
+        env.collection_class.insert_one = real_insert
+    assert orders_col.find_one({"orderId": order_id})["status"] == "CONFIRMED"  # rolled back
+    assert not payments_col.find_one({"orderId": order_id})
+    result = process_payment.invoke({"order_id": order_id, "payment_method": "UPI"})
+    assert result.status == PAYMENT_SUCCESS, result
+    print("rolled back, retry succeeded:", result.payment_id, env.transactions)
+
+    print("\n---- DECLINE, THEN RETRY ----")
+    [order_id] = new_orders(1)
+    declined = process_payment.invoke({"order_id": order_id, "payment_method": "BITCOIN"})
+    assert declined.status == PAYMENT_FAILED, declined
+    paid = process_payment.invoke({"order_id": order_id, "payment_method": "UPI"})
+    assert paid.status == PAYMENT_SUCCESS, paid
+    again = process_payment.invoke({"order_id": order_id, "payment_method": "UPI"})
+    assert again.payment_id == paid.payment_id
+    print(declined.render().splitlines()[0], "->", paid.render().splitlines()[0])
+
+    print("\n---- SAME KEY, DIFFERENT REQUEST ----")
+    [order_id] = new_orders(1)
+    paid = process_payment.invoke({"order_id": order_id, "payment_method": "UPI", "idempotency_key": "client-1"})
+    other = process_payment.invoke({"order_id": order_id, "payment_method": "CARD", "idempotency_key": "client-1"})
+    same = process_payment.invoke({"order_id": order_id, "payment_method": " upi ", "idempotency_key": "client-1"})
+    assert paid.status == PAYMENT_SUCCESS and other.status == IDEMPOTENCY_CONFLICT, other
+    assert same.payment_id == paid.payment_id
+    print(other.render())
+
+    print("\n---- GATEWAY SLOWER THAN THE LEASE ----")
+    [order_id] = new_orders(1)
+    lease = payment_agent.idempotency.LEASE_SECONDS
+    payment_agent.idempotency.LEASE_SECONDS = 0.2
+
+    def stalled_gateway(method, amount, idempotency_key=None):
+        time.sleep(0.8)
+        return slow_gateway(method, amount, idempotency_key)
+
+    payment_agent.simulate_gateway_process = stalled_gateway
+    try:
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            first = pool.submit(process_payment.invoke, {"order_id": order_id, "payment_method": "UPI"})
+            time.sleep(0.5)  # well past the original lease
+            second = pool.submit(process_payment.invoke, {"order_id": order_id, "payment_method": "UPI"})
+            results = {order_id: [first.result(), second.result()]}
+    finally:
+        payment_agent.idempotency.LEASE_SECONDS = lease
+        payment_agent.simulate_gateway_process = slow_gateway
+    check([order_id], results)
+    print("charged once; lease renewals:", payment_agent.idempotency.idempotency_stats()["renewals"])
+
+    print("\nidempotency:", payment_agent.idempotency.idempotency_stats())
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Promotion index against the in-memory stand-ins.
+
+Checks coupon resolution by code and by name, validity windows and
+product / category eligibility (parent categories cover their leaves;
+no MongoDB round trip once loaded), that the pricing agent honours
+them, and that readers keep
+getting complete snapshots while the index is reloaded under them.
+
+    python test_promotion_index.py
+"""
+
+import datetime
+import threading
+
+import standins
+
+
+def main():
+    env = standins.install()
+    products = standins.seed_catalog(env)
+    categories = env.collection("categories")
+    categories.insert_one({"categoryId": "CAT-TECH", "name": "Tech"})
+    categories.update_many({"categoryId": {"$in": ["CAT-PHONE", "CAT-LAPTOP"]}}, {"$set": {"parentId": "CAT-TECH"}})
+    now = datetime.datetime.now()
+    day = datetime.timedelta(days=1)
+    env.collection("promotions").insert_many([
+        {"promoId": "SAVE10", "name": "Festive Ten", "discount": 10},
+        {"promoId": "SHOE20", "name": "Footwear Week!", "discount": 20, "applicableCategories": ["CAT-SHOE"]},
+        {"promoId": "PHONE0", "name": "Phone Zero Deal", "discount": 30, "applicableProducts": ["PROD-00000"]},
+        {"promoId": "SOON", "name": "Coming Soon", "discount": 50, "startDate": now + day},
+        {"promoId": "OVER", "name": "Summer Gone", "discount": 50, "startDate": now - 2 * day, "endDate": now - day},
+        {"promoId": "OFF", "name": "Switched Off", "discount": 50, "active": False},
+        {"promoId": "TECH5", "name": "Tech Tuesday", "discount": 5, "applicableCategories": ["CAT-TECH"]},
+        {"promoId": "ELEC15", "name": "Gadget Days", "discount": 15, "applicableCategories": ["Electronics"]},
+    ])
+
+    import promotion_index
+    from loyalty_agent import calculate_final_price, find_applicable_promotion
+    from promotion_index import applicable_promotion, find_promotion
+
+    phone, shoe = products[0], next(p for p in products if p["category"] == "CAT-SHOE")
+
+    print("---- RESOLUTION ----")
+    assert find_promotion("save10").promo_id == "SAVE10"
+    assert find_promotion(" Festive Ten ").promo_id == "SAVE10"     # exact name
+    assert find_promotion("footwear week").promo_id == "SHOE20"     # punctuation insensitive
+    assert find_promotion("festive").promo_id == "SAVE10"           # substring, like the old $regex
+    assert find_promotion("NOPE") is None and find_promotion("OFF") is None
+    print("codes and names resolve:", promotion_index.promotion_index_stats())
+
+    print("\n---- WINDOWS AND ELIGIBILITY, NO ROUND TRIPS ----")
+    ops = env.mongo_ops()
+    assert applicable_promotion("SAVE10", phone) and applicable_promotion("SAVE10", shoe)
+    assert applicable_promotion("SHOE20", shoe) and not applicable_promotion("SHOE20", phone)
+    assert applicable_promotion("PHONE0", phone) and not applicable_promotion("PHONE0", shoe)
+    assert find_promotion("SOON") and not applicable_promotion("SOON", phone)
+    assert applicable_promotion("SOON", phone, now=now + 2 * day)
+    assert not applicable_promotion("OVER", phone)
+    assert applicable_promotion("TECH5", phone) and not applicable_promotion("TECH5", shoe)  # parent id
+    assert applicable_promotion("ELEC15", phone) and not applicable_promotion("ELEC15", shoe)  # parent name
+    assert find_applicable_promotion("SHOE20", phone) == (None, 0)
+    assert find_applicable_promotion("SHOE20", shoe) == ("Footwear Week!", 20)
+    assert env.mongo_ops() == ops, env.mongo_ops() - ops
+    quote = calculate_final_price(phone["name"], phone["price"], "CUST_GUEST", coupon_code="SHOE20")
+    assert quote.coupon_discount == 0 and "Invalid coupon" in quote.render()
+    quote = calculate_final_price(shoe["name"], shoe["price"], "CUST_GUEST", coupon_code="SHOE20")
+    assert quote.coupon_discount == shoe["price"] * 0.2
+    print("windows and eligibility checked in memory")
+
+    print("\n---- HOT RELOAD ----")
+    env.collection("promotions").insert_one({"promoId": "NEW5", "name": "Fresh Five", "discount": 5})
+    assert find_promotion("NEW5") is None  # until the next reload
+    promotion_index.reload()
+    assert find_promotion("NEW5").discount == 5
+
+    stop, seen, errors = threading.Event(), set(), []
+
+    def reader():
+        while not stop.is_set():
+            snapshot = promotion_index._current
+            size = len(snapshot.by_code)
+            if size != len(snapshot.by_name) or not snapshot.lookup("SAVE10"):
+                errors.append(size)
+            seen.add(size)
+
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for i in range(200):
+        if i % 2:
+            env.collection("promotions").delete_one({"promoId": "EXTRA"})
+        else:
+            env.collection("promotions").insert_one({"promoId": "EXTRA", "name": f"Extra {i}", "discount": 1})
+        promotion_index.reload()
+    stop.set()
+    for t in threads:
+        t.join()
+    assert not errors, errors[:5]
+    print(f"200 reloads under 4 readers; snapshot sizes seen: {sorted(seen)}")
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Recommendation-cache change-stream watcher, against a scripted stream.
+
+The watcher must survive failed connects and a stream that drops
+mid-way: reconnect with growing delays, resume after the last event it
+saw, drop only the affected category on an in-place update, drop
+everything when it cannot tell what changed (fresh start, category
+move), and stop for good where change streams are unsupported.
+
+    python test_recommendation_watch.py
+"""
+
+import os
+import sys
+import threading
+import time
+
+from pymongo.errors import AutoReconnect, OperationFailure
+
+# The agents import each other by flat name (see backend/main.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sales_agent"))
+
+
+def main():
+    import recommendation_agent as rec
+
+    rec.WATCH_RETRY_MIN_SECONDS = 0.02
+    rec.WATCH_RETRY_MAX_SECONDS = 0.05
+    keys = {"phones": ["CAT-PHONE"], "laptops": ["CAT-LAPTOP"], "text": [rec._FREE_TEXT]}
+
+    def fill():
+        for key, tags in keys.items():
+            rec._cache_put(key, [{"productId": key}], tags)
+
+    def left():
+        return sorted(key for key in keys if key in rec._results)
+
+    seen = []  # (resume_after, time) of each watch() call
+    opened = []  # cache contents when the watcher starts reading a stream
+    after = {}  # cache contents after each event
+
+    class Stream:
+        def __init__(self, events, then):
+            self.events, self.then, self.resume_token = events, then, None
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def __iter__(self):
+            opened.append(left())
+            for token, event in self.events:
+                fill()
+                self.resume_token = token  # pymongo updates it as the event is returned
+                yield event
+                after[token] = left()
+            raise self.then
+
+    update = {"operationType": "update", "fullDocument": {"category": "CAT-PHONE"},
+              "updateDescription": {"updatedFields": {"price": 99}}}
+    move = {"operationType": "update", "fullDocument": {"category": "CAT-SHOE"},
+            "updateDescription": {"updatedFields": {"category": "CAT-SHOE"}}}
+    script = [
+        AutoReconnect("connection refused"),
+        Stream([("T1", update)], AutoReconnect("connection reset")),
+        Stream([("T2", move)], OperationFailure("resume point no longer in the oplog", code=286)),
+        AutoReconnect("connection refused"),
+        AutoReconnect("connection refused"),
+        OperationFailure("The $changeStream stage is only supported on replica sets", code=40573),
+    ]
+
+    class Products:
+        def watch(self, full_document=None, resume_after=None):
+            seen.append((resume_after, time.monotonic()))
+            fill()
+            step = script.pop(0)
+            if isinstance(step, Exception):
+                raise step
+            return step
+
+    rec.products_col = Products()
+    thread = threading.Thread(target=rec._watch_products, daemon=True)
+    thread.start()
+    thread.join(timeout=5)
+    assert not thread.is_alive() and not script, "watcher should stop where change streams are unsupported"
+
+    print("---- RECONNECTS ----")
+    tokens = [token for token, _ in seen]
+    assert tokens == [None, None, "T1", None, None, None], tokens  # resumed after T1; fresh after the lost oplog
+    gaps = [b - a for (_, a), (_, b) in zip(seen, seen[1:])]
+    assert min(gaps) >= 0.02 and gaps[-1] >= 0.04, gaps  # back-to-back failures wait longer
+    print("resume tokens:", tokens, "delays:", [round(g, 2) for g in gaps])
+
+    print("\n---- INVALIDATION ----")
+    assert opened == [[], ["laptops", "phones", "text"]], opened  # a fresh start flushes, a resume does not
+    assert after["T1"] == ["laptops"], after  # the phone category and free text
+    assert after["T2"] == [], after  # old category unknown: everything
+    print("fresh start:", opened[0], "| resumed:", opened[1])
+    print("in-place update:", after["T1"], "| category move:", after["T2"])
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
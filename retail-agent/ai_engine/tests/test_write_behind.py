@@ -0,0 +1,141 @@
+"""
+Write-behind buffer, on the in-memory stand-ins.
+
+Checks that feedback and declined / POS payment records are queued
+instead of written inline, that the queue flushes by size and by time
+with one insert_many per collection, that records are spilled to a file
+while MongoDB is down and replayed (once) when it is back, and that
+drain() writes whatever is still queued.
+
+    python test_write_behind.py
+"""
+
+import os
+import tempfile
+import time
+
+import standins
+
+
+def main():
+    env = standins.install(mongo_latency=0.002)
+    standins.seed_catalog(env)
+
+    import write_behind
+    from fulfillment_agent import place_order
+    from payment_agent import process_payment
+    from post_purchase_agent import handle_post_purchase
+
+    write_behind.SPILL_PATH = os.path.join(tempfile.mkdtemp(), "spill.jsonl")
+    write_behind.FLUSH_SIZE = 50
+    write_behind.FLUSH_INTERVAL = 0.1
+    feedback, payments, pos = (env.collection(name) for name in ("feedback", "payments", "pos_transactions"))
+
+    def wait_for(cond, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while not cond():
+            assert time.monotonic() < deadline, write_behind.write_behind_stats()
+            time.sleep(0.01)
+
+    print("---- OFF THE CHAT PATH ----")
+    order_id = place_order.invoke({"product_name": "Smartphone Model 0", "quantity": 1,
+                                   "fulfillment_type": "PICKUP"}).order_id
+    ops = env.mongo_ops()
+    result = handle_post_purchase(request_type="FEEDBACK", order_id=order_id, details="great", rating=5)
+    assert result.ok and env.mongo_ops() - ops == 1, env.mongo_ops() - ops  # just the order lookup
+    assert feedback.count_documents({}) == 0
+    declined = process_payment.invoke({"order_id": order_id, "payment_method": "BITCOIN"})
+    paid = process_payment.invoke({"order_id": order_id, "payment_method": "POS"})
+    assert payments.count_documents({}) == 1  # the success is written inline, with the order
+    wait_for(lambda: feedback.count_documents({}) == 1 and payments.count_documents({}) == 2
+             and pos.count_documents({}) == 1)
+    assert pos.find_one({"orderId": order_id})["paymentId"] == paid.payment_id
+    print("feedback, decline and POS log written by the flusher:", declined.status, "->", paid.status)
+
+    print("\n---- FLUSH BY SIZE / BY TIME ----")
+    before = write_behind.write_behind_stats()["flushes"]
+    for i in range(write_behind.FLUSH_SIZE * 4):
+        write_behind.enqueue("feedback", {"orderId": f"ORD-{i}", "rating": 4})
+    wait_for(lambda: feedback.count_documents({}) == 1 + write_behind.FLUSH_SIZE * 4)
+    stats = write_behind.write_behind_stats()
+    assert stats["flushes"] - before <= 4, stats
+    write_behind.enqueue("feedback", {"orderId": "ORD-LATE", "rating": 3})
+    t0 = time.perf_counter()
+    wait_for(lambda: feedback.find_one({"orderId": "ORD-LATE"}))
+    print(f"{write_behind.FLUSH_SIZE * 4} records in {stats['flushes'] - before} flushes; "
+          f"a lone record after {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+    print("\n---- MONGO DOWN: SPILL, THEN REPLAY ----")
+    from pymongo.errors import AutoReconnect
+
+    real_insert_many = env.collection_class.insert_many
+    down = True
+
+    def flaky_insert_many(self, docs, ordered=True, **kwargs):
+        if down:
+            raise AutoReconnect("connection refused")
+        return real_insert_many(self, docs, ordered, **kwargs)
+
+    env.collection_class.insert_many = flaky_insert_many
+    try:
+        count = feedback.count_documents({})
+        for i in range(20):
+            write_behind.enqueue("feedback", {"orderId": f"ORD-DOWN-{i}", "rating": 2})
+        wait_for(lambda: write_behind.write_behind_stats()["spilled"] == 20)
+        assert feedback.count_documents({}) == count
+        assert write_behind.write_behind_stats()["spill_file_bytes"] > 0
+        down = False
+        write_behind.enqueue("feedback", {"orderId": "ORD-BACK", "rating": 5})
+        wait_for(lambda: not os.path.exists(write_behind.SPILL_PATH))
+        assert feedback.count_documents({}) == count + 21
+    finally:
+        env.collection_class.insert_many = real_insert_many
+
+    # a spill that was partly written before a crash is replayed without duplicates
+    doc = {"orderId": "ORD-TWICE", "rating": 1}
+    write_behind.enqueue("feedback", doc)
+    write_behind.flush()
+    write_behind._spill({"feedback": [doc]})
+    write_behind.enqueue("feedback", {"orderId": "ORD-AFTER", "rating": 1})
+    write_behind.flush()
+    assert feedback.count_documents({"orderId": "ORD-TWICE"}) == 1
+    stats = write_behind.write_behind_stats()
+    assert stats["replayed"] == 21 and stats["duplicates"] == 1, stats
+    print("spilled", stats["spilled"], "replayed", stats["replayed"], "duplicates skipped", stats["duplicates"])
+
+    print("\n---- FLUSHER SURVIVES A FAILED SPILL ----")
+    real_spill = write_behind._spill
+
+    def full_disk(batches):
+        raise OSError(28, "No space left on device")
+
+    write_behind._spill = full_disk
+    env.collection_class.insert_many = flaky_insert_many
+    down = True
+    try:
+        write_behind.enqueue("feedback", {"orderId": "ORD-LOST", "rating": 1})
+        wait_for(lambda: write_behind.write_behind_stats()["loop_errors"] == 1)
+    finally:
+        write_behind._spill = real_spill
+        env.collection_class.insert_many = real_insert_many
+    write_behind.enqueue("feedback", {"orderId": "ORD-LIVE", "rating": 5})
+    wait_for(lambda: feedback.find_one({"orderId": "ORD-LIVE"}))
+    print("flusher error logged, next record still written")
+
+    print("\n---- DRAIN ----")
+    write_behind.FLUSH_INTERVAL = 60
+    write_behind.FLUSH_SIZE = 10_000
+    for i in range(100):
+        write_behind.enqueue("feedback", {"orderId": f"ORD-EXIT-{i}", "rating": 5})
+    assert write_behind.write_behind_stats()["depth"] == 100
+    write_behind.drain()
+    assert feedback.count_documents({"orderId": {"$regex": "^ORD-EXIT-"}}) == 100
+    stats = write_behind.write_behind_stats()
+    assert stats["depth"] == 0
+    print("flush_ms p50/p99:", stats["flush_ms"]["p50"], stats["flush_ms"]["p99"],
+          "| batch p50:", stats["batch_size"]["p50"])
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
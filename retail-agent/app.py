@@ -2,6 +2,7 @@ import streamlit as st
 import pandas as pd
 import requests
 import uuid
+import json
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
 import tempfile
@@ -10,6 +11,23 @@ import tempfile
 # Configuration
 # -------------------------------------------------
 BACKEND_URL = "http://localhost:8000/chat"
+STREAM_URL = BACKEND_URL + "/stream"  # server-sent events
+
+
+def iter_sse(response):
+    """(event, data) pairs from a text/event-stream response."""
+    event, data = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].strip())
 
 st.set_page_config(page_title="Retail Omnichannel Agentic AI", layout="wide")
 
@@ -108,43 +126,64 @@ if user_input := st.chat_input("Talk to the Sales Assistant..."):
     # Initialize variable to prevent "Unbound" error
     bot_reply = None
 
-    # 2. Call Backend API
+    # 2. Call Backend API (streamed: the reply renders as it arrives)
     try:
-        with st.spinner("🤖 Aura is thinking..."):
-            payload = {
-                "message": user_input,
-                "session_id": st.session_state.session_id
-            }
-            
-            response = requests.post(BACKEND_URL, json=payload)
-            
-            if response.status_code == 200:
-                data = response.json()
-                bot_reply = data.get("reply", "⚠️ No response.")
-                
-                # --- UPDATE STATE ---
-                # Save the reply to history immediately
-                st.session_state.messages.append({"role": "assistant", "content": bot_reply})
-                
-                # Update "Brain" Data for the Sidebar
-                if data.get("recommendations"):
-                    st.session_state.agent_data["recommendations"] = pd.DataFrame(data["recommendations"])
-                
-                if data.get("inventory"):
-                    st.session_state.agent_data["inventory"] = pd.DataFrame(data["inventory"])
-
-                if data.get("loyalty"):
-                    st.session_state.agent_data["loyalty"] = data.get("loyalty")
-
-                if data.get("payment"):
-                    st.session_state.agent_data["payment"] = data.get("payment")
-
-                # Force reload so Sidebar updates instantly
-                st.rerun()
-                
-            else:
-                # Assign error to bot_reply so we can print it below
-                bot_reply = f"❌ Server Error: {response.status_code}"
+        payload = {
+            "message": user_input,
+            "session_id": st.session_state.session_id
+        }
+
+        with st.chat_message("assistant"):
+            placeholder = st.empty()
+            placeholder.markdown("🤖 Aura is thinking...")
+
+            with requests.post(STREAM_URL, json=payload, stream=True, timeout=(5, 300)) as response:
+                if response.status_code == 200:
+                    text, data = "", None
+                    for event, body in iter_sse(response):
+                        if event == "status" and not text:
+                            placeholder.markdown(f"🤖 _{body['message']}_")
+                        elif event == "token":
+                            text += body["text"]
+                            placeholder.markdown(text + "▌")
+                        elif event == "done":
+                            data = body
+                        elif event == "error":
+                            bot_reply = f"❌ Server Error: {body.get('detail')}"
+
+                    if data is not None:
+                        placeholder.markdown(data.get("reply") or "⚠️ No response.")
+
+                        # --- UPDATE STATE ---
+                        # Save the reply to history immediately
+                        st.session_state.messages.append(
+                            {"role": "assistant", "content": data.get("reply", "⚠️ No response.")}
+                        )
+
+                        # Update "Brain" Data for the Sidebar
+                        if data.get("recommendations"):
+                            st.session_state.agent_data["recommendations"] = pd.DataFrame(data["recommendations"])
+
+                        if data.get("inventory"):
+                            st.session_state.agent_data["inventory"] = pd.DataFrame(data["inventory"])
+
+                        if data.get("loyalty"):
+                            st.session_state.agent_data["loyalty"] = data.get("loyalty")
+
+                        if data.get("payment"):
+                            st.session_state.agent_data["payment"] = data.get("payment")
+
+                        # Force reload so Sidebar updates instantly
+                        st.rerun()
+
+                    placeholder.empty()
+                    if not bot_reply:
+                        bot_reply = "⚠️ No response."
+
+                else:
+                    # Assign error to bot_reply so we can print it below
+                    placeholder.empty()
+                    bot_reply = f"❌ Server Error: {response.status_code}"
 
     except Exception as e:
         # Assign error to bot_reply so we can print it below
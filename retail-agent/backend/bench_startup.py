@@ -0,0 +1,79 @@
+"""
+STARTUP BENCHMARK
+-----------------
+Measures how long a fresh backend worker takes from `import main` to its
+first HTTP responses, the way a uvicorn worker restart would see it.
+
+Each run is a new Python process (so nothing is warm in sys.modules):
+    import main  ->  GET /  ->  POST /chat  ->  GET /ready
+
+Usage:
+    python bench_startup.py            # 5 runs
+    python bench_startup.py --runs 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CHILD = r"""
+import json, time
+t0 = time.perf_counter()
+import main
+t_import = time.perf_counter()
+
+from fastapi.testclient import TestClient
+client = TestClient(main.app)
+
+client.get("/")
+t_root = time.perf_counter()
+
+client.post("/chat", json={"message": "hello", "session_id": "bench-startup"})
+t_chat = time.perf_counter()
+
+ready = client.get("/ready").status_code
+t_ready = time.perf_counter()
+
+print("__BENCH__" + json.dumps({
+    "import_ms": (t_import - t0) * 1000,
+    "first_root_ms": (t_root - t0) * 1000,
+    "first_chat_ms": (t_chat - t0) * 1000,
+    "ready_probe_ms": (t_ready - t_chat) * 1000,
+    "ready_status": ready,
+}))
+"""
+
+
+def run_once() -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD],
+        cwd=HERE, capture_output=True, text=True, timeout=120
+    )
+    for line in out.stdout.splitlines():
+        if line.startswith("__BENCH__"):
+            return json.loads(line[len("__BENCH__"):])
+    raise RuntimeError(f"benchmark child failed:\n{out.stdout}\n{out.stderr}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+
+    print(f"\nBackend cold start ({args.runs} fresh processes)\n")
+    for key in ("import_ms", "first_root_ms", "first_chat_ms", "ready_probe_ms"):
+        values = [r[key] for r in runs]
+        print(f"  {key:<16} median {statistics.median(values):8.1f} ms   "
+              f"min {min(values):8.1f}   max {max(values):8.1f}")
+    print(f"  /ready status    {runs[-1]['ready_status']}")
+
+
+if __name__ == "__main__":
+    main()
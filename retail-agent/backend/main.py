@@ -1,8 +1,14 @@
 import sys
 import os
+import re
+import json
+import asyncio
+from contextlib import asynccontextmanager
+from dataclasses import asdict
 import uvicorn
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
 from fastapi.middleware.cors import CORSMiddleware
 
 # ------------------------------------------------------------------
@@ -24,11 +30,43 @@ sys.path.append(agent_dir)  # Allows: from recommendation_agent import...
 # ------------------------------------------------------------------
 # IMPORTS
 # ------------------------------------------------------------------
-# Now these imports will work perfectly
-from ai_engine.sales_agent.sales_agent import sales_agent_chat
-from ai_engine.sales_agent.cache import get_session, save_session
+# Import the agent modules by their flat names (the same names the agents
+# use among themselves) so each module, and its Redis/Mongo client, is
+# loaded once. None of these do network I/O at import time.
+#
+# Only the chat router, sessions and the database handles load here.
+# The worker agents load on first use (sales_agent.AGENTS) or on /ready,
+# and each endpoint below imports the modules it serves, so a fresh
+# worker does not pull in numpy and every agent before it can answer.
+from sales_agent import sales_agent_chat_async, sales_agent_chat_stream, load_agents
+from cache import get_session_async, save_session_async
+import cache
+import database
+from database import pool_stats
 
-app = FastAPI()
+async def _background_startup():
+    # Index creation waits on MongoDB, so it runs here rather than
+    # holding up boot; /ready reports whether MongoDB is reachable.
+    import reservations
+    import idempotency
+
+    await reservations.ensure_indexes_async()
+    await idempotency.ensure_indexes_async()
+    # Puts stock from unpaid, expired order holds back on sale.
+    await reservations.sweep_forever_async()
+
+@asynccontextmanager
+async def lifespan(app):
+    task = asyncio.create_task(_background_startup())
+    yield
+    task.cancel()
+    # Writes the queued feedback / payment audit records before exiting
+    # (only if something in this worker used the write-behind queue).
+    write_behind = sys.modules.get("write_behind")
+    if write_behind is not None:
+        write_behind.drain()
+
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS (Allows React/Streamlit to talk to this API)
 app.add_middleware(
@@ -42,38 +80,243 @@ class ChatRequest(BaseModel):
     message: str
     session_id: str
 
+class ReturnItem(BaseModel):
+    productId: str
+    qty: int | None = None  # default: everything not yet returned
+
+class ReturnRequest(BaseModel):
+    orderId: str
+    items: list[ReturnItem] | None = None  # default: the whole order
+    reason: str | None = None
+
+class BulkReturnRequest(BaseModel):
+    returns: list[ReturnRequest]
+    reason: str | None = None  # for requests without their own
+
+class CartItem(BaseModel):
+    productId: str | None = None
+    product_name: str | None = None  # used when productId is not given
+    quantity: int = Field(1, gt=0)
+    coupon_code: str | None = None  # overrides the cart's coupon for this line
+
+class CartQuoteRequest(BaseModel):
+    customer_id: str = "CUST_GUEST"
+    items: list[CartItem]
+    coupon_code: str | None = None
+    use_points: bool = False
+
+class SimulationRequest(BaseModel):
+    promotions: list[dict]  # candidate promotion documents (promotions collection fields)
+    points: float | None = Field(None, ge=0)  # loyalty points per purchase; None = no points
+    coverage: float | None = Field(None, ge=0, le=1)  # None = the loyalty agent's MAX_POINT_COVERAGE
+    category: str | None = None  # limit the simulation to one category (and its descendants)
+
 @app.get("/")
 def health_check():
+    """Liveness: the process is up. Does not touch Redis or MongoDB."""
     return {"status": "active", "service": "Omnichannel Sales Agent"}
 
+@app.get("/ready")
+def readiness_check():
+    """
+    Readiness: loads the worker agents and checks MongoDB and Redis.
+    Point the load balancer / orchestrator probe here, not at '/'.
+    """
+    load_agents()
+    checks = {
+        "mongo": database.ping(),
+        "redis": cache.ping(),
+    }
+    ready = checks["mongo"]  # Redis is optional: sessions degrade to stateless
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"ready": ready, "checks": checks}
+    )
+
+@app.get("/metrics/db")
+def db_metrics():
+    """MongoDB connection pool utilization for this worker (sync and async clients)."""
+    return pool_stats()
+
+@app.get("/metrics/reservations")
+def reservation_metrics():
+    """Stock holds placed, rejected (no stock), committed and released by this worker."""
+    import reservations
+    return reservations.reservation_stats()
+
+@app.get("/metrics/idempotency")
+def idempotency_metrics():
+    """Payment idempotency keys claimed, replayed to duplicates, taken over and abandoned."""
+    import idempotency
+    return idempotency.idempotency_stats()
+
+@app.get("/metrics/write_behind")
+def write_behind_metrics():
+    """Queue depth, flush latency / batch sizes and spill-file usage of the audit write-behind."""
+    import write_behind
+    return write_behind.write_behind_stats()
+
+@app.get("/metrics/cache")
+def cache_metrics():
+    """Hit/miss counters of the in-process result caches."""
+    from recommendation_agent import recommendation_cache_stats
+    import repricing_simulator
+
+    return {
+        "recommendations": recommendation_cache_stats(),
+        "products": cache.product_cache_stats(),
+        "local_sessions": cache.local_sessions.stats(),
+        "llm": cache.llm_cache_stats(),
+        "repricing_catalogs": repricing_simulator.catalog_cache_stats(),
+    }
+
+def _chat_payload(session_id, bot_reply, updated_session):
+    """Everything the UI needs after a turn."""
+    return {
+        "reply": bot_reply,
+        "session_id": session_id,
+        "stage": updated_session.get("stage"),
+
+        # 🚀 DATA FOR TABS
+        # (loyalty / payment / fulfillment: panel() of the agents' typed results)
+        "recommendations": updated_session.get("recommendations", []),
+        "inventory": updated_session.get("inventory", []),  # List of dicts
+        "loyalty": updated_session.get("loyalty", None),    # Dict
+        "payment": updated_session.get("payment", None),    # Dict
+        "fulfillment": updated_session.get("fulfillment", None) # Dict
+    }
+
 @app.post("/chat")
-def chat_endpoint(request: ChatRequest):
+async def chat_endpoint(request: ChatRequest):
+    # Runs on the event loop end to end (redis.asyncio, async Mongo
+    # driver), so concurrency is not capped by the threadpool size.
     try:
         # 1. Load Context from Redis
-        session_data = get_session(request.session_id)
+        session_data = await get_session_async(request.session_id)
         
         # 2. Run the Logic
-        bot_reply, updated_session = sales_agent_chat(request.message, session_data)
+        bot_reply, updated_session = await sales_agent_chat_async(request.message, session_data)
         
         # 3. Save Context to Redis
-        save_session(request.session_id, updated_session)
+        await save_session_async(request.session_id, updated_session)
         
         # 4. Return EVERYTHING the UI needs
-        return {
-            "reply": bot_reply,
-            "session_id": request.session_id,
-            "stage": updated_session.get("stage"),
-            
-            # 🚀 DATA FOR TABS
-            "recommendations": updated_session.get("recommendations", []),
-            "inventory": updated_session.get("inventory", []),  # List of dicts
-            "loyalty": updated_session.get("loyalty", None),    # Dict
-            "payment": updated_session.get("payment", None),    # Dict
-            "fulfillment": updated_session.get("fulfillment", None) # Dict
-        }
+        return _chat_payload(request.session_id, bot_reply, updated_session)
 
     except Exception as e:
         print(f"ERROR: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/returns/bulk")
+async def bulk_returns_endpoint(request: BulkReturnRequest):
+    """
+    Warehouse batch returns: restocks with grouped bulk writes and
+    reports problems per order / item in `errors`.
+    """
+    from post_purchase_agent import process_returns_async
+
+    requests = [r.model_dump(exclude_none=True) for r in request.returns]
+    report = await process_returns_async(requests, request.reason)
+    return {
+        "batch_id": report.batch_id,
+        "returned": report.returned,
+        "units_restocked": report.units_restocked,
+        "errors": report.errors,
+    }
+
+@app.post("/promotions/reload")
+def reload_promotions():
+    """Recompiles this worker's promotion index now (it also reloads on its own every minute)."""
+    import promotion_index
+
+    promotion_index.reload()
+    return promotion_index.promotion_index_stats()
+
+@app.post("/promotions/simulate")
+def simulate_promotions(request: SimulationRequest):
+    """
+    Merchandising what-if: final-price and savings distributions over the
+    catalog if the candidate promotions went live. Runs in the threadpool.
+    """
+    import repricing_simulator
+
+    coverage = repricing_simulator.MAX_POINT_COVERAGE if request.coverage is None else request.coverage
+    catalog = repricing_simulator.cached_catalog(request.category)
+    try:
+        result = repricing_simulator.simulate(catalog, request.promotions, request.points, coverage)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return result.summary()
+
+@app.post("/cart/quote")
+async def cart_quote_endpoint(request: CartQuoteRequest):
+    """Prices the whole cart: per-line and total breakdowns, coupons and points applied across the cart."""
+    from loyalty_agent import quote_cart_async
+
+    items = [item.model_dump(exclude_none=True) for item in request.items]
+    quote = await quote_cart_async(items, request.customer_id, request.coupon_code, request.use_points)
+    return asdict(quote)
+
+# ------------------------------------------------------------------
+# STREAMING CHAT (server-sent events)
+#
+#   event: status  {"agent": ..., "message": ...}  as each agent starts
+#   event: token   {"text": ...}                   reply, word by word
+#   event: done    same body as POST /chat         panel data
+#   event: error   {"detail": ...}
+#
+# The status events are live. The token events are a word-chunked
+# replay of the finished reply: the chat flow builds its replies from
+# templates (no LLM call), so there is no model output to stream.
+# ------------------------------------------------------------------
+
+AGENT_STATUS = {
+    "recommend": "Finding products for you...",
+    "inventory": "Checking stock...",
+    "inventory_many": "Checking stock...",
+    "order": "Placing your order...",
+    "payment": "Processing payment...",
+    "price": "Applying offers and points...",
+    "post_purchase": "Looking up your order...",
+}
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """
+    The /chat turn as server-sent events: live agent status, then the
+    completed reply replayed in word chunks, then the panel data.
+    """
+    async def events():
+        try:
+            session_data = await get_session_async(request.session_id)
+
+            async for kind, value in sales_agent_chat_stream(request.message, session_data):
+                if kind == "agent":
+                    yield _sse("status", {"agent": value, "message": AGENT_STATUS.get(value, "Working...")})
+                    continue
+                bot_reply, updated_session = value
+
+            # Save before streaming, so a client that disconnects mid-reply
+            # does not lose the turn (an order may already be placed).
+            await save_session_async(request.session_id, updated_session)
+
+            for chunk in re.findall(r"\s*\S+", bot_reply):
+                yield _sse("token", {"text": chunk})
+
+            yield _sse("done", _chat_payload(request.session_id, bot_reply, updated_session))
+
+        except Exception as e:
+            print(f"ERROR: {e}")
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file